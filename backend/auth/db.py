@@ -0,0 +1,171 @@
+'''
+Business: Пул соединений с PostgreSQL, который переживает тёплые вызовы функции
+Args: DATABASE_URL и необязательные DB_POOL_MAX_SIZE, DB_POOL_IDLE_TIMEOUT, DB_POOL_PING_INTERVAL
+Returns: get_connection() / release_connection() вместо psycopg2.connect() / conn.close()
+'''
+
+import os
+import threading
+import time
+import weakref
+from typing import Any, Dict, List, Optional, Tuple
+
+import psycopg2
+import psycopg2.extensions
+
+import sqltrace
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    def __init__(self, dsn: str, max_size: int = 4, idle_timeout: float = 300.0,
+                 ping_interval: float = 30.0, wait_timeout: float = 10.0, **connect_kwargs: Any):
+        self.dsn = dsn
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.ping_interval = ping_interval
+        self.wait_timeout = wait_timeout
+        self.connect_kwargs = connect_kwargs
+        self._idle: List[Tuple[Any, float]] = []
+        # Checked-out connections are held weakly: if a handler raises before
+        # releasing, the connection is collected with its frame and its slot frees up.
+        self._in_use: 'weakref.WeakSet[Any]' = weakref.WeakSet()
+        # Slots reserved under the lock by callers that are connecting outside it
+        self._pending = 0
+        self._cond = threading.Condition()
+        self.stats: Dict[str, int] = {'connects': 0, 'reuses': 0, 'evictions': 0, 'broken': 0}
+
+    def size(self) -> int:
+        return len(self._idle) + len(self._in_use) + self._pending
+
+    def _evict_idle(self, now: float) -> None:
+        fresh = []
+        for conn, released_at in self._idle:
+            if conn.closed or now - released_at > self.idle_timeout:
+                self.stats['evictions'] += 1
+                _close_quietly(conn)
+            else:
+                fresh.append((conn, released_at))
+        self._idle = fresh
+
+    def _is_healthy(self, conn: Any, released_at: float, now: float) -> bool:
+        if conn.closed:
+            return False
+        if now - released_at < self.ping_interval:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            return False
+
+    def getconn(self) -> Any:
+        deadline = time.monotonic() + self.wait_timeout
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self._evict_idle(now)
+                while self._idle:
+                    conn, released_at = self._idle.pop()
+                    if self._is_healthy(conn, released_at, now):
+                        self.stats['reuses'] += 1
+                        self._in_use.add(conn)
+                        return conn
+                    self.stats['broken'] += 1
+                    _close_quietly(conn)
+                if self.size() < self.max_size:
+                    self._pending += 1
+                    break
+                remaining = deadline - now
+                if remaining <= 0:
+                    raise PoolTimeout('No free database connection after %.1fs' % self.wait_timeout)
+                self._cond.wait(min(remaining, 0.5))
+        try:
+            conn = psycopg2.connect(self.dsn, **self.connect_kwargs)
+        except BaseException:
+            with self._cond:
+                self._pending -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._pending -= 1
+            self.stats['connects'] += 1
+            self._in_use.add(conn)
+        return conn
+
+    def putconn(self, conn: Any, close: bool = False) -> None:
+        with self._cond:
+            self._in_use.discard(conn)
+            if not close and not conn.closed:
+                status = conn.info.transaction_status
+                if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                    close = True
+                elif status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    try:
+                        conn.rollback()
+                    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                        close = True
+            if close or conn.closed:
+                _close_quietly(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def closeall(self) -> None:
+        with self._cond:
+            for conn, _ in self._idle:
+                _close_quietly(conn)
+            self._idle = []
+
+
+def _close_quietly(conn: Any) -> None:
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool(**connect_kwargs: Any) -> ConnectionPool:
+    '''
+    The process has one pool, created by the first call with its connect arguments. Later calls may
+    repeat those arguments or pass none; different ones raise ValueError instead of being ignored.
+    '''
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                pool_kwargs = dict(connect_kwargs)
+                if sqltrace.ACTIVE:
+                    pool_kwargs.setdefault('connection_factory', sqltrace.connection_factory())
+                _pool = ConnectionPool(
+                    os.environ.get('DATABASE_URL'),
+                    max_size=int(os.environ.get('DB_POOL_MAX_SIZE', 4)),
+                    idle_timeout=float(os.environ.get('DB_POOL_IDLE_TIMEOUT', 300)),
+                    ping_interval=float(os.environ.get('DB_POOL_PING_INTERVAL', 30)),
+                    **pool_kwargs
+                )
+                return _pool
+    for key, value in connect_kwargs.items():
+        if key not in _pool.connect_kwargs or _pool.connect_kwargs[key] != value:
+            raise ValueError(f'Connection pool already created without {key}={value!r}')
+    return _pool
+
+
+def get_connection(**connect_kwargs: Any) -> Any:
+    if sqltrace.ENABLED:
+        return sqltrace.timed_connect(lambda: get_pool(**connect_kwargs).getconn())
+    return get_pool(**connect_kwargs).getconn()
+
+
+def release_connection(conn: Any) -> None:
+    '''Rolls back whatever the caller left open and returns conn to the pool; call it from a finally block'''
+    get_pool().putconn(conn)
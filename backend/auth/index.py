@@ -1,13 +1,19 @@
 import json
 import os
-import psycopg2
-import hmac
-import hashlib
-import bcrypt
-import jwt
 from datetime import datetime, timedelta
-from typing import Dict, Any
+from typing import Dict, Any, Tuple
 
+from sqltrace import dumps, traced_request
+
+# passwords (bcrypt), jwt and db (psycopg2) are imported by the branches that use them: a cold
+# start that only verifies a token never loads bcrypt or psycopg2 and never connects
+
+def connect() -> Tuple[Any, Any]:
+    from db import get_connection
+    conn = get_connection()
+    return conn, conn.cursor()
+
+@traced_request
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """
     Business: User authentication - email/password login and user management
@@ -29,11 +35,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    dsn = os.environ.get('DATABASE_URL')
     jwt_secret = os.environ.get('JWT_SECRET', 'default-secret-change-in-production')
     
-    conn = psycopg2.connect(dsn)
-    cur = conn.cursor()
+    conn = cur = None
     
     try:
         if method == 'POST':
@@ -41,9 +45,13 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             action = body.get('action')
             
             if action == 'login':
+                import jwt
+                from passwords import check_password, hash_password, needs_rehash
+                
                 email = body.get('email')
                 password = body.get('password')
                 
+                conn, cur = connect()
                 cur.execute("""
                     SELECT id, email, password_hash, full_name, is_admin, is_active 
                     FROM users WHERE email = %s
@@ -68,7 +76,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         'isBase64Encoded': False
                     }
                 
-                if not bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8')):
+                if not check_password(password, password_hash):
                     return {
                         'statusCode': 401,
                         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -76,7 +84,12 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         'isBase64Encoded': False
                     }
                 
-                cur.execute("UPDATE users SET last_login = %s WHERE id = %s", (datetime.now(), user_id))
+                # The password is at hand only now: move hashes made at a lower cost up to the pinned one
+                if needs_rehash(password_hash):
+                    cur.execute("UPDATE users SET last_login = %s, password_hash = %s WHERE id = %s",
+                                (datetime.now(), hash_password(password), user_id))
+                else:
+                    cur.execute("UPDATE users SET last_login = %s WHERE id = %s", (datetime.now(), user_id))
                 conn.commit()
                 
                 token = jwt.encode({
@@ -102,6 +115,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 }
             
             elif action == 'verify':
+                import jwt
+                
                 token = body.get('token')
                 try:
                     payload = jwt.decode(token, jwt_secret, algorithms=['HS256'])
@@ -141,6 +156,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         'isBase64Encoded': False
                     }
                 
+                import jwt
+                
                 try:
                     payload = jwt.decode(auth_token, jwt_secret, algorithms=['HS256'])
                     
@@ -152,6 +169,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                             'isBase64Encoded': False
                         }
                     
+                    conn, cur = connect()
                     cur.execute("""
                         SELECT id, email, full_name, is_admin, is_active, created_at, last_login 
                         FROM users ORDER BY created_at DESC
@@ -171,7 +189,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     return {
                         'statusCode': 200,
                         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'users': users_list}),
+                        'body': dumps({'users': users_list}),
                         'isBase64Encoded': False
                     }
                 except jwt.InvalidTokenError:
@@ -200,6 +218,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'isBase64Encoded': False
                 }
             
+            import jwt
+            
             try:
                 payload = jwt.decode(auth_token, jwt_secret, algorithms=['HS256'])
                 
@@ -220,8 +240,10 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     full_name = body.get('full_name')
                     is_admin = body.get('is_admin', False)
                     
-                    password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+                    from passwords import hash_password
+                    password_hash = hash_password(password)
                     
+                    conn, cur = connect()
                     cur.execute("""
                         INSERT INTO users (email, password_hash, full_name, is_admin) 
                         VALUES (%s, %s, %s, %s) RETURNING id
@@ -245,10 +267,12 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     if 'is_admin' in body:
                         updates['is_admin'] = body['is_admin']
                     if 'password' in body and body['password']:
-                        updates['password_hash'] = bcrypt.hashpw(body['password'].encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+                        from passwords import hash_password
+                        updates['password_hash'] = hash_password(body['password'])
                     
                     if updates:
                         set_clause = ', '.join([f"{k} = %s" for k in updates.keys()])
+                        conn, cur = connect()
                         cur.execute(f"UPDATE users SET {set_clause} WHERE id = %s", 
                                   list(updates.values()) + [user_id])
                         conn.commit()
@@ -276,5 +300,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
     
     finally:
-        cur.close()
-        conn.close()
\ No newline at end of file
+        if conn is not None:
+            from db import release_connection
+            cur.close()
+            release_connection(conn)
\ No newline at end of file
@@ -0,0 +1,102 @@
+'''
+Business: Хеширование паролей bcrypt со стоимостью, подобранной под бюджет задержки на текущем железе
+Args: BCRYPT_BUDGET_MS, BCRYPT_MIN_COST, BCRYPT_MAX_COST; BCRYPT_COST фиксирует стоимость без калибровки, иначе первая калибровка хранится в app_settings
+Returns: hash_password(), check_password(), needs_rehash() для входа и управления пользователями
+'''
+
+import os
+import threading
+import time
+from typing import Optional
+
+import bcrypt
+
+BUDGET_MS = float(os.environ.get('BCRYPT_BUDGET_MS', 250))
+MIN_COST = int(os.environ.get('BCRYPT_MIN_COST', 10))
+MAX_COST = int(os.environ.get('BCRYPT_MAX_COST', 14))
+FIXED_COST = int(os.environ['BCRYPT_COST']) if os.environ.get('BCRYPT_COST') else None
+
+# Cheap enough to time on every cold start; each extra round doubles the work
+REFERENCE_COST = 6
+REFERENCE_SAMPLES = 3
+
+_cost: Optional[int] = None
+_cost_lock = threading.Lock()
+
+
+def calibrate_cost(budget_ms: float = BUDGET_MS, min_cost: int = MIN_COST, max_cost: int = MAX_COST) -> int:
+    '''
+    Highest cost whose hash is expected to fit in budget_ms on this host, within [min_cost, max_cost].
+    Times a few hashes at a low reference cost and extrapolates, since bcrypt work is 2 ** cost.
+    '''
+    salt = bcrypt.gensalt(rounds=REFERENCE_COST)
+    timings = []
+    for _ in range(REFERENCE_SAMPLES):
+        started = time.perf_counter()
+        bcrypt.hashpw(b'calibration', salt)
+        timings.append((time.perf_counter() - started) * 1000)
+    reference_ms = min(timings)
+
+    cost = min_cost
+    while cost < max_cost and reference_ms * 2 ** (cost + 1 - REFERENCE_COST) <= budget_ms:
+        cost += 1
+    return cost
+
+
+def pinned_cost() -> int:
+    '''
+    Cost shared by every instance. Timings differ between instances and between cold starts, so
+    only the first calibration counts: it is stored in app_settings and later instances read it.
+    '''
+    from db import get_connection, release_connection
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT value FROM app_settings WHERE key = 'bcrypt_cost'")
+        row = cur.fetchone()
+        if row is None:
+            cur.execute(
+                "INSERT INTO app_settings (key, value) VALUES ('bcrypt_cost', %s) ON CONFLICT (key) DO NOTHING",
+                (str(calibrate_cost()),)
+            )
+            # Instances calibrating at the same time: the first insert wins for all of them
+            cur.execute("SELECT value FROM app_settings WHERE key = 'bcrypt_cost'")
+            row = cur.fetchone()
+        conn.commit()
+        cur.close()
+        return int(row[0])
+    finally:
+        release_connection(conn)
+
+
+def bcrypt_cost() -> int:
+    global _cost
+    if FIXED_COST is not None:
+        return FIXED_COST
+    if _cost is None:
+        with _cost_lock:
+            if _cost is None:
+                _cost = pinned_cost()
+    return _cost
+
+
+def hash_password(password: str) -> str:
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=bcrypt_cost())).decode('utf-8')
+
+
+def check_password(password: str, password_hash: str) -> bool:
+    return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+
+
+def hash_cost(password_hash: str) -> Optional[int]:
+    # $2b$12$<salt and hash>
+    try:
+        return int(password_hash.split('$')[2])
+    except (IndexError, ValueError):
+        return None
+
+
+def needs_rehash(password_hash: str) -> bool:
+    # Upward only: a lower configured cost never weakens hashes that are already stronger
+    cost = hash_cost(password_hash)
+    return cost is None or cost < bcrypt_cost()
@@ -0,0 +1,123 @@
+'''
+Business: Группы клиентов, связанных через client_connections: система непересекающихся множеств
+Args: курсор RealDictCursor функции clients, id клиентов новой связи
+Returns: rebuild_groups() - полный пересчёт client_groups, link_clients() - объединение групп при новой связи
+'''
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from psycopg2.extras import execute_values
+
+# Объединение групп берёт эксклюзивную блокировку, изменение выручки клиента (триггер на client_stats) - общую
+LOCK_KEY_SQL = "hashtext('client_groups')"
+
+
+class UnionFind:
+    def __init__(self):
+        self.parent: Dict[int, int] = {}
+        self.size: Dict[int, int] = {}
+
+    def find(self, x: int) -> int:
+        if x not in self.parent:
+            self.parent[x] = x
+            self.size[x] = 1
+            return x
+        # Path halving: every visited node skips to its grandparent
+        while self.parent[x] != x:
+            self.parent[x] = self.parent[self.parent[x]]
+            x = self.parent[x]
+        return x
+
+    def union(self, a: int, b: int) -> int:
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a == root_b:
+            return root_a
+        if self.size[root_a] < self.size[root_b]:
+            root_a, root_b = root_b, root_a
+        self.parent[root_b] = root_a
+        self.size[root_a] += self.size[root_b]
+        return root_a
+
+    def components(self) -> Dict[int, List[int]]:
+        groups: Dict[int, List[int]] = {}
+        for x in self.parent:
+            groups.setdefault(self.find(x), []).append(x)
+        return groups
+
+
+def client_revenues(cur, client_ids: Optional[Iterable[int]] = None) -> Dict[int, float]:
+    cur.execute(f'''
+        SELECT c.id, SUM(s.total_revenue) as revenue
+        FROM t_p6388661_digital_goods_accoun.clients c
+        JOIN t_p6388661_digital_goods_accoun.client_stats s ON s.client_telegram = c.client_telegram
+        {'WHERE c.id = ANY(%(ids)s)' if client_ids is not None else ''}
+        GROUP BY c.id
+    ''', {'ids': list(client_ids) if client_ids is not None else None})
+    return {row['id']: row['revenue'] for row in cur.fetchall()}
+
+
+def rebuild_groups(cur) -> int:
+    cur.execute(f'SELECT pg_advisory_xact_lock({LOCK_KEY_SQL})')
+    cur.execute('SELECT client_id_from, client_id_to FROM t_p6388661_digital_goods_accoun.client_connections')
+    forest = UnionFind()
+    for row in cur.fetchall():
+        forest.union(row['client_id_from'], row['client_id_to'])
+
+    revenues = client_revenues(cur)
+    rows: List[Tuple[int, int, Optional[int], Optional[float]]] = []
+    for members in forest.components().values():
+        # The smallest id names the group, so a rebuild gives the same ids every time
+        group_id = min(members)
+        revenue = sum(revenues.get(member, 0) for member in members)
+        for member in members:
+            if member == group_id:
+                rows.append((member, group_id, len(members), revenue))
+            else:
+                rows.append((member, group_id, None, None))
+
+    cur.execute('DELETE FROM t_p6388661_digital_goods_accoun.client_groups')
+    execute_values(cur, '''
+        INSERT INTO t_p6388661_digital_goods_accoun.client_groups (client_id, group_id, group_size, group_revenue)
+        VALUES %s
+    ''', rows, page_size=1000)
+    return sum(1 for row in rows if row[2] is not None)
+
+
+def link_clients(cur, client_a: int, client_b: int) -> int:
+    '''
+    Joins the groups of two newly connected clients and returns the id of the merged group.
+    The smaller group is relabelled into the larger one: two root lookups and one indexed
+    UPDATE of the smaller group's rows, never a rescan of the connection graph.
+    '''
+    cur.execute(f'SELECT pg_advisory_xact_lock({LOCK_KEY_SQL})')
+
+    # A client without connections so far becomes a group of one
+    revenues = client_revenues(cur, (client_a, client_b))
+    execute_values(cur, '''
+        INSERT INTO t_p6388661_digital_goods_accoun.client_groups (client_id, group_id, group_size, group_revenue)
+        VALUES %s
+        ON CONFLICT (client_id) DO NOTHING
+    ''', [(client_id, client_id, 1, revenues.get(client_id, 0)) for client_id in {client_a, client_b}])
+
+    cur.execute('''
+        SELECT root.client_id, root.group_size, root.group_revenue
+        FROM t_p6388661_digital_goods_accoun.client_groups member
+        JOIN t_p6388661_digital_goods_accoun.client_groups root ON root.client_id = member.group_id
+        WHERE member.client_id = ANY(%s)
+    ''', ([client_a, client_b],))
+    roots = {row['client_id']: row for row in cur.fetchall()}
+    if len(roots) == 1:
+        return next(iter(roots))
+
+    big, small = sorted(roots.values(), key=lambda row: (-row['group_size'], row['client_id']))
+    cur.execute('''
+        UPDATE t_p6388661_digital_goods_accoun.client_groups
+        SET group_id = %s, group_size = NULL, group_revenue = NULL
+        WHERE group_id = %s
+    ''', (big['client_id'], small['client_id']))
+    cur.execute('''
+        UPDATE t_p6388661_digital_goods_accoun.client_groups
+        SET group_size = group_size + %s, group_revenue = group_revenue + %s
+        WHERE client_id = %s
+    ''', (small['group_size'], small['group_revenue'], big['client_id']))
+    return big['client_id']
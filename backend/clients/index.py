@@ -4,16 +4,115 @@ Args: event with httpMethod, body, queryStringParameters; context with request_i
 Returns: HTTP response with client data and analytics
 '''
 
+import base64
+import binascii
 import json
-import os
-from typing import Dict, Any
-import psycopg2
+from decimal import Decimal
+from typing import Dict, Any, List, Optional, Tuple
 from psycopg2.extras import RealDictCursor
 
+from db import get_connection, release_connection
+from groups import link_clients, rebuild_groups
+from sqltrace import dumps, traced_request
+
+MAX_PAGE_SIZE = 500
+DEFAULT_GRAPH_DEPTH = 2
+MAX_GRAPH_DEPTH = 6
+DEFAULT_TOP_GROUPS = 20
+
 def get_db_connection():
-    dsn = os.environ.get('DATABASE_URL')
-    return psycopg2.connect(dsn, cursor_factory=RealDictCursor)
+    return get_connection(cursor_factory=RealDictCursor)
+
+def encode_cursor(total_revenue: str, stats_id: int) -> str:
+    raw = json.dumps([total_revenue, stats_id])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
 
+def decode_cursor(cursor: str) -> Tuple[Decimal, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        total_revenue, stats_id = json.loads(raw)
+        return Decimal(total_revenue), int(stats_id)
+    except (TypeError, ValueError, ArithmeticError, binascii.Error):
+        raise ValueError('Invalid cursor')
+
+def parse_positive_int(value: Optional[str], name: str) -> Optional[int]:
+    if not value:
+        return None
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number <= 0:
+        raise ValueError(f'{name} must be a positive integer')
+    return number
+
+def traverse(cur, start_id: int, max_depth: int, direction: str,
+             connection_type: Optional[str] = None) -> List[Dict[str, Any]]:
+    '''
+    Breadth-first walk over client_connections from start_id, at most max_depth hops.
+    direction: 'out' follows from -> to, 'in' follows to -> from, 'both' ignores direction.
+    Returns one row per reached client with its hop distance and the client it was reached from.
+    '''
+    # UNION (not UNION ALL) drops repeated (id, depth, parent_id) rows, so cycles and
+    # dense graphs cost at most one row per edge and level instead of one per path
+    cur.execute('''
+        WITH RECURSIVE reached(id, depth, parent_id) AS (
+            SELECT %(start_id)s::int, 0, NULL::int
+            UNION
+            SELECT nb.id, r.depth + 1, r.id
+            FROM reached r
+            CROSS JOIN LATERAL (
+                SELECT cc.client_id_to AS id
+                FROM t_p6388661_digital_goods_accoun.client_connections cc
+                WHERE %(outgoing)s AND cc.client_id_from = r.id
+                AND (%(connection_type)s::text IS NULL OR cc.connection_type = %(connection_type)s)
+                UNION ALL
+                SELECT cc.client_id_from
+                FROM t_p6388661_digital_goods_accoun.client_connections cc
+                WHERE %(incoming)s AND cc.client_id_to = r.id
+                AND (%(connection_type)s::text IS NULL OR cc.connection_type = %(connection_type)s)
+            ) nb
+            WHERE r.depth < %(max_depth)s
+        )
+        SELECT DISTINCT ON (id) id, depth, parent_id
+        FROM reached
+        ORDER BY id, depth, parent_id
+    ''', {
+        'start_id': start_id,
+        'max_depth': max_depth,
+        'outgoing': direction in ('out', 'both'),
+        'incoming': direction in ('in', 'both'),
+        'connection_type': connection_type
+    })
+    return cur.fetchall()
+
+def describe_clients(cur, client_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+    cur.execute('''
+        SELECT c.id, c.client_telegram, c.client_name, c.importance,
+               COALESCE(cs.total_revenue, 0)::float as total_revenue,
+               COALESCE(cs.purchase_count, 0)::int as purchase_count
+        FROM t_p6388661_digital_goods_accoun.clients c
+        LEFT JOIN LATERAL (
+            SELECT SUM(s.total_revenue) as total_revenue, SUM(s.purchase_count) as purchase_count
+            FROM t_p6388661_digital_goods_accoun.client_stats s
+            WHERE s.client_telegram = c.client_telegram
+        ) cs ON true
+        WHERE c.id = ANY(%s)
+    ''', (client_ids,))
+    return {row['id']: row for row in cur.fetchall()}
+
+def json_response(status_code: int, payload: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'statusCode': status_code,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*'
+        },
+        'body': dumps(payload, default=str),
+        'isBase64Encoded': False
+    }
+
+@traced_request
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     query_params: Dict[str, str] = event.get('queryStringParameters') or {}
@@ -37,50 +136,177 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         cur = conn.cursor()
         
         if method == 'GET' and action == 'list':
-            query = '''
-                WITH client_stats AS (
-                    SELECT 
-                        t.client_telegram,
-                        t.client_name,
-                        SUM(CASE WHEN t.currency = 'USD' THEN t.amount * 82 ELSE t.amount END) as total_revenue,
-                        COUNT(*) as purchase_count,
-                        SUM(CASE WHEN t.currency = 'USD' THEN t.amount * 82 ELSE t.amount END) / NULLIF(COUNT(*), 0) as avg_check,
-                        MIN(t.transaction_date) as first_purchase,
-                        MAX(t.transaction_date) as last_purchase
-                    FROM t_p6388661_digital_goods_accoun.transactions t
-                    WHERE t.status = 'completed'
-                    GROUP BY t.client_telegram, t.client_name
-                )
+            try:
+                top = parse_positive_int(query_params.get('top'), 'top')
+                page_size = parse_positive_int(query_params.get('page_size') or query_params.get('limit'), 'page_size')
+                page_size = min(page_size, MAX_PAGE_SIZE) if page_size else None
+                cursor = query_params.get('cursor')
+                cursor_revenue, cursor_id = decode_cursor(cursor) if cursor else (None, None)
+            except ValueError as e:
+                return {
+                    'statusCode': 400,
+                    'headers': {
+                        'Content-Type': 'application/json',
+                        'Access-Control-Allow-Origin': '*'
+                    },
+                    'body': json.dumps({'error': str(e)}),
+                    'isBase64Encoded': False
+                }
+            
+            # top=N: the N best clients; page_size: keyset pages; neither: the whole list
+            limit = top or page_size
+            page_condition = 'WHERE (cs.total_revenue, cs.id) < (%(cursor_revenue)s, %(cursor_id)s)' if cursor else ''
+            query = f'''
                 SELECT 
                     COALESCE(c.id, 0) as id,
-                    cs.client_telegram,
-                    cs.client_name,
+                    NULLIF(cs.client_telegram, '') as client_telegram,
+                    NULLIF(cs.client_name, '') as client_name,
                     COALESCE(c.importance, 'medium') as importance,
                     COALESCE(c.comments, '') as comments,
                     cs.total_revenue::float,
                     cs.purchase_count::int,
-                    cs.avg_check::float,
+                    (cs.total_revenue / NULLIF(cs.purchase_count, 0))::float as avg_check,
                     cs.first_purchase::text,
-                    cs.last_purchase::text
-                FROM client_stats cs
+                    cs.last_purchase::text,
+                    cs.id as stats_id,
+                    cs.total_revenue::text as stats_revenue
+                FROM t_p6388661_digital_goods_accoun.client_stats cs
                 LEFT JOIN t_p6388661_digital_goods_accoun.clients c 
                     ON cs.client_telegram = c.client_telegram
-                ORDER BY cs.total_revenue DESC
+                {page_condition}
+                ORDER BY cs.total_revenue DESC, cs.id DESC
+                {'LIMIT %(limit)s' if limit else ''}
             '''
             
-            cur.execute(query)
+            cur.execute(query, {'cursor_revenue': cursor_revenue, 'cursor_id': cursor_id,
+                                'limit': limit + 1 if page_size and not top else limit})
             clients = cur.fetchall()
             
+            next_cursor = None
+            if page_size and not top and len(clients) > page_size:
+                clients = clients[:page_size]
+                next_cursor = encode_cursor(clients[-1]['stats_revenue'], clients[-1]['stats_id'])
+            for client in clients:
+                del client['stats_id'], client['stats_revenue']
+            
+            return {
+                'statusCode': 200,
+                'headers': {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*'
+                },
+                'body': dumps({'clients': clients, 'next_cursor': next_cursor}, default=str),
+                'isBase64Encoded': False
+            }
+        
+        elif method == 'POST' and action == 'rebuild-stats':
+            cur.execute('SELECT t_p6388661_digital_goods_accoun.rebuild_client_stats() as rows')
+            stats_rows = cur.fetchone()['rows']
+            conn.commit()
+            
             return {
                 'statusCode': 200,
                 'headers': {
                     'Content-Type': 'application/json',
                     'Access-Control-Allow-Origin': '*'
                 },
-                'body': json.dumps({'clients': clients}, default=str),
+                'body': json.dumps({'success': True, 'client_stats_rows': stats_rows}),
                 'isBase64Encoded': False
             }
         
+        elif method == 'GET' and action in ('neighborhood', 'chain', 'path'):
+            try:
+                client_id = parse_positive_int(query_params.get('client_id'), 'client_id')
+                if client_id is None:
+                    raise ValueError('client_id is required')
+                depth = min(parse_positive_int(query_params.get('depth'), 'depth') or DEFAULT_GRAPH_DEPTH,
+                            MAX_GRAPH_DEPTH)
+                direction = query_params.get('direction', 'up' if action == 'chain' else 'both')
+                if direction not in ('up', 'down', 'both'):
+                    raise ValueError('direction must be up, down or both')
+                target_id = parse_positive_int(query_params.get('target_id'), 'target_id')
+                if action == 'path' and target_id is None:
+                    raise ValueError('target_id is required')
+            except ValueError as e:
+                return json_response(400, {'error': str(e)})
+            
+            # Referral chains follow who referred whom: 'up' walks to -> from, 'down' from -> to
+            walk = {'up': 'in', 'down': 'out', 'both': 'both'}[direction]
+            connection_type = query_params.get('connection_type') or None
+            reached = traverse(cur, client_id, depth, walk, connection_type)
+            
+            if action == 'path':
+                by_id = {row['id']: row for row in reached}
+                if target_id not in by_id:
+                    return json_response(200, {'path': None, 'length': None})
+                # Every min-depth row points at a parent one hop closer, so the parents form a shortest path
+                path_ids = [target_id]
+                while by_id[path_ids[-1]]['parent_id'] is not None:
+                    path_ids.append(by_id[path_ids[-1]]['parent_id'])
+                path_ids.reverse()
+                clients_by_id = describe_clients(cur, path_ids)
+                path = [dict(clients_by_id.get(node_id, {'id': node_id}), depth=hop)
+                        for hop, node_id in enumerate(path_ids)]
+                return json_response(200, {'path': path, 'length': len(path_ids) - 1})
+            
+            clients_by_id = describe_clients(cur, [row['id'] for row in reached])
+            nodes = [dict(clients_by_id.get(row['id'], {'id': row['id']}), depth=row['depth'], parent_id=row['parent_id'])
+                     for row in sorted(reached, key=lambda row: (row['depth'], row['id']))]
+            
+            cur.execute('''
+                SELECT * FROM t_p6388661_digital_goods_accoun.client_connections
+                WHERE client_id_from = ANY(%(ids)s) AND client_id_to = ANY(%(ids)s)
+                AND (%(connection_type)s::text IS NULL OR connection_type = %(connection_type)s)
+                ORDER BY id
+            ''', {'ids': [row['id'] for row in reached], 'connection_type': connection_type})
+            edges = cur.fetchall()
+            
+            return json_response(200, {
+                'nodes': nodes,
+                'edges': edges,
+                'total_revenue': round(sum(node.get('total_revenue', 0) for node in nodes), 2)
+            })
+        
+        elif method == 'GET' and action == 'groups':
+            try:
+                top = min(parse_positive_int(query_params.get('top'), 'top') or DEFAULT_TOP_GROUPS, MAX_PAGE_SIZE)
+            except ValueError as e:
+                return json_response(400, {'error': str(e)})
+            
+            cur.execute('''
+                SELECT client_id as group_id, group_size, group_revenue::float as total_revenue
+                FROM t_p6388661_digital_goods_accoun.client_groups
+                WHERE client_id = group_id
+                ORDER BY group_revenue DESC, group_id
+                LIMIT %s
+            ''', (top,))
+            groups = cur.fetchall()
+            
+            cur.execute('''
+                SELECT g.group_id, g.client_id
+                FROM t_p6388661_digital_goods_accoun.client_groups g
+                WHERE g.group_id = ANY(%s)
+            ''', ([group['group_id'] for group in groups],))
+            members_by_group: Dict[int, List[int]] = {}
+            for row in cur.fetchall():
+                members_by_group.setdefault(row['group_id'], []).append(row['client_id'])
+            
+            clients_by_id = describe_clients(cur, [client_id for ids in members_by_group.values() for client_id in ids])
+            for group in groups:
+                group['members'] = sorted(
+                    (clients_by_id.get(client_id, {'id': client_id, 'total_revenue': 0})
+                     for client_id in members_by_group.get(group['group_id'], [])),
+                    key=lambda member: -member['total_revenue']
+                )
+            
+            return json_response(200, {'groups': groups})
+        
+        elif method == 'POST' and action == 'rebuild-groups':
+            group_count = rebuild_groups(cur)
+            conn.commit()
+            
+            return json_response(200, {'success': True, 'groups': group_count})
+        
         elif method == 'GET' and action == 'connections':
             query = 'SELECT * FROM t_p6388661_digital_goods_accoun.client_connections ORDER BY created_at DESC'
             cur.execute(query)
@@ -92,7 +318,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'Content-Type': 'application/json',
                     'Access-Control-Allow-Origin': '*'
                 },
-                'body': json.dumps({'connections': connections}, default=str),
+                'body': dumps({'connections': connections}, default=str),
                 'isBase64Encoded': False
             }
         
@@ -177,6 +403,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 ON CONFLICT (client_id_from, client_id_to) DO NOTHING
             '''
             cur.execute(query, (from_id, to_id, connection_type, description))
+            group_id = link_clients(cur, from_id, to_id)
             conn.commit()
             
             return {
@@ -185,7 +412,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'Content-Type': 'application/json',
                     'Access-Control-Allow-Origin': '*'
                 },
-                'body': json.dumps({'success': True}),
+                'body': json.dumps({'success': True, 'group_id': group_id}),
                 'isBase64Encoded': False
             }
         
@@ -210,4 +437,4 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         if 'cur' in locals():
             cur.close()
         if 'conn' in locals():
-            conn.close()
\ No newline at end of file
+            release_connection(conn)
\ No newline at end of file
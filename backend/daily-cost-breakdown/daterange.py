@@ -0,0 +1,24 @@
+'''
+Business: Индексируемые условия по диапазону дат для SQL-запросов
+Args: имя колонки, включительные даты начала и конца, префикс имён параметров
+Returns: список условий SQL и словарь именованных параметров
+'''
+
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+
+def date_range(column: str, start: Optional[date], end: Optional[date], name: str) -> Tuple[List[str], Dict[str, Any]]:
+    '''
+    Дни [start, end] как полуоткрытый диапазон [start, end + 1 день) по самой колонке, без приведения
+    column::date: так обычный индекс по колонке работает и для DATE, и для TIMESTAMP.
+    '''
+    conditions: List[str] = []
+    params: Dict[str, Any] = {}
+    if start is not None:
+        conditions.append(f'{column} >= %({name}_start)s')
+        params[f'{name}_start'] = start
+    if end is not None:
+        conditions.append(f'{column} < %({name}_end)s')
+        params[f'{name}_end'] = end + timedelta(days=1)
+    return conditions, params
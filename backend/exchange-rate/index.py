@@ -1,13 +1,90 @@
 import json
-import urllib.request
-from typing import Dict, Any
-from datetime import date
+import os
+import threading
+from typing import Dict, Any, Optional
+from datetime import date, datetime, timedelta
 
+from db import get_connection, release_connection
+from rate_sources import fetch_rate
+from sqltrace import traced_request
+
+STALE_MAX_DAYS = int(os.environ.get('RATE_STALE_MAX_DAYS', 7))
+
+# Last good rate of this warm instance: {'date', 'rate', 'source', 'fetched_at'}
+_memory_rate: Dict[str, Any] = {}
+_memory_lock = threading.Lock()
+_revalidating = threading.Lock()
+
+def remember_rate(entry: Dict[str, Any]) -> None:
+    with _memory_lock:
+        _memory_rate.clear()
+        _memory_rate.update(entry)
+
+def load_last_rate(today: date) -> Optional[Dict[str, Any]]:
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        # Rows without fetched_at are the placeholders seeded by V0004, not fetched rates
+        cur.execute(
+            """SELECT date, rate, source, fetched_at FROM exchange_rates
+               WHERE currency_from = 'USD' AND currency_to = 'RUB' AND date <= %s AND fetched_at IS NOT NULL
+               ORDER BY date DESC LIMIT 1""",
+            (today,)
+        )
+        row = cur.fetchone()
+        cur.close()
+    finally:
+        release_connection(conn)
+    
+    if not row:
+        return None
+    return {'date': row[0], 'rate': float(row[1]), 'source': row[2], 'fetched_at': row[3]}
+
+def store_rate(entry: Dict[str, Any]) -> None:
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            """INSERT INTO exchange_rates (currency_from, currency_to, rate, date, source, fetched_at)
+               VALUES ('USD', 'RUB', %s, %s, %s, %s)
+               ON CONFLICT (currency_from, currency_to, date) DO UPDATE
+               SET rate = EXCLUDED.rate, source = EXCLUDED.source, fetched_at = EXCLUDED.fetched_at""",
+            (entry['rate'], entry['date'], entry['source'], entry['fetched_at'])
+        )
+        conn.commit()
+        cur.close()
+    finally:
+        release_connection(conn)
+
+def refresh_rate(today: date) -> Optional[Dict[str, Any]]:
+    entry = fetch_rate(today)
+    if entry is not None:
+        remember_rate(entry)
+        try:
+            store_rate(entry)
+        except Exception:
+            pass
+    return entry
+
+def revalidate_in_background(today: date) -> None:
+    # One refresh at a time per instance; concurrent stale hits just serve the stale rate
+    if not _revalidating.acquire(blocking=False):
+        return
+    
+    def run() -> None:
+        try:
+            refresh_rate(today)
+        finally:
+            _revalidating.release()
+    
+    threading.Thread(target=run, daemon=True).start()
+
+@traced_request
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
-    Business: Получение актуального курса доллара с ЦБ РФ
-    Args: event с httpMethod
-    Returns: HTTP response с текущим курсом USD/RUB
+    Business: Получение актуального курса доллара с ЦБ РФ, курс дня кэшируется в памяти и в exchange_rates
+    Args: event с httpMethod, queryStringParameters.refresh=1 для принудительного обновления
+    Returns: HTTP response с текущим курсом USD/RUB и возрастом кэша
     '''
     method: str = event.get('httpMethod', 'GET')
     
@@ -25,32 +102,54 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
     
     if method == 'GET':
-        today = date.today().isoformat()
-        
-        sources = [
-            ('https://www.cbr-xml-daily.ru/daily_json.js', 'cbr', lambda d: d['Valute']['USD']['Value']),
-            ('https://api.exchangerate-api.com/v4/latest/USD', 'exchangerate-api', lambda d: d['rates']['RUB']),
-        ]
+        params = event.get('queryStringParameters') or {}
+        refresh = params.get('refresh') in ('1', 'true')
+        today = date.today()
         
-        for url, source_name, extractor in sources:
+        with _memory_lock:
+            entry, cached = (dict(_memory_rate), 'memory') if _memory_rate else (None, None)
+        if entry is None or entry['date'] != today:
             try:
-                with urllib.request.urlopen(url, timeout=5) as response:
-                    data = json.loads(response.read().decode())
-                    usd_rate = float(extractor(data))
-                    
-                    return {
-                        'statusCode': 200,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'rate': usd_rate, 'date': today, 'source': source_name}),
-                        'isBase64Encoded': False
-                    }
+                stored = load_last_rate(today)
             except Exception:
-                continue
+                stored = None
+            if stored is not None and (entry is None or stored['date'] >= entry['date']):
+                entry, cached = stored, 'database'
+                remember_rate(stored)
+        
+        last_good = entry if entry is not None and entry['date'] >= today - timedelta(days=STALE_MAX_DAYS) else None
+        stale = last_good is not None and last_good['date'] != today
+        
+        if refresh or last_good is None:
+            fresh = refresh_rate(today)
+            if fresh is not None:
+                entry, cached, stale = fresh, None, False
+            else:
+                entry = last_good
+        elif stale:
+            # Stale-while-revalidate: answer with the last good rate now, fetch today's in the background
+            entry = last_good
+            revalidate_in_background(today)
+        
+        if entry is None:
+            return {
+                'statusCode': 500,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'All sources failed', 'fallback_rate': 95.50}),
+                'isBase64Encoded': False
+            }
         
         return {
-            'statusCode': 500,
+            'statusCode': 200,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'All sources failed', 'fallback_rate': 95.50}),
+            'body': json.dumps({
+                'rate': entry['rate'],
+                'date': entry['date'].isoformat(),
+                'source': entry['source'],
+                'cached': cached,
+                'stale': stale,
+                'cache_age_seconds': max(0, int((datetime.now() - entry['fetched_at']).total_seconds()))
+            }),
             'isBase64Encoded': False
         }
     
@@ -0,0 +1,122 @@
+'''
+Business: Параллельный запрос курса USD/RUB у всех источников с общим дедлайном и автоматом отключения сбойных источников
+Args: дата курса; адреса источников и пороги из переменных окружения
+Returns: fetch_rate() - первый корректный ответ любого здорового источника или None
+'''
+
+import json
+import os
+import threading
+import time
+import urllib.request
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from datetime import date, datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from metrics import registry
+
+CBR_URL = os.environ.get('CBR_RATE_URL', 'https://www.cbr-xml-daily.ru/daily_json.js')
+FALLBACK_URL = os.environ.get('FALLBACK_RATE_URL', 'https://api.exchangerate-api.com/v4/latest/USD')
+FETCH_DEADLINE = float(os.environ.get('RATE_FETCH_DEADLINE', 3))
+BREAKER_FAILURES = int(os.environ.get('RATE_BREAKER_FAILURES', 3))
+BREAKER_COOLDOWN = float(os.environ.get('RATE_BREAKER_COOLDOWN', 60))
+
+SOURCES: List[Tuple[str, str, Callable[[Dict[str, Any]], Any]]] = [
+    ('cbr', CBR_URL, lambda d: d['Valute']['USD']['Value']),
+    ('exchangerate-api', FALLBACK_URL, lambda d: d['rates']['RUB']),
+]
+
+
+class CircuitBreaker:
+    '''
+    После BREAKER_FAILURES сбоев подряд источник пропускается на время cooldown,
+    затем пропускается одна пробная попытка: успех закрывает автомат, сбой снова открывает.
+    '''
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURES, cooldown: float = BREAKER_COOLDOWN):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.cooldown:
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+    @property
+    def state(self) -> str:
+        return 'closed' if self.opened_at is None else 'open'
+
+
+breakers: Dict[str, CircuitBreaker] = {name: CircuitBreaker() for name, _, _ in SOURCES}
+
+SOURCE_CALLS = registry.counter('exchange_rate_source_calls_total', 'Calls to rate sources by outcome: ok, error or skipped by an open breaker', ('source', 'outcome'))
+SOURCE_LATENCY = registry.histogram('exchange_rate_source_duration_seconds', 'Rate source response time, finished calls only', ('source',))
+FETCHES = registry.counter('exchange_rate_fetches_total', 'fetch_rate() results: the source that answered, deadline or failed', ('result',))
+
+# Shared across warm invocations; a source that misses the deadline finishes in the background
+_executor = ThreadPoolExecutor(max_workers=2 * len(SOURCES))
+
+
+def fetch_source(url: str, extractor: Callable[[Dict[str, Any]], Any]) -> float:
+    with urllib.request.urlopen(url, timeout=FETCH_DEADLINE) as response:
+        rate = float(extractor(json.loads(response.read().decode())))
+    if not rate > 0:
+        raise ValueError(f'Invalid rate {rate}')
+    return rate
+
+
+def _record_outcome(name: str, started: float) -> Callable[[Future], None]:
+    def callback(future: Future) -> None:
+        # Runs when the call finishes, also for calls that missed the deadline
+        SOURCE_LATENCY.observe(time.monotonic() - started, name)
+        if future.exception() is None:
+            breakers[name].record_success()
+            SOURCE_CALLS.inc(name, 'ok')
+        else:
+            breakers[name].record_failure()
+            SOURCE_CALLS.inc(name, 'error')
+    return callback
+
+
+def fetch_rate(today: date) -> Optional[Dict[str, Any]]:
+    pending: Dict[Future, str] = {}
+    for name, url, extractor in SOURCES:
+        if breakers[name].allow():
+            future = _executor.submit(fetch_source, url, extractor)
+            future.add_done_callback(_record_outcome(name, time.monotonic()))
+            pending[future] = name
+        else:
+            SOURCE_CALLS.inc(name, 'skipped')
+
+    deadline = time.monotonic() + FETCH_DEADLINE
+    while pending:
+        done, _ = wait(pending, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+        if not done:
+            FETCHES.inc('deadline')
+            return None
+        # Several answers in the same instant: keep the SOURCES order of preference
+        for future in sorted(done, key=lambda f: [name for name, _, _ in SOURCES].index(pending[f])):
+            name = pending.pop(future)
+            if future.exception() is None:
+                FETCHES.inc(name)
+                return {'date': today, 'rate': future.result(), 'source': name, 'fetched_at': datetime.now()}
+    FETCHES.inc('failed')
+    return None
@@ -0,0 +1,78 @@
+'''
+Business: Распределение расходов по дням для статистики, дневных расходов и разбивки затрат
+Args: интервалы (start_date, end_date, amount, distribution_type, currency) и диапазон дат
+Returns: плотный NumPy-массив сумм в рублях по каждому дню диапазона
+'''
+
+from datetime import date
+from typing import Any, Iterable, Sequence, Tuple
+
+import numpy as np
+
+# Бессрочный периодический расход распределяется так, будто он длится год
+OPEN_ENDED_DAYS = 365
+
+
+def to_arrays(expenses: Iterable[Sequence[Any]], exchange_rate: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    '''
+    Раскладывает строки расходов в колонки: даты начала и конца (datetime64[D], конец NaT
+    для бессрочных), сумму в рублях и признак разового расхода.
+    '''
+    rows = list(expenses)
+    if not rows:
+        empty_dates = np.array([], dtype='datetime64[D]')
+        return empty_dates, empty_dates, np.array([], dtype=float), np.array([], dtype=bool)
+
+    starts, ends, amounts, dist_types, currencies = zip(*rows)
+    starts = np.array(starts, dtype='datetime64[D]')
+    ends = np.array(ends, dtype='datetime64[D]')
+    amounts = np.array(amounts, dtype=float)
+    amounts = np.where(np.array(currencies, dtype=object) == 'USD', amounts * exchange_rate, amounts)
+    one_time = np.array(dist_types, dtype=object) == 'one_time'
+    return starts, ends, amounts, one_time
+
+
+def daily_rates(starts: np.ndarray, ends: np.ndarray, amounts: np.ndarray, one_time: np.ndarray) -> np.ndarray:
+    '''Сумма в день для каждого расхода; разовый расход целиком приходится на день начала.'''
+    period_days = np.where(np.isnat(ends), OPEN_ENDED_DAYS, (ends - starts).astype(np.int64) + 1)
+    return np.where(one_time, amounts, amounts / np.maximum(period_days, 1))
+
+
+def amortize(expenses: Iterable[Sequence[Any]], range_start: date, range_end: date, exchange_rate: float) -> np.ndarray:
+    '''
+    Плотный массив расходов по дням [range_start, range_end] за O(расходы + дни):
+    периодические расходы ложатся в разностный массив и собираются префиксной суммой,
+    разовые добавляются точечно.
+    '''
+    days = (range_end - range_start).days + 1
+    if days <= 0:
+        return np.zeros(0)
+
+    starts, ends, amounts, one_time = to_arrays(expenses, exchange_rate)
+    rates = daily_rates(starts, ends, amounts, one_time)
+
+    origin = np.datetime64(range_start, 'D')
+    start_idx = (starts - origin).astype(np.int64)
+    end_idx = np.where(np.isnat(ends), days - 1, (ends - origin).astype(np.int64))
+
+    points = one_time & (start_idx >= 0) & (start_idx < days)
+    daily = np.bincount(start_idx[points], weights=rates[points], minlength=days)[:days].astype(float)
+
+    lo = np.maximum(start_idx, 0)
+    hi = np.minimum(end_idx, days - 1)
+    spread = ~one_time & (lo <= hi)
+    diff = (np.bincount(lo[spread], weights=rates[spread], minlength=days + 1)
+            - np.bincount(hi[spread] + 1, weights=rates[spread], minlength=days + 1))
+    daily += np.cumsum(diff)[:days]
+
+    # Префиксная сумма оставляет ~1e-13 там, где интервалы уже закончились
+    daily[np.abs(daily) < 1e-9] = 0.0
+    return daily
+
+
+def amounts_on(expenses: Iterable[Sequence[Any]], day: date, exchange_rate: float) -> Tuple[np.ndarray, np.ndarray]:
+    '''Сумма каждого расхода, приходящаяся на день day, и маска расходов, активных в этот день.'''
+    starts, ends, amounts, one_time = to_arrays(expenses, exchange_rate)
+    target = np.datetime64(day, 'D')
+    active = np.where(one_time, starts == target, (starts <= target) & (np.isnat(ends) | (ends >= target)))
+    return np.where(active, daily_rates(starts, ends, amounts, one_time), 0.0), active
@@ -1,10 +1,21 @@
 import json
-import os
-import psycopg2
 from typing import Dict, Any
 from datetime import datetime, timedelta
 from decimal import Decimal
 
+import numpy as np
+
+from amortization import amortize
+from db import get_connection, release_connection
+from etag import conditional_get
+from sqltrace import dumps, traced_request
+
+# Бессрочные расходы раскладываются по дням на год вперёд; дальше их продлевают статистика и
+# разбивка затрат до запрошенного дня (или вручную action=extend_allocations)
+ALLOCATION_HORIZON_DAYS = 365
+
+@traced_request
+@conditional_get('expenses', 'expense_types', 'exchange_rates')
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: Управление расходными транзакциями с распределением по периодам
@@ -19,229 +30,215 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type',
+                'Access-Control-Allow-Headers': 'Content-Type, If-None-Match',
                 'Access-Control-Max-Age': '86400'
             },
             'body': '',
             'isBase64Encoded': False
         }
     
-    dsn = os.environ.get('DATABASE_URL')
-    conn = psycopg2.connect(dsn)
-    cur = conn.cursor()
-    
-    if method == 'GET':
-        params = event.get('queryStringParameters', {}) or {}
-        action = params.get('action', 'list')
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
         
-        if action == 'types':
-            cur.execute("SELECT id, name, description FROM expense_types ORDER BY name")
+        if method == 'GET':
+            params = event.get('queryStringParameters', {}) or {}
+            action = params.get('action', 'list')
+            
+            if action == 'types':
+                cur.execute("SELECT id, name, description FROM expense_types ORDER BY name")
+                rows = cur.fetchall()
+                
+                types = []
+                for row in rows:
+                    types.append({
+                        'id': row[0],
+                        'name': row[1],
+                        'description': row[2]
+                    })
+                
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': dumps({'expense_types': types}),
+                    'isBase64Encoded': False
+                }
+            
+            if action == 'daily':
+                start_date = params.get('start_date')
+                end_date = params.get('end_date')
+                
+                if not start_date or not end_date:
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': 'start_date and end_date required'}),
+                        'isBase64Encoded': False
+                    }
+                
+                range_start = datetime.strptime(start_date, '%Y-%m-%d').date()
+                range_end = datetime.strptime(end_date, '%Y-%m-%d').date()
+                
+                cur.execute("""
+                    SELECT e.start_date, e.end_date, e.amount, e.distribution_type, e.currency
+                    FROM expenses e
+                    WHERE e.status = 'active'
+                    AND e.start_date <= %s
+                    AND (e.end_date IS NULL OR e.end_date >= %s)
+                """, (range_end, range_start))
+                rows = cur.fetchall()
+                
+                # USD expenses accrue in dollars and are converted at each day's historical rate
+                usd_rows = [row for row in rows if row[4] == 'USD']
+                daily_expenses = amortize([row for row in rows if row[4] != 'USD'], range_start, range_end, 1.0)
+                if usd_rows:
+                    cur.execute(
+                        "SELECT rate FROM usd_rub_rate_series(%s, %s) ORDER BY day",
+                        (range_start, range_end)
+                    )
+                    day_rates = np.array([float(row[0]) for row in cur.fetchall()])
+                    daily_expenses = daily_expenses + amortize(usd_rows, range_start, range_end, 1.0) * day_rates
+                
+                result = []
+                for offset in np.flatnonzero(daily_expenses).tolist():
+                    result.append({
+                        'date': (range_start + timedelta(days=offset)).isoformat(),
+                        'total_expense': round(float(daily_expenses[offset]), 2)
+                    })
+                
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': dumps({'daily_expenses': result}),
+                    'isBase64Encoded': False
+                }
+            
+            cur.execute("""
+                SELECT e.id, e.expense_type_id, et.name, e.amount, e.description, 
+                       e.start_date, e.end_date, e.distribution_type, e.status, e.currency
+                FROM expenses e
+                LEFT JOIN expense_types et ON e.expense_type_id = et.id
+                ORDER BY e.created_at DESC
+                LIMIT 100
+            """)
             rows = cur.fetchall()
             
-            types = []
+            expenses = []
             for row in rows:
-                types.append({
+                expenses.append({
                     'id': row[0],
-                    'name': row[1],
-                    'description': row[2]
+                    'expense_type_id': row[1],
+                    'expense_type_name': row[2],
+                    'amount': float(row[3]),
+                    'description': row[4],
+                    'start_date': row[5].isoformat() if row[5] else None,
+                    'end_date': row[6].isoformat() if row[6] else None,
+                    'distribution_type': row[7],
+                    'status': row[8],
+                    'currency': row[9] if len(row) > 9 and row[9] else 'RUB'
                 })
             
-            cur.close()
-            conn.close()
-            
             return {
                 'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'expense_types': types}),
+                'body': dumps({'expenses': expenses}),
                 'isBase64Encoded': False
             }
         
-        if action == 'daily':
-            start_date = params.get('start_date')
-            end_date = params.get('end_date')
+        if method == 'POST':
+            body_data = json.loads(event.get('body', '{}'))
+            action = body_data.get('action', 'create_expense')
             
-            if not start_date or not end_date:
-                cur.close()
-                conn.close()
+            if action == 'create_type':
+                name = body_data.get('name')
+                description = body_data.get('description', '')
+                
+                cur.execute(
+                    "INSERT INTO expense_types (name, description) VALUES ('" + name + "', '" + description + "') RETURNING id"
+                )
+                type_id = cur.fetchone()[0]
+                
+                conn.commit()
+                
                 return {
-                    'statusCode': 400,
+                    'statusCode': 200,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'start_date and end_date required'}),
+                    'body': json.dumps({'success': True, 'id': type_id}),
                     'isBase64Encoded': False
                 }
             
-            cur.execute("""
-                SELECT e.id, e.amount, e.start_date, e.end_date, e.distribution_type, et.name
-                FROM expenses e
-                LEFT JOIN expense_types et ON e.expense_type_id = et.id
-                WHERE e.status = 'active'
-                AND e.start_date <= '" + end_date + "'
-                AND (e.end_date IS NULL OR e.end_date >= '" + start_date + "')
-            """)
-            rows = cur.fetchall()
+            if action == 'extend_allocations':
+                horizon_days = int(body_data.get('horizon_days', ALLOCATION_HORIZON_DAYS))
+                cur.execute(
+                    "SELECT extend_expense_allocations(CURRENT_DATE + %s)",
+                    (horizon_days,)
+                )
+                allocated_days = cur.fetchone()[0]
+                
+                conn.commit()
+                
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'success': True, 'allocated_days': allocated_days}),
+                    'isBase64Encoded': False
+                }
             
-            daily_expenses = {}
+            expense_type_id = body_data.get('expense_type_id')
+            amount = body_data.get('amount')
+            description = body_data.get('description', '')
+            start_date = body_data.get('start_date')
+            end_date = body_data.get('end_date')
+            distribution_type = body_data.get('distribution_type', 'one_time')
+            currency = body_data.get('currency', 'RUB')
             
-            for row in rows:
-                expense_id = row[0]
-                amount = float(row[1])
-                exp_start = row[2]
-                exp_end = row[3]
-                dist_type = row[4]
-                type_name = row[5]
-                
-                if dist_type == 'one_time':
-                    date_key = exp_start.isoformat()
-                    if date_key not in daily_expenses:
-                        daily_expenses[date_key] = 0
-                    daily_expenses[date_key] += amount
-                else:
-                    actual_start = max(datetime.strptime(start_date, '%Y-%m-%d').date(), exp_start)
-                    actual_end = min(datetime.strptime(end_date, '%Y-%m-%d').date(), exp_end) if exp_end else datetime.strptime(end_date, '%Y-%m-%d').date()
-                    
-                    days_count = (actual_end - actual_start).days + 1
-                    if days_count > 0:
-                        daily_amount = amount / days_count
-                        
-                        current_date = actual_start
-                        while current_date <= actual_end:
-                            date_key = current_date.isoformat()
-                            if date_key not in daily_expenses:
-                                daily_expenses[date_key] = 0
-                            daily_expenses[date_key] += daily_amount
-                            current_date += timedelta(days=1)
-            
-            result = []
-            for date_str, total in daily_expenses.items():
-                result.append({
-                    'date': date_str,
-                    'total_expense': round(total, 2)
-                })
+            end_date_sql = "'" + end_date + "'" if end_date else 'NULL'
             
-            cur.close()
-            conn.close()
+            cur.execute(
+                "INSERT INTO expenses (expense_type_id, amount, description, start_date, end_date, distribution_type, currency) VALUES (" 
+                + str(expense_type_id) + ", " + str(amount) + ", '" + description + "', '" + start_date + "', " + end_date_sql + ", '" + distribution_type + "', '" + currency + "') RETURNING id"
+            )
+            expense_id = cur.fetchone()[0]
+            
+            cur.execute(
+                "SELECT allocate_expense(%s, CURRENT_DATE + %s)",
+                (expense_id, ALLOCATION_HORIZON_DAYS)
+            )
+            
+            conn.commit()
             
             return {
                 'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'daily_expenses': sorted(result, key=lambda x: x['date'])}),
+                'body': json.dumps({'success': True, 'id': expense_id}),
                 'isBase64Encoded': False
             }
         
-        cur.execute("""
-            SELECT e.id, e.expense_type_id, et.name, e.amount, e.description, 
-                   e.start_date, e.end_date, e.distribution_type, e.status, e.currency
-            FROM expenses e
-            LEFT JOIN expense_types et ON e.expense_type_id = et.id
-            ORDER BY e.created_at DESC
-            LIMIT 100
-        """)
-        rows = cur.fetchall()
-        
-        expenses = []
-        for row in rows:
-            expenses.append({
-                'id': row[0],
-                'expense_type_id': row[1],
-                'expense_type_name': row[2],
-                'amount': float(row[3]),
-                'description': row[4],
-                'start_date': row[5].isoformat() if row[5] else None,
-                'end_date': row[6].isoformat() if row[6] else None,
-                'distribution_type': row[7],
-                'status': row[8],
-                'currency': row[9] if len(row) > 9 and row[9] else 'RUB'
-            })
-        
-        cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'expenses': expenses}),
-            'isBase64Encoded': False
-        }
-    
-    if method == 'POST':
-        body_data = json.loads(event.get('body', '{}'))
-        action = body_data.get('action', 'create_expense')
-        
-        if action == 'create_type':
-            name = body_data.get('name')
-            description = body_data.get('description', '')
+        if method == 'DELETE':
+            params = event.get('queryStringParameters', {}) or {}
+            expense_id = params.get('id')
+            action = params.get('action', 'delete_expense')
             
-            cur.execute(
-                "INSERT INTO expense_types (name, description) VALUES ('" + name + "', '" + description + "') RETURNING id"
-            )
-            type_id = cur.fetchone()[0]
+            if action == 'delete_type':
+                type_id = params.get('type_id')
+                cur.execute("DELETE FROM expense_types WHERE id = " + str(type_id))
+            else:
+                cur.execute("DELETE FROM expenses WHERE id = " + str(expense_id))
             
             conn.commit()
-            cur.close()
-            conn.close()
             
             return {
                 'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'success': True, 'id': type_id}),
+                'body': json.dumps({'success': True}),
                 'isBase64Encoded': False
             }
         
-        expense_type_id = body_data.get('expense_type_id')
-        amount = body_data.get('amount')
-        description = body_data.get('description', '')
-        start_date = body_data.get('start_date')
-        end_date = body_data.get('end_date')
-        distribution_type = body_data.get('distribution_type', 'one_time')
-        currency = body_data.get('currency', 'RUB')
-        
-        end_date_sql = "'" + end_date + "'" if end_date else 'NULL'
-        
-        cur.execute(
-            "INSERT INTO expenses (expense_type_id, amount, description, start_date, end_date, distribution_type, currency) VALUES (" 
-            + str(expense_type_id) + ", " + str(amount) + ", '" + description + "', '" + start_date + "', " + end_date_sql + ", '" + distribution_type + "', '" + currency + "') RETURNING id"
-        )
-        expense_id = cur.fetchone()[0]
-        
-        conn.commit()
-        cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'success': True, 'id': expense_id}),
-            'isBase64Encoded': False
-        }
-    
-    if method == 'DELETE':
-        params = event.get('queryStringParameters', {}) or {}
-        expense_id = params.get('id')
-        action = params.get('action', 'delete_expense')
-        
-        if action == 'delete_type':
-            type_id = params.get('type_id')
-            cur.execute("DELETE FROM expense_types WHERE id = " + str(type_id))
-        else:
-            cur.execute("DELETE FROM expenses WHERE id = " + str(expense_id))
-        
-        conn.commit()
-        cur.close()
-        conn.close()
-        
         return {
-            'statusCode': 200,
+            'statusCode': 405,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'success': True}),
+            'body': json.dumps({'error': 'Method not allowed'}),
             'isBase64Encoded': False
         }
-    
-    cur.close()
-    conn.close()
-    
-    return {
-        'statusCode': 405,
-        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps({'error': 'Method not allowed'}),
-        'isBase64Encoded': False
-    }
\ No newline at end of file
+    finally:
+        release_connection(conn)
@@ -0,0 +1,226 @@
+'''
+Business: Трассировка SQL по запросу: отпечаток, длительность и число строк каждого запроса к БД
+Args: SQL_TRACE=1 включает трассировку; без неё при METRICS_ENABLED=1 курсоры только считают запросы, а без обоих не меняются ни соединения, ни handler()
+Returns: декоратор traced_request для handler() - заголовок Server-Timing и JSON-строка лога на вызов, метрики запроса и GET ?action=metrics; dumps() для тел ответов
+'''
+
+import contextvars
+import functools
+import hashlib
+import json
+import os
+import re
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import metrics
+
+ENABLED = os.environ.get('SQL_TRACE', '').lower() in ('1', 'true', 'yes')
+# Metrics need the statement count of each request, so with them on the cursors are traced too
+ACTIVE = ENABLED or metrics.ENABLED
+
+# Statements kept per invocation in the log line; the rest are only counted
+MAX_LOGGED_STATEMENTS = int(os.environ.get('SQL_TRACE_MAX_STATEMENTS', 50))
+
+_current: 'contextvars.ContextVar[Optional[RequestTrace]]' = contextvars.ContextVar('sql_trace', default=None)
+
+# Plain pattern strings: re compiles and caches them on first use, so a cold start with tracing off pays nothing
+_STRING_LITERAL = r"'(?:[^']|'')*'"
+_NUMBER_LITERAL = r'\b\d+(?:\.\d+)?\b'
+_VALUE_LIST = r'\((?:\s*(?:\?|%s|%\(\w+\)s)\s*,)+\s*(?:\?|%s|%\(\w+\)s)\s*\)'
+_VALUE_LISTS = r'\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+'
+_WHITESPACE = r'\s+'
+
+
+def fingerprint(query: str) -> str:
+    '''Query text with literals and value lists folded, so one statement shape gives one fingerprint,
+    whatever the values or the batch size'''
+    text = re.sub(_STRING_LITERAL, '?', query)
+    text = re.sub(_NUMBER_LITERAL, '?', text)
+    text = re.sub(_VALUE_LIST, '(...)', text)
+    text = re.sub(_VALUE_LISTS, '(...)', text)
+    return re.sub(_WHITESPACE, ' ', text).strip()
+
+
+class RequestTrace:
+    def __init__(self, detailed: bool = True):
+        self.detailed = detailed
+        self.statements: List[Dict[str, Any]] = []
+        self.statement_count = 0
+        self.db_ms = 0.0
+        self.connect_ms = 0.0
+        self.connections_opened = 0
+        self.serialize_ms = 0.0
+
+    def add_statement(self, query: str, duration_ms: float, rows: int) -> None:
+        self.db_ms += duration_ms
+        self.statement_count += 1
+        if not self.detailed or len(self.statements) >= MAX_LOGGED_STATEMENTS:
+            return
+        text = fingerprint(query)
+        self.statements.append({
+            'fingerprint': hashlib.sha1(text.encode('utf-8')).hexdigest()[:12],
+            'sql': text[:300],
+            'ms': round(duration_ms, 3),
+            'rows': rows
+        })
+
+    def server_timing(self, total_ms: float) -> str:
+        app_ms = max(total_ms - self.db_ms - self.connect_ms - self.serialize_ms, 0.0)
+        return ', '.join([
+            f'db;dur={self.db_ms:.2f};desc="{self.statement_count} statements"',
+            f'connect;dur={self.connect_ms:.2f};desc="{self.connections_opened} opened"',
+            f'serialize;dur={self.serialize_ms:.2f}',
+            f'app;dur={app_ms:.2f}',
+            f'total;dur={total_ms:.2f}'
+        ])
+
+
+def timed_connect(getconn: Callable[[], Any]) -> Any:
+    '''Time to get a connection from the pool, including opening a new one'''
+    started = time.perf_counter()
+    try:
+        return getconn()
+    finally:
+        trace = _current.get()
+        if trace is not None:
+            trace.connect_ms += (time.perf_counter() - started) * 1000
+
+
+def _query_text(cursor: Any, query: Any) -> str:
+    if isinstance(query, str):
+        return query
+    if isinstance(query, bytes):
+        return query.decode('utf-8')
+    return query.as_string(cursor.connection)
+
+
+_cursor_classes: Dict[type, type] = {}
+_connection_class: Optional[type] = None
+
+
+def _traced_cursor_class(base: type) -> type:
+    if base not in _cursor_classes:
+        class TracedCursor(base):
+            def execute(self, query, vars=None):
+                trace = _current.get()
+                if trace is None:
+                    return super().execute(query, vars)
+                started = time.perf_counter()
+                try:
+                    return super().execute(query, vars)
+                finally:
+                    trace.add_statement(_query_text(self, query), (time.perf_counter() - started) * 1000, self.rowcount)
+
+            def executemany(self, query, vars_list):
+                trace = _current.get()
+                if trace is None:
+                    return super().executemany(query, vars_list)
+                started = time.perf_counter()
+                try:
+                    return super().executemany(query, vars_list)
+                finally:
+                    trace.add_statement(_query_text(self, query), (time.perf_counter() - started) * 1000, self.rowcount)
+
+        TracedCursor.__name__ = 'Traced' + base.__name__
+        _cursor_classes[base] = TracedCursor
+    return _cursor_classes[base]
+
+
+def connection_factory() -> type:
+    '''psycopg2 connection class whose cursors, of any cursor_factory, record their statements'''
+    global _connection_class
+    if _connection_class is None:
+        # Imported here: with tracing off, handlers that defer psycopg2 keep deferring it
+        import psycopg2.extensions
+
+        class TracedConnection(psycopg2.extensions.connection):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                trace = _current.get()
+                if trace is not None:
+                    trace.connections_opened += 1
+
+            def cursor(self, *args, **kwargs):
+                base = kwargs.get('cursor_factory') or self.cursor_factory or psycopg2.extensions.cursor
+                kwargs['cursor_factory'] = _traced_cursor_class(base)
+                return super().cursor(*args, **kwargs)
+
+        _connection_class = TracedConnection
+    return _connection_class
+
+
+def dumps(obj: Any, **kwargs: Any) -> str:
+    '''json.dumps for response bodies; with tracing on its time is the serialize part of Server-Timing'''
+    trace = _current.get()
+    if trace is None or not trace.detailed:
+        return json.dumps(obj, **kwargs)
+    started = time.perf_counter()
+    try:
+        return json.dumps(obj, **kwargs)
+    finally:
+        trace.serialize_ms += (time.perf_counter() - started) * 1000
+
+
+def traced_request(handler: Callable) -> Callable:
+    '''
+    Outermost decorator of handler(). With SQL_TRACE on every response gets a Server-Timing
+    header and every invocation prints one JSON log line with the statements it ran; with
+    METRICS_ENABLED=1 every invocation is counted, its statements through traced cursors, and
+    GET ?action=metrics is answered here. With both off, the default, it returns handler itself
+    and connections stay plain, so there is no per-request cost.
+    '''
+    if not ACTIVE:
+        return handler
+
+    inner = handler
+    while hasattr(inner, '__wrapped__'):
+        inner = inner.__wrapped__
+    # Every function deploys from its own directory, named like the function
+    function_name = os.path.basename(os.path.dirname(os.path.abspath(inner.__code__.co_filename)))
+
+    @functools.wraps(handler)
+    def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+        method = event.get('httpMethod', 'GET')
+        params = event.get('queryStringParameters') or {}
+        if metrics.ENABLED and method == 'GET' and params.get('action') == 'metrics':
+            return metrics.metrics_response()
+
+        trace = RequestTrace(detailed=ENABLED)
+        token = _current.set(trace)
+        started = time.perf_counter()
+        response: Optional[Dict[str, Any]] = None
+        try:
+            response = handler(event, context)
+            return response
+        finally:
+            _current.reset(token)
+            total_ms = (time.perf_counter() - started) * 1000
+            status = response.get('statusCode') if response is not None else 500
+            if metrics.ENABLED:
+                metrics.observe_request(method, params.get('action'), status, total_ms / 1000, trace.statement_count)
+            if ENABLED:
+                if response is not None:
+                    headers = response.get('headers') or {}
+                    exposed = headers.get('Access-Control-Expose-Headers')
+                    response['headers'] = dict(headers, **{
+                        'Server-Timing': trace.server_timing(total_ms),
+                        'Timing-Allow-Origin': '*',
+                        'Access-Control-Expose-Headers': (exposed + ', ' if exposed else '') + 'Server-Timing'
+                    })
+                print(json.dumps({
+                    'type': 'sql_trace',
+                    'function': function_name,
+                    'request_id': getattr(context, 'request_id', None),
+                    'method': method,
+                    'action': params.get('action'),
+                    'status': status,
+                    'total_ms': round(total_ms, 3),
+                    'db_ms': round(trace.db_ms, 3),
+                    'connect_ms': round(trace.connect_ms, 3),
+                    'connections_opened': trace.connections_opened,
+                    'serialize_ms': round(trace.serialize_ms, 3),
+                    'statement_count': trace.statement_count,
+                    'statements': trace.statements
+                }, default=str))
+    return wrapper
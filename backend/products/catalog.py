@@ -0,0 +1,99 @@
+'''
+Business: Каталог товаров в памяти тёплого экземпляра, привязанный к версии products из data_versions
+Args: курсор для загрузки; запись в products увеличивает версию триггером, и каталог перечитывается
+Returns: product_catalog - цены по id и готовое тело ответа GET products
+'''
+
+import json
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from metrics import registry
+
+VERSION_SQL = "SELECT version FROM data_versions WHERE table_name = 'products'"
+
+CACHE_LOOKUPS = registry.counter('handler_cache_lookups_total', 'In-process and HTTP cache lookups', ('cache', 'result'))
+
+
+class ProductCatalog:
+    def __init__(self):
+        self.version: Optional[int] = None
+        self.prices: Dict[int, Tuple] = {}
+        self.active_body: str = json.dumps({'products': []})
+        self._lock = threading.Lock()
+
+    def load(self, cur) -> 'ProductCatalog':
+        # Version and rows come from one statement, so they describe the same snapshot
+        cur.execute(f'''
+            SELECT v.version, p.id, p.name, p.cost_price, p.sale_price, p.description, p.is_active,
+                   p.created_at, p.currency, p.cost_price_usd, p.sale_price_usd
+            FROM ({VERSION_SQL}) v
+            LEFT JOIN products p ON true
+            ORDER BY p.name
+        ''')
+        rows = cur.fetchall()
+
+        prices: Dict[int, Tuple] = {}
+        products = []
+        for row in rows:
+            if row[1] is None:
+                continue
+            prices[row[1]] = (row[3], row[4], row[9], row[10])
+            if not row[6]:
+                continue
+            margin = float(row[4]) - float(row[3])
+            margin_percent = (margin / float(row[3]) * 100) if row[3] > 0 else 0
+            products.append({
+                'id': row[1],
+                'name': row[2],
+                'cost_price': float(row[3]),
+                'sale_price': float(row[4]),
+                'description': row[5],
+                'is_active': row[6],
+                'margin': margin,
+                'margin_percent': round(margin_percent, 2),
+                'created_at': row[7].isoformat() if row[7] else None,
+                'currency': row[8],
+                'cost_price_usd': float(row[9]) if row[9] else None,
+                'sale_price_usd': float(row[10]) if row[10] else None
+            })
+
+        with self._lock:
+            self.version = rows[0][0] if rows else None
+            self.prices = prices
+            self.active_body = json.dumps({'products': products})
+        return self
+
+    def ensure_loaded(self, cur) -> 'ProductCatalog':
+        if self.version is None:
+            self.load(cur)
+        return self
+
+    def refresh(self, cur, version: Optional[int] = None) -> 'ProductCatalog':
+        '''version: the products version already read for this request, e.g. by conditional_get'''
+        if version is None:
+            cur.execute(VERSION_SQL)
+            row = cur.fetchone()
+            version = row[0] if row is not None else None
+        if self.version is None or version is None or version != self.version:
+            CACHE_LOOKUPS.inc('catalog', 'miss')
+            self.load(cur)
+        else:
+            CACHE_LOOKUPS.inc('catalog', 'hit')
+        return self
+
+    def lookup(self, product_id: Any) -> Tuple[Optional[int], Optional[Tuple]]:
+        '''Prices of one product and the catalog version they belong to'''
+        with self._lock:
+            version, prices = self.version, self.prices
+        try:
+            return version, prices.get(int(product_id))
+        except (TypeError, ValueError):
+            return version, None
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self.version = None
+
+
+product_catalog = ProductCatalog()
@@ -0,0 +1,88 @@
+'''
+Business: Условные GET-запросы: ETag из счётчиков версий таблиц и ответ 304 без тяжёлых запросов
+Args: имена таблиц, от которых зависит ответ, и event с queryStringParameters и If-None-Match
+Returns: декоратор conditional_get для handler()
+'''
+
+import contextvars
+import functools
+import hashlib
+import json
+from datetime import date
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from db import get_connection, release_connection
+from metrics import registry
+
+CACHE_LOOKUPS = registry.counter('handler_cache_lookups_total', 'In-process and HTTP cache lookups', ('cache', 'result'))
+
+_versions: 'contextvars.ContextVar[Optional[Dict[str, int]]]' = contextvars.ContextVar('data_versions', default=None)
+
+
+def request_versions() -> Optional[Dict[str, int]]:
+    '''Table versions conditional_get read for the current GET, so the handler need not read them again'''
+    return _versions.get()
+
+
+def current_etag(tables: Tuple[str, ...], params: Dict[str, Any]) -> Tuple[str, Dict[str, int]]:
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT table_name, version FROM data_versions WHERE table_name = ANY(%s) ORDER BY table_name",
+            (list(tables),)
+        )
+        versions = [list(row) for row in cur.fetchall()]
+        cur.close()
+    finally:
+        release_connection(conn)
+
+    # Дата входит в ключ: today/week/month в статистике сдвигаются вместе с ней
+    key = json.dumps([versions, sorted((params or {}).items()), date.today().isoformat()])
+    return '"' + hashlib.sha1(key.encode('utf-8')).hexdigest()[:20] + '"', dict(versions)
+
+
+def request_etags(event: Dict[str, Any]) -> List[str]:
+    headers = event.get('headers') or {}
+    header = headers.get('If-None-Match') or headers.get('if-none-match') or ''
+    return [tag.strip().replace('W/', '', 1) for tag in header.split(',') if tag.strip()]
+
+
+def conditional_get(*tables: str) -> Callable:
+    def decorator(handler: Callable) -> Callable:
+        @functools.wraps(handler)
+        def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+            if event.get('httpMethod', 'GET') != 'GET':
+                return handler(event, context)
+
+            etag, versions = current_etag(tables, event.get('queryStringParameters') or {})
+            cache_headers = {
+                'ETag': etag,
+                'Cache-Control': 'no-cache',
+                'Access-Control-Expose-Headers': 'ETag'
+            }
+
+            if etag in request_etags(event):
+                CACHE_LOOKUPS.inc('etag', 'hit')
+                return {
+                    'statusCode': 304,
+                    'headers': dict(cache_headers, **{'Access-Control-Allow-Origin': '*'}),
+                    'body': '',
+                    'isBase64Encoded': False
+                }
+
+            CACHE_LOOKUPS.inc('etag', 'miss')
+            token = _versions.set(versions)
+            try:
+                response = handler(event, context)
+            finally:
+                _versions.reset(token)
+            if response.get('statusCode') == 200:
+                headers = response.get('headers') or {}
+                exposed = headers.get('Access-Control-Expose-Headers')
+                response['headers'] = dict(headers, **cache_headers)
+                if exposed:
+                    response['headers']['Access-Control-Expose-Headers'] = exposed + ', ETag'
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,262 @@
+'''
+Business: Метрики экземпляра функции: счётчики и гистограммы с фиксированными корзинами в текстовом формате Prometheus
+Args: METRICS_ENABLED=1 включает сбор (по умолчанию выключен); METRICS_DIR - каталог, куда каждый процесс сбрасывает свой снимок, чтобы action=metrics суммировал их все
+Returns: registry со счётчиками и гистограммами, observe_request() и metrics_response() для GET ?action=metrics
+'''
+
+import atexit
+import bisect
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+ENABLED = os.environ.get('METRICS_ENABLED', '').lower() in ('1', 'true', 'yes')
+METRICS_DIR = os.environ.get('METRICS_DIR')
+FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 1))
+
+# Every function deploys from its own directory, named like the function
+FUNCTION = os.path.basename(os.path.dirname(os.path.abspath(__file__)))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+
+
+class Metric:
+    '''
+    Every thread writes only to its own shard, so an increment takes no lock; collect()
+    adds the shards up. A shard is registered once per thread with list.append, atomic under the GIL.
+    '''
+    kind = ''
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...]):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = ('function',) + tuple(label_names)
+        self._local = threading.local()
+        self._shards: List[Dict[Tuple[str, ...], Any]] = []
+
+    def _shard(self) -> Dict[Tuple[str, ...], Any]:
+        shard = getattr(self._local, 'values', None)
+        if shard is None:
+            shard = self._local.values = {}
+            self._shards.append(shard)
+        return shard
+
+    def _key(self, labels: Iterable[Any]) -> Tuple[str, ...]:
+        return (FUNCTION,) + tuple('' if value is None else str(value) for value in labels)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {'type': self.kind, 'help': self.help_text, 'labels': list(self.label_names),
+                'values': [[list(key), value] for key, value in self.collect().items()]}
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *labels: Any, amount: float = 1) -> None:
+        if not ENABLED:
+            return
+        shard = self._shard()
+        key = self._key(labels)
+        shard[key] = shard.get(key, 0) + amount
+
+    def collect(self) -> Dict[Tuple[str, ...], float]:
+        totals: Dict[Tuple[str, ...], float] = {}
+        for shard in list(self._shards):
+            # dict.copy() runs under the GIL, so a writer cannot resize the shard mid-copy
+            for key, value in shard.copy().items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+
+class Histogram(Metric):
+    '''Fixed buckets: per label set the count of each bucket (not cumulative), then the sum'''
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...], buckets: Tuple[float, ...]):
+        super().__init__(name, help_text, label_names)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels: Any) -> None:
+        if not ENABLED:
+            return
+        shard = self._shard()
+        key = self._key(labels)
+        entry = shard.get(key)
+        if entry is None:
+            entry = shard[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        # le semantics: a value equal to a bound belongs to that bucket; the last count is +Inf
+        entry[bisect.bisect_left(self.buckets, value)] += 1
+        entry[-1] += value
+
+    def collect(self) -> Dict[Tuple[str, ...], List[float]]:
+        totals: Dict[Tuple[str, ...], List[float]] = {}
+        for shard in list(self._shards):
+            for key, entry in shard.copy().items():
+                total = totals.setdefault(key, [0] * len(entry))
+                for i, value in enumerate(list(entry)):
+                    total[i] += value
+        return totals
+
+    def snapshot(self) -> Dict[str, Any]:
+        return dict(super().snapshot(), buckets=list(self.buckets))
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: Metric) -> Metric:
+        # Only registration locks; modules ask for their metrics once, at import
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help_text: str, label_names: Tuple[str, ...] = ()) -> Counter:
+        return self._metrics.get(name) or self._register(Counter(name, help_text, label_names))
+
+    def histogram(self, name: str, help_text: str, label_names: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self._metrics.get(name) or self._register(Histogram(name, help_text, label_names, buckets))
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {name: metric.snapshot() for name, metric in list(self._metrics.items())}
+
+
+registry = Registry()
+
+REQUESTS = registry.counter('handler_requests_total', 'Handled requests', ('method', 'action', 'status'))
+LATENCY = registry.histogram('handler_request_duration_seconds', 'Request latency, whole handler', ('method', 'action'))
+STATEMENTS = registry.histogram('handler_db_statements', 'Database statements per request', ('method', 'action'),
+                                STATEMENT_BUCKETS)
+
+
+def _label(action: Any) -> str:
+    # action comes from the query string: anything unexpected shares one series instead of creating new ones
+    if action is None:
+        return ''
+    action = str(action)
+    if len(action) <= 32 and action.replace('_', '').replace('-', '').isalnum():
+        return action
+    return 'other'
+
+
+def observe_request(method: str, action: Any, status: Any, seconds: float, statements: Optional[int]) -> None:
+    action = _label(action)
+    REQUESTS.inc(method, action, status)
+    LATENCY.observe(seconds, method, action)
+    if statements is not None:
+        STATEMENTS.observe(statements, method, action)
+    maybe_flush()
+
+
+_flushed_at = 0.0
+
+
+def _snapshot_path(pid: int) -> str:
+    return os.path.join(METRICS_DIR, f'{FUNCTION}-{pid}.json')
+
+
+def flush() -> None:
+    '''Writes this process's snapshot to METRICS_DIR; the rename keeps readers off half-written files'''
+    global _flushed_at
+    if not METRICS_DIR:
+        return
+    _flushed_at = time.monotonic()
+    path = _snapshot_path(os.getpid())
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(registry.snapshot(), f)
+    os.replace(path + '.tmp', path)
+
+
+def maybe_flush() -> None:
+    if METRICS_DIR and time.monotonic() - _flushed_at >= FLUSH_INTERVAL:
+        try:
+            flush()
+        except OSError:
+            pass
+
+
+if ENABLED and METRICS_DIR:
+    atexit.register(flush)
+
+
+def _other_snapshots() -> List[Dict[str, Any]]:
+    if not METRICS_DIR or not os.path.isdir(METRICS_DIR):
+        return []
+    own = os.path.basename(_snapshot_path(os.getpid()))
+    snapshots = []
+    for name in sorted(os.listdir(METRICS_DIR)):
+        if name == own or not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(METRICS_DIR, name), encoding='utf-8') as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def merge(snapshots: List[Dict[str, Any]]) -> Dict[str, Any]:
+    merged: Dict[str, Any] = {}
+    for snapshot in snapshots:
+        for name, metric in snapshot.items():
+            target = merged.setdefault(name, dict(metric, values={}))
+            for key, value in metric['values']:
+                key = tuple(key)
+                if metric['type'] == 'histogram':
+                    total = target['values'].setdefault(key, [0] * len(value))
+                    for i, part in enumerate(value):
+                        total[i] += part
+                else:
+                    target['values'][key] = target['values'].get(key, 0) + value
+    return merged
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names: List[str], key: Tuple[str, ...], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, key)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render(snapshot: Dict[str, Any]) -> str:
+    lines = []
+    for name in sorted(snapshot):
+        metric = snapshot[name]
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        for key in sorted(metric['values']):
+            value = metric['values'][key]
+            if metric['type'] != 'histogram':
+                lines.append(f"{name}{_labels(metric['labels'], key)} {_number(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(metric['buckets'] + ['+Inf'], value[:-1]):
+                cumulative += count
+                le = 'le="%s"' % (bound if bound == '+Inf' else _number(bound))
+                lines.append(f"{name}_bucket{_labels(metric['labels'], key, le)} {cumulative}")
+            lines.append(f"{name}_sum{_labels(metric['labels'], key)} {_number(value[-1])}")
+            lines.append(f"{name}_count{_labels(metric['labels'], key)} {cumulative}")
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_response() -> Dict[str, Any]:
+    '''Body for GET ?action=metrics: this process, plus every other process's snapshot in METRICS_DIR'''
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+        'body': render(merge([registry.snapshot()] + _other_snapshots())),
+        'isBase64Encoded': False
+    }
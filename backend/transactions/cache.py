@@ -0,0 +1,96 @@
+'''
+Business: Ограниченный LRU-кэш с TTL для ответов тёплого экземпляра функции
+Args: размер, время жизни записи и функция ключа запроса
+Returns: декоратор cached_response для handler(), счётчики попаданий в заголовках X-Cache-*
+'''
+
+import functools
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from etag import request_etags
+from metrics import registry
+
+CACHE_LOOKUPS = registry.counter('handler_cache_lookups_total', 'In-process and HTTP cache lookups', ('cache', 'result'))
+
+
+class TTLCache:
+    def __init__(self, maxsize: int = 64, ttl: float = 10.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: 'OrderedDict[Hashable, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def cached_response(cache: TTLCache, key_func: Callable[[Dict[str, Any]], Optional[Hashable]]) -> Callable:
+    '''
+    GET-запросы с ключом отдаются из кэша без обращения к БД; любая успешная запись
+    через этот экземпляр сбрасывает кэш. Записи других экземпляров видны не позже чем через TTL.
+    '''
+    def decorator(handler: Callable) -> Callable:
+        @functools.wraps(handler)
+        def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+            method = event.get('httpMethod', 'GET')
+            if method != 'GET':
+                response = handler(event, context)
+                if method != 'OPTIONS' and response.get('statusCode') == 200:
+                    cache.invalidate()
+                return response
+
+            key = key_func(event.get('queryStringParameters') or {})
+            if key is None:
+                return handler(event, context)
+
+            cached = cache.get(key)
+            if cached is not None:
+                response = dict(cached, headers=dict(cached['headers']))
+                if response['headers'].get('ETag') in request_etags(event):
+                    response.update(statusCode=304, body='')
+                status = 'HIT'
+                CACHE_LOOKUPS.inc('response', 'hit')
+            else:
+                response = handler(event, context)
+                if response.get('statusCode') == 200:
+                    cache.put(key, dict(response, headers=dict(response.get('headers') or {})))
+                status = 'MISS'
+                CACHE_LOOKUPS.inc('response', 'miss')
+
+            response['headers'] = dict(response.get('headers') or {}, **{
+                'X-Cache': status,
+                'X-Cache-Hits': str(cache.hits),
+                'X-Cache-Misses': str(cache.misses),
+                'Access-Control-Expose-Headers': 'ETag, X-Cache, X-Cache-Hits, X-Cache-Misses'
+            })
+            return response
+        return wrapper
+    return decorator
@@ -1,10 +1,329 @@
+import base64
+import binascii
+import csv
+import io
 import json
+import math
 import os
-import psycopg2
+import random
 import urllib.request
-from typing import Dict, Any
+from typing import Dict, Any, Iterable, Iterator, List, Optional, TextIO, Tuple
 from datetime import datetime, timedelta
 
+from psycopg2.extras import execute_values
+
+from cache import TTLCache, cached_response
+from catalog import VERSION_SQL as CATALOG_VERSION_SQL, product_catalog
+from daterange import date_range
+from db import get_connection, release_connection
+from etag import conditional_get
+from sqltrace import dumps, traced_request
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 1000
+# Rows per response of a ?since= delta; the first sync is only the latest page, older rows
+# come through the list endpoint from older_cursor
+SYNC_PAGE_SIZE = MAX_PAGE_SIZE
+MAX_IMPORT_ROWS = 10000
+# Column limits of transactions, checked per row so one bad field fails its row and not the batch
+IMPORT_STATUSES = ('completed', 'pending', 'failed')
+IMPORT_TEXT_LIMITS = (('client_telegram', 255), ('client_name', 255))
+MAX_AMOUNT = 10 ** 8  # NUMERIC(10, 2)
+EXPORT_PAGE_SIZE = 10000
+MAX_EXPORT_PAGE_SIZE = 20000
+EXPORT_ITERSIZE = 2000
+EXPORT_FIELDS = (
+    'id', 'transaction_code', 'product_id', 'product_name', 'client_telegram', 'client_name',
+    'amount', 'cost_price', 'profit', 'status', 'transaction_date', 'notes', 'currency'
+)
+
+STATS_CACHE = TTLCache(
+    maxsize=int(os.environ.get('STATS_CACHE_SIZE', 64)),
+    ttl=float(os.environ.get('STATS_CACHE_TTL', 10))
+)
+
+def stats_cache_key(params: Dict[str, Any]) -> Optional[Tuple]:
+    if params.get('action') != 'stats':
+        return None
+    date_filter = params.get('date_filter', 'month')
+    custom = date_filter == 'custom'
+    return (
+        date_filter,
+        params.get('start_date') if custom else None,
+        params.get('end_date') if custom else None,
+        datetime.now().date()
+    )
+
+def parse_count(value: Any, default: int, name: str, minimum: int = 1) -> int:
+    if value is None or value == '':
+        return default
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        number = minimum - 1
+    if number < minimum:
+        raise ValueError(f'{name} must be an integer of at least {minimum}')
+    return number
+
+def encode_cursor(transaction_date: Optional[datetime], transaction_id: int) -> str:
+    raw = json.dumps([transaction_date.isoformat() if transaction_date else None, transaction_id])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor: str) -> Tuple[Optional[datetime], int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        date_str, transaction_id = json.loads(raw)
+        return (datetime.fromisoformat(date_str) if date_str else None), int(transaction_id)
+    except (TypeError, ValueError, binascii.Error):
+        raise ValueError('Invalid cursor')
+
+def transaction_to_dict(row: Tuple) -> Dict[str, Any]:
+    date_value = row[10]
+    if date_value:
+        if hasattr(date_value, 'date'):
+            date_str = date_value.date().isoformat()
+        else:
+            date_str = date_value.isoformat()
+    else:
+        date_str = None
+    
+    return {
+        'id': row[0],
+        'transaction_code': row[1],
+        'product_id': row[2],
+        'product_name': row[3],
+        'client_telegram': row[4],
+        'client_name': row[5],
+        'amount': float(row[6]),
+        'cost_price': float(row[7]),
+        'profit': float(row[8]),
+        'status': row[9],
+        'transaction_date': date_str,
+        'notes': row[11],
+        'currency': row[12] if len(row) > 12 else 'RUB'
+    }
+
+def price_transaction(product: Tuple, currency: str, custom_amount: Any, custom_cost_price: Any) -> Tuple[float, float]:
+    cost_price_rub = float(product[0])
+    sale_price_rub = float(product[1])
+    cost_price_usd = float(product[2]) if product[2] else None
+    sale_price_usd = float(product[3]) if product[3] else None
+    
+    if custom_cost_price is not None:
+        cost_price = float(custom_cost_price)
+    elif currency == 'USD':
+        if sale_price_usd is not None:
+            cost_price = cost_price_usd if cost_price_usd is not None else 0
+        else:
+            cost_price = cost_price_rub
+    else:
+        cost_price = cost_price_rub
+    
+    if currency == 'USD':
+        if sale_price_usd is not None:
+            sale_price = float(custom_amount) if custom_amount else sale_price_usd
+        else:
+            sale_price = float(custom_amount) if custom_amount else sale_price_rub
+    else:
+        sale_price = float(custom_amount) if custom_amount else sale_price_rub
+    
+    return sale_price, cost_price
+
+def parse_import_rows(body_data: Dict[str, Any]) -> List[Any]:
+    if body_data.get('csv') is not None:
+        reader = csv.DictReader(io.StringIO(body_data['csv']))
+        return [
+            {key.strip(): (value.strip() or None) if isinstance(value, str) else value
+             for key, value in row.items() if key}
+            for row in reader
+        ]
+    rows = body_data.get('transactions')
+    if not isinstance(rows, list):
+        raise ValueError('Expected transactions array or csv text')
+    return rows
+
+def prepare_import_row(row: Any, products: Dict[int, Tuple], batch_code: str, index: int) -> Tuple:
+    if not isinstance(row, dict):
+        raise ValueError('Row must be an object')
+    try:
+        product_id = int(row.get('product_id'))
+    except (TypeError, ValueError):
+        raise ValueError('Invalid product_id')
+    product = products.get(product_id)
+    if product is None:
+        raise ValueError('Product not found')
+    
+    currency = row.get('currency') or 'RUB'
+    if currency not in ('RUB', 'USD'):
+        raise ValueError('Unsupported currency')
+    
+    transaction_date = row.get('transaction_date') or datetime.now().strftime('%Y-%m-%d')
+    try:
+        datetime.fromisoformat(str(transaction_date))
+    except ValueError:
+        raise ValueError('Invalid transaction_date')
+    
+    try:
+        sale_price, cost_price = price_transaction(product, currency, row.get('custom_amount'), row.get('custom_cost_price'))
+    except (TypeError, ValueError):
+        raise ValueError('Invalid custom_amount or custom_cost_price')
+    for amount in (sale_price, cost_price, sale_price - cost_price):
+        if not math.isfinite(amount) or abs(round(amount, 2)) >= MAX_AMOUNT:
+            raise ValueError('Amount out of range')
+    
+    status = row.get('status') or 'completed'
+    if status not in IMPORT_STATUSES:
+        raise ValueError('Unsupported status')
+    for field, limit in IMPORT_TEXT_LIMITS:
+        if len(str(row.get(field) or '')) > limit:
+            raise ValueError(f'{field} is longer than {limit} characters')
+    if any('\x00' in str(row.get(field) or '') for field in ('client_telegram', 'client_name', 'notes')):
+        raise ValueError('Text fields cannot contain NUL characters')
+    
+    return (
+        f'TX-{batch_code}-{index:05d}', product_id, str(row.get('client_telegram') or ''), str(row.get('client_name') or ''),
+        sale_price, cost_price, sale_price - cost_price, status, str(row.get('notes') or ''),
+        currency, transaction_date
+    )
+
+def import_transactions(cur, rows: List[Any]) -> List[Dict[str, Any]]:
+    '''
+    Цены всех товаров пакета читаются одним запросом, валидные строки вставляются
+    одним INSERT в текущей транзакции; ошибки возвращаются по номеру строки.
+    '''
+    product_ids = set()
+    for row in rows:
+        try:
+            product_ids.add(int(row.get('product_id')))
+        except (AttributeError, TypeError, ValueError):
+            pass
+    
+    cur.execute(
+        "SELECT id, cost_price, sale_price, cost_price_usd, sale_price_usd FROM products WHERE id = ANY(%s)",
+        (list(product_ids),)
+    )
+    products = {product[0]: product[1:] for product in cur.fetchall()}
+    
+    batch_code = datetime.now().strftime('%Y%m%d%H%M%S') + '-' + str(random.randint(1000, 9999))
+    results: List[Dict[str, Any]] = []
+    values = []
+    for index, row in enumerate(rows):
+        try:
+            values.append(prepare_import_row(row, products, batch_code, index))
+            results.append({'row': index})
+        except ValueError as e:
+            results.append({'row': index, 'error': str(e)})
+    
+    if values:
+        # With the flag on, the rollup, client_stats and group revenue triggers run once per
+        # statement (V0029), so the whole batch goes out as one INSERT; SET LOCAL ends with the transaction
+        cur.execute("SET LOCAL digital_goods.batch_insert = on")
+        inserted = execute_values(
+            cur,
+            """INSERT INTO transactions (transaction_code, product_id, client_telegram, client_name, amount, cost_price, profit, status, notes, currency, transaction_date)
+               VALUES %s RETURNING transaction_code, id""",
+            values,
+            page_size=MAX_IMPORT_ROWS,
+            fetch=True
+        )
+        ids = dict(inserted)
+        codes = iter(value[0] for value in values)
+        for result in results:
+            if 'error' not in result:
+                code = next(codes)
+                result.update(transaction_id=ids[code], transaction_code=code)
+    
+    return results
+
+def export_filters(params: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    conditions = ['t.id > %(after_id)s']
+    args: Dict[str, Any] = {}
+    try:
+        args['after_id'] = int(params.get('after_id') or 0)
+        if params.get('product_id'):
+            args['product_id'] = int(params['product_id'])
+            conditions.append('t.product_id = %(product_id)s')
+    except ValueError:
+        raise ValueError('after_id and product_id must be integers')
+    try:
+        date_from = datetime.strptime(params['date_from'], '%Y-%m-%d').date() if params.get('date_from') else None
+        date_to = datetime.strptime(params['date_to'], '%Y-%m-%d').date() if params.get('date_to') else None
+    except ValueError:
+        raise ValueError('date_from and date_to must be YYYY-MM-DD')
+    date_conditions, date_params = date_range('t."transaction_date"', date_from, date_to, 'export')
+    conditions.extend(date_conditions)
+    args.update(date_params)
+    for column in ('status', 'currency'):
+        if params.get(column):
+            args[column] = params[column]
+            conditions.append(f't.{column} = %({column})s')
+    return ' AND '.join(conditions), args
+
+def iter_export_rows(conn, where: str, args: Dict[str, Any], limit: int) -> Iterator[Tuple]:
+    # Server-side cursor: at most EXPORT_ITERSIZE rows are held in memory at a time
+    cur = conn.cursor(name='transactions_export')
+    cur.itersize = EXPORT_ITERSIZE
+    try:
+        cur.execute(f'''
+            SELECT t.id, t.transaction_code, t.product_id, p.name, t.client_telegram, 
+                   t.client_name, t.amount, t.cost_price, t.profit, t.status, 
+                   t."transaction_date", t.notes, t.currency
+            FROM transactions t
+            LEFT JOIN products p ON t.product_id = p.id
+            WHERE {where}
+            ORDER BY t.id
+            LIMIT %(limit)s
+        ''', dict(args, limit=limit))
+        yield from cur
+    finally:
+        cur.close()
+
+def write_export(out: TextIO, rows: Iterable[Tuple], fmt: str) -> Tuple[int, Optional[int]]:
+    writer = csv.writer(out) if fmt == 'csv' else None
+    if writer:
+        writer.writerow(EXPORT_FIELDS)
+    count, last_id = 0, None
+    for row in rows:
+        record = transaction_to_dict(row)
+        if writer:
+            writer.writerow([record[field] for field in EXPORT_FIELDS])
+        else:
+            out.write(json.dumps(record, ensure_ascii=False) + '\n')
+        count += 1
+        last_id = row[0]
+    return count, last_id
+
+def encode_sync_cursor(xmin: int, until: Optional[int] = None,
+                       after: Optional[Tuple[Optional[datetime], int]] = None) -> str:
+    payload: Dict[str, Any] = {'xid': int(xmin)}
+    if after is not None:
+        # A continuation: the same delta, resumed after the last row sent, and the cursor to hand out when it ends
+        payload['until'] = int(until)
+        payload['after'] = [after[0].isoformat() if after[0] else None, after[1]]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_sync_cursor(cursor: str) -> Tuple[int, Optional[int], Optional[Tuple[Optional[datetime], int]]]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        after = None
+        if 'after' in payload:
+            date_str, transaction_id = payload['after']
+            after = (datetime.fromisoformat(date_str) if date_str else None), int(transaction_id)
+            return int(payload['xid']), int(payload['until']), after
+        return int(payload['xid']), None, None
+    except (TypeError, ValueError, KeyError, AttributeError, binascii.Error):
+        raise ValueError('Invalid cursor')
+
+def keyset_condition(cursor_date: Optional[datetime]) -> str:
+    # NULL dates sort first in DESC order, so a NULL-dated cursor still has every dated row after it
+    if cursor_date is None:
+        return '(t."transaction_date" IS NULL AND t.id < %(cursor_id)s) OR t."transaction_date" IS NOT NULL'
+    return '(t."transaction_date", t.id) < (%(cursor_date)s, %(cursor_id)s)'
+
+@traced_request
+@cached_response(STATS_CACHE, stats_cache_key)
+@conditional_get('transactions', 'products', 'expenses', 'expense_daily_allocation', 'exchange_rates')
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: Управление транзакциями и аналитика
@@ -19,419 +338,429 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type',
+                'Access-Control-Allow-Headers': 'Content-Type, If-None-Match',
                 'Access-Control-Max-Age': '86400'
             },
             'body': '',
             'isBase64Encoded': False
         }
     
-    dsn = os.environ.get('DATABASE_URL')
-    conn = psycopg2.connect(dsn)
-    cur = conn.cursor()
-    
-    if method == 'GET':
-        params = event.get('queryStringParameters', {})
-        action = params.get('action', 'list')
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
         
-        if action == 'stats':
-            date_filter = params.get('date_filter', 'month')
-            start_date = params.get('start_date')
-            end_date = params.get('end_date')
-            exchange_rate = float(params.get('exchange_rate', 82))
+        if method == 'GET':
+            params = event.get('queryStringParameters', {})
+            action = params.get('action', 'list')
             
-            if date_filter == 'today':
-                today = datetime.now().date()
-                date_condition = f'AND "transaction_date"::date = \'{today.isoformat()}\''
-            elif date_filter == 'week':
-                today = datetime.now().date()
-                week_start = today - timedelta(days=today.weekday())
-                date_condition = f'AND "transaction_date"::date >= \'{week_start.isoformat()}\''
-            elif date_filter == 'month':
+            if action == 'stats':
+                date_filter = params.get('date_filter', 'month')
+                start_date = params.get('start_date')
+                end_date = params.get('end_date')
                 today = datetime.now().date()
-                month_start = today.replace(day=1)
-                date_condition = f'AND "transaction_date"::date >= \'{month_start.isoformat()}\''
-            elif date_filter == 'custom' and start_date and end_date:
-                date_condition = f'AND "transaction_date"::date BETWEEN \'{start_date}\' AND \'{end_date}\''
-            elif date_filter == 'all':
-                date_condition = ""
-            else:
-                date_condition = ""
-            
-            cur.execute(f"""
-                SELECT 
-                    COUNT(*) as total_transactions,
-                    SUM(CASE WHEN currency = 'USD' THEN amount * {exchange_rate} ELSE amount END) as total_revenue,
-                    SUM(CASE WHEN currency = 'USD' THEN cost_price * {exchange_rate} ELSE cost_price END) as total_costs,
-                    SUM(CASE WHEN currency = 'USD' THEN profit * {exchange_rate} ELSE profit END) as total_profit,
-                    COUNT(CASE WHEN status = 'completed' THEN 1 END) as completed_count,
-                    COUNT(CASE WHEN status = 'pending' THEN 1 END) as pending_count,
-                    COUNT(CASE WHEN status = 'failed' THEN 1 END) as failed_count
-                FROM transactions
-                WHERE status = 'completed' {date_condition}
-            """)
-            stats = cur.fetchone()
-            
-            expenses_count = 0
-            if date_filter == 'all':
-                cur.execute("""
-                    SELECT COUNT(*) FROM expenses 
-                    WHERE status = 'active'
-                """)
-                exp_count = cur.fetchone()
-                expenses_count = exp_count[0] if exp_count else 0
-            elif date_condition:
-                cur.execute(f"""
-                    SELECT COUNT(*) FROM expenses 
-                    WHERE status = 'active'
-                    {date_condition.replace('transaction_date', 'start_date')}
-                """)
-                exp_count = cur.fetchone()
-                expenses_count = exp_count[0] if exp_count else 0
-            
-            total_expenses = 0
-            filter_start = None
-            filter_end = None
-            
-            if date_filter == 'all':
-                cur.execute("""
-                    SELECT MIN("transaction_date"::date), MAX("transaction_date"::date)
-                    FROM transactions
-                    WHERE status = 'completed'
-                """)
-                date_range = cur.fetchone()
-                if date_range and date_range[0] and date_range[1]:
-                    filter_start = date_range[0].isoformat()
-                    filter_end = date_range[1].isoformat()
-            elif date_filter == 'today':
-                filter_start = filter_end = today.isoformat()
-            elif date_filter == 'week':
-                filter_start = week_start.isoformat()
-                filter_end = today.isoformat()
-            elif date_filter == 'month':
-                filter_start = month_start.isoformat()
-                filter_end = today.isoformat()
-            elif date_filter == 'custom' and start_date and end_date:
-                filter_start = start_date
-                filter_end = end_date
-            
-            if filter_start and filter_end:
-                cur.execute(f"""
-                    SELECT e.amount, e.start_date, e.end_date, e.distribution_type, e.currency
-                    FROM expenses e
-                    WHERE e.status = 'active'
-                    AND e.start_date <= '{filter_end}'
-                    AND (e.end_date IS NULL OR e.end_date >= '{filter_start}')
-                """)
-                expenses_for_period = cur.fetchall()
                 
-                for exp in expenses_for_period:
-                    amount = float(exp[0])
-                    exp_start = exp[1]
-                    exp_end = exp[2]
-                    dist_type = exp[3]
-                    currency = exp[4] if len(exp) > 4 and exp[4] else 'RUB'
-                    
-                    if currency == 'USD':
-                        amount = amount * exchange_rate
-                    
-                    if dist_type == 'one_time':
-                        exp_date_str = exp_start.isoformat()
-                        if filter_start <= exp_date_str <= filter_end:
-                            total_expenses += amount
-                    else:
-                        actual_start = max(datetime.strptime(filter_start, '%Y-%m-%d').date(), exp_start)
-                        actual_end = min(datetime.strptime(filter_end, '%Y-%m-%d').date(), exp_end) if exp_end else datetime.strptime(filter_end, '%Y-%m-%d').date()
-                        
-                        total_period_days = (exp_end - exp_start).days + 1 if exp_end else 365
-                        filter_period_days = (actual_end - actual_start).days + 1
-                        
-                        if filter_period_days > 0:
-                            total_expenses += (amount / total_period_days) * filter_period_days
-            
-            cur.execute(f"""
-                SELECT p.name, COUNT(*) as sales_count, 
-                    SUM(CASE WHEN t.currency = 'USD' THEN t.profit * {exchange_rate} ELSE t.profit END) as total_profit, 
-                    SUM(CASE WHEN t.currency = 'USD' THEN t.amount * {exchange_rate} ELSE t.amount END) as total_revenue
-                FROM transactions t
-                LEFT JOIN products p ON t.product_id = p.id
-                WHERE t.status = 'completed' {date_condition}
-                GROUP BY p.name
-                ORDER BY total_profit DESC
-            """)
-            product_stats = cur.fetchall()
-            
-            if date_filter == 'all':
-                cur.execute("""
-                    SELECT MIN("transaction_date"::date), MAX("transaction_date"::date)
-                    FROM transactions WHERE status = 'completed'
-                """)
-                date_range = cur.fetchone()
-                if date_range and date_range[0] and date_range[1]:
-                    chart_start = date_range[0]
-                    chart_end = date_range[1]
-                else:
-                    chart_start = chart_end = datetime.now().date()
-            elif date_filter == 'today':
+                # sales_start/sales_end filter the aggregates, chart_start/chart_end bound the daily series;
+                # a NULL chart bound for 'all' is resolved in SQL from the first/last sale day
+                sales_start = sales_end = None
                 chart_start = chart_end = today
-            elif date_filter == 'week':
-                chart_start = week_start
-                chart_end = today
-            elif date_filter == 'month':
-                chart_start = month_start
-                chart_end = today
-            elif date_filter == 'custom' and start_date and end_date:
-                chart_start = datetime.strptime(start_date, '%Y-%m-%d').date()
-                chart_end = datetime.strptime(end_date, '%Y-%m-%d').date()
-            else:
-                chart_start = chart_end = datetime.now().date()
-            
-            days_count = (chart_end - chart_start).days + 1
-            all_dates = [(chart_start + timedelta(days=i)).isoformat() for i in range(days_count)]
-            
-            cur.execute(f"""
-                SELECT "transaction_date"::date as date, COUNT(*) as count, 
-                    SUM(CASE WHEN currency = 'USD' THEN profit * {exchange_rate} ELSE profit END) as profit, 
-                    SUM(CASE WHEN currency = 'USD' THEN amount * {exchange_rate} ELSE amount END) as revenue
-                FROM transactions
-                WHERE status = 'completed' {date_condition}
-                GROUP BY "transaction_date"::date
-            """)
-            daily_stats_raw = cur.fetchall()
-            
-            product_analytics = []
-            for row in product_stats:
-                product_analytics.append({
-                    'name': row[0],
-                    'sales_count': row[1],
-                    'total_profit': float(row[2]) if row[2] else 0,
-                    'total_revenue': float(row[3]) if row[3] else 0
+                period_known = True
+                if date_filter == 'today':
+                    sales_start = sales_end = today
+                elif date_filter == 'week':
+                    sales_start = chart_start = today - timedelta(days=today.weekday())
+                elif date_filter == 'month':
+                    sales_start = chart_start = today.replace(day=1)
+                elif date_filter == 'custom' and start_date and end_date:
+                    try:
+                        sales_start = chart_start = datetime.strptime(start_date, '%Y-%m-%d').date()
+                        sales_end = chart_end = datetime.strptime(end_date, '%Y-%m-%d').date()
+                    except ValueError:
+                        sales_start = sales_end = None
+                    if sales_start is None or sales_start > sales_end:
+                        return {
+                            'statusCode': 400,
+                            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                            'body': json.dumps({'error': 'start_date and end_date must be YYYY-MM-DD with start_date <= end_date'}),
+                            'isBase64Encoded': False
+                        }
+                elif date_filter == 'all':
+                    chart_start = chart_end = None
+                else:
+                    period_known = False
+                
+                # Open-ended expenses are laid out only as far as someone has asked: extend them to the
+                # end of the chart before it reads expense_daily_allocation ('all' ends at the last sale day)
+                cur.execute("""
+                    SELECT extend_expense_allocations(COALESCE(%s::date, GREATEST(%s::date,
+                        (SELECT MAX(day) FROM daily_sales_rollup WHERE status = 'completed'))))
+                """, (chart_end, today))
+                conn.commit()
+                
+                sales_conditions, sales_params = date_range('day', sales_start, sales_end, 'sales')
+                expense_conditions, expense_params = date_range('start_date', sales_start, sales_end, 'expense')
+                sales_condition = ''.join(' AND ' + condition for condition in sales_conditions)
+                expense_condition = ''.join(' AND ' + condition for condition in expense_conditions)
+                
+                cur.execute(f"""
+                    WITH span AS (
+                        SELECT MIN(day) AS first_day, MAX(day) AS last_day
+                        FROM daily_sales_rollup
+                        WHERE status = 'completed'
+                    ),
+                    chart AS (
+                        SELECT 
+                            COALESCE(%(chart_start)s::date, span.first_day, %(today)s::date) AS chart_start,
+                            COALESCE(%(chart_end)s::date, span.last_day, %(today)s::date) AS chart_end,
+                            span.first_day IS NOT NULL AS has_sales
+                        FROM span
+                    ),
+                    rates AS (
+                        -- USD/RUB rate of each day the filtered sales or the chart cover; an open side of
+                        -- the sales filter ends at the first/last sale day
+                        SELECT r.day, r.rate
+                        FROM span, chart,
+                            usd_rub_rate_series(LEAST(COALESCE(%(rates_start)s::date, span.first_day), chart.chart_start),
+                                                GREATEST(COALESCE(%(rates_end)s::date, span.last_day), chart.chart_end)) AS r
+                    ),
+                    converted AS (
+                        SELECT d.day, d.product_id, d.status, d.tx_count,
+                            CASE WHEN d.currency = 'USD' THEN d.revenue * rates.rate ELSE d.revenue END AS revenue,
+                            CASE WHEN d.currency = 'USD' THEN d.cost * rates.rate ELSE d.cost END AS cost,
+                            CASE WHEN d.currency = 'USD' THEN d.profit * rates.rate ELSE d.profit END AS profit
+                        FROM (
+                            SELECT * FROM daily_sales_rollup
+                            WHERE status = 'completed' {sales_condition}
+                        ) d
+                        JOIN rates ON rates.day = d.day
+                    ),
+                    totals AS (
+                        SELECT 
+                            COALESCE(SUM(tx_count), 0) AS total_transactions,
+                            SUM(revenue) AS total_revenue,
+                            SUM(cost) AS total_costs,
+                            SUM(profit) AS total_profit,
+                            COALESCE(SUM(CASE WHEN status = 'completed' THEN tx_count END), 0) AS completed_count,
+                            COALESCE(SUM(CASE WHEN status = 'pending' THEN tx_count END), 0) AS pending_count,
+                            COALESCE(SUM(CASE WHEN status = 'failed' THEN tx_count END), 0) AS failed_count
+                        FROM converted
+                    ),
+                    allocated AS (
+                        SELECT a.day,
+                            SUM(CASE WHEN a.currency = 'USD' THEN a.amount * rates.rate ELSE a.amount END) AS expenses
+                        FROM chart, expense_daily_allocation a
+                        JOIN expenses e ON e.id = a.expense_id
+                        JOIN rates ON rates.day = a.day
+                        WHERE a.day BETWEEN chart.chart_start AND chart.chart_end
+                        AND e.status = 'active'
+                        GROUP BY a.day
+                    ),
+                    daily AS (
+                        SELECT g.day::date AS day,
+                            COALESCE(SUM(c.tx_count), 0) AS count,
+                            COALESCE(SUM(c.profit), 0) AS profit,
+                            COALESCE(SUM(c.revenue), 0) AS revenue,
+                            COALESCE(MAX(al.expenses), 0) AS expenses
+                        FROM chart
+                        CROSS JOIN LATERAL generate_series(chart.chart_start, chart.chart_end, interval '1 day') AS g(day)
+                        LEFT JOIN converted c ON c.day = g.day::date
+                        LEFT JOIN allocated al ON al.day = g.day::date
+                        GROUP BY g.day
+                    ),
+                    product_totals AS (
+                        SELECT p.name, SUM(c.tx_count) AS sales_count,
+                            SUM(c.profit) AS total_profit,
+                            SUM(c.revenue) AS total_revenue
+                        FROM converted c
+                        LEFT JOIN products p ON c.product_id = p.id
+                        GROUP BY p.name
+                    )
+                    SELECT 
+                        totals.*,
+                        (SELECT COUNT(*) FROM expenses
+                         WHERE status = 'active' {expense_condition}) AS expenses_count,
+                        chart.has_sales,
+                        (SELECT COALESCE(json_agg(json_build_object(
+                            'name', name, 'sales_count', sales_count,
+                            'total_profit', COALESCE(total_profit, 0), 'total_revenue', COALESCE(total_revenue, 0)
+                         ) ORDER BY total_profit DESC), '[]') FROM product_totals) AS product_analytics,
+                        (SELECT COALESCE(SUM(expenses), 0) FROM allocated) AS period_expenses,
+                        (SELECT COALESCE(json_agg(json_build_array(day, count, profit, revenue, expenses) ORDER BY day), '[]')
+                         FROM daily) AS daily_sales
+                    FROM totals, chart
+                """, {
+                    'rates_start': sales_start,
+                    'rates_end': sales_end,
+                    **sales_params,
+                    **expense_params,
+                    'chart_start': chart_start,
+                    'chart_end': chart_end,
+                    'today': today
                 })
-            
-            daily_map = {}
-            for row in daily_stats_raw:
-                daily_map[row[0].isoformat()] = {
-                    'count': row[1],
-                    'profit': float(row[2]) if row[2] else 0,
-                    'revenue': float(row[3]) if row[3] else 0
-                }
-            
-            cur.execute(f"""
-                SELECT amount, start_date, end_date, distribution_type, currency
-                FROM expenses
-                WHERE status = 'active'
-                AND start_date <= '{chart_end.isoformat()}'
-                AND (end_date IS NULL OR end_date >= '{chart_start.isoformat()}')
-            """)
-            expenses_data = cur.fetchall()
-            
-            daily_expenses = {}
-            for exp in expenses_data:
-                amount = float(exp[0])
-                exp_start = exp[1]
-                exp_end = exp[2]
-                dist_type = exp[3]
-                currency = exp[4] if len(exp) > 4 and exp[4] else 'RUB'
+                (total_count, total_revenue, transaction_costs, _, completed_count, pending_count, failed_count,
+                 expenses_count, has_sales, product_analytics, period_expenses, daily_sales) = cur.fetchone()
                 
-                if currency == 'USD':
-                    amount = amount * exchange_rate
+                if not period_known:
+                    expenses_count = 0
                 
-                if dist_type == 'one_time':
-                    date_key = exp_start.isoformat()
-                    if chart_start <= exp_start <= chart_end:
-                        daily_expenses[date_key] = daily_expenses.get(date_key, 0) + amount
-                else:
-                    actual_start = max(chart_start, exp_start)
-                    actual_end = min(chart_end, exp_end) if exp_end else chart_end
-                    total_days = (exp_end - exp_start).days + 1 if exp_end else 365
-                    daily_amount = amount / total_days
-                    
-                    days_in_range = (actual_end - actual_start).days + 1
-                    for i in range(days_in_range):
-                        date_key = (actual_start + timedelta(days=i)).isoformat()
-                        daily_expenses[date_key] = daily_expenses.get(date_key, 0) + daily_amount
-            
-            daily_analytics = []
-            for date_str in all_dates:
-                day_expenses = round(daily_expenses.get(date_str, 0), 2)
-                if date_str in daily_map:
-                    day_profit = daily_map[date_str]['profit']
+                total_expenses = 0
+                if period_known and (date_filter != 'all' or has_sales):
+                    total_expenses = float(period_expenses)
+                
+                daily_analytics = []
+                for day, count, day_profit, day_revenue, day_expenses in daily_sales:
+                    day_expenses = round(day_expenses, 2)
                     daily_analytics.append({
-                        'date': date_str,
-                        'count': daily_map[date_str]['count'],
+                        'date': day,
+                        'count': count,
                         'profit': day_profit,
-                        'revenue': daily_map[date_str]['revenue'],
+                        'revenue': day_revenue,
                         'expenses': day_expenses,
                         'net_profit': round(day_profit - day_expenses, 2)
                     })
+                
+                revenue = float(total_revenue) if total_revenue else 0
+                transaction_costs = float(transaction_costs) if transaction_costs else 0
+                total_costs_with_expenses = transaction_costs + total_expenses
+                total_profit_adjusted = revenue - total_costs_with_expenses
+                
+                total_transaction_count = total_count + expenses_count
+                
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': dumps({
+                        'total_transactions': total_transaction_count,
+                        'total_revenue': revenue,
+                        'total_costs': total_costs_with_expenses,
+                        'total_profit': total_profit_adjusted,
+                        'completed_count': completed_count,
+                        'pending_count': pending_count,
+                        'failed_count': failed_count,
+                        'expenses_count': expenses_count,
+                        'product_analytics': product_analytics,
+                        'daily_analytics': daily_analytics
+                    }),
+                    'isBase64Encoded': False
+                }
+            if 'since' in params:
+                since = params.get('since')
+                try:
+                    since_xid, until_xid, after = decode_sync_cursor(since) if since else (0, None, None)
+                except ValueError:
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': 'Invalid cursor'}),
+                        'isBase64Encoded': False
+                    }
+                
+                # One statement, one snapshot: the returned xmin is the next cursor, and every
+                # transaction below it is already reflected in the rows read here. The first sync
+                # is the latest page plus older_cursor for the list endpoint. A delta larger than
+                # a page goes out in keyset pages; the xmin of the first page stays the target,
+                # and rows changed while the client pages come again in the next delta.
+                cursor_date, cursor_id = after if after is not None else (None, None)
+                page_condition = f'AND ({keyset_condition(cursor_date)})' if after is not None else ''
+                cur.execute(f'''
+                    WITH snapshot AS (
+                        SELECT pg_snapshot_xmin(pg_current_snapshot()) AS xmin
+                    ),
+                    changed AS (
+                        SELECT t.id, t.transaction_code, t.product_id, p.name, t.client_telegram, 
+                               t.client_name, t.amount, t.cost_price, t.profit, t.status, 
+                               t."transaction_date", t.notes, t.currency
+                        FROM transactions t
+                        LEFT JOIN products p ON t.product_id = p.id
+                        WHERE t.change_xid >= %(since)s::text::xid8 {page_condition}
+                        ORDER BY t."transaction_date" DESC, t.id DESC
+                        LIMIT %(limit)s
+                    )
+                    SELECT snapshot.xmin::text,
+                        (SELECT COALESCE(array_agg(DISTINCT d.transaction_id), '{{}}')
+                         FROM transaction_deletions d
+                         WHERE %(since)s > 0 AND %(first_page)s AND d.change_xid >= %(since)s::text::xid8) AS deleted,
+                        (SELECT value::numeric FROM app_settings WHERE key = 'transaction_sync_horizon') AS horizon,
+                        changed.*
+                    FROM snapshot
+                    LEFT JOIN changed ON true
+                    ORDER BY changed."transaction_date" DESC, changed.id DESC
+                ''', {'since': since_xid, 'first_page': after is None, 'cursor_date': cursor_date,
+                      'cursor_id': cursor_id, 'limit': SYNC_PAGE_SIZE + 1})
+                rows = cur.fetchall()
+                
+                # Deletions up to the horizon are pruned from the log: an older cursor could miss some
+                horizon = rows[0][2]
+                if since_xid and horizon is not None and since_xid <= horizon:
+                    return {
+                        'statusCode': 410,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': 'Cursor is older than the sync window, start over with since=',
+                                            'resync': True}),
+                        'isBase64Encoded': False
+                    }
+                
+                target_xid = until_xid if until_xid is not None else int(rows[0][0])
+                changed_rows = [row[3:] for row in rows if row[3] is not None]
+                has_more = len(changed_rows) > SYNC_PAGE_SIZE
+                older_cursor = None
+                if has_more:
+                    changed_rows = changed_rows[:SYNC_PAGE_SIZE]
+                if has_more and not since_xid:
+                    # The first sync stops after the latest page
+                    older_cursor = encode_cursor(changed_rows[-1][10], changed_rows[-1][0])
+                    has_more = False
+                if has_more:
+                    next_cursor = encode_sync_cursor(since_xid, target_xid, (changed_rows[-1][10], changed_rows[-1][0]))
                 else:
-                    daily_analytics.append({
-                        'date': date_str,
-                        'count': 0,
-                        'profit': 0,
-                        'revenue': 0,
-                        'expenses': day_expenses,
-                        'net_profit': round(-day_expenses, 2)
-                    })
+                    next_cursor = encode_sync_cursor(target_xid)
+                
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': dumps({
+                        'transactions': [transaction_to_dict(row) for row in changed_rows],
+                        'deleted': rows[0][1],
+                        'next_cursor': next_cursor,
+                        'has_more': has_more,
+                        'older_cursor': older_cursor
+                    }),
+                    'isBase64Encoded': False
+                }
             
-            cur.close()
-            conn.close()
+            if action == 'export':
+                export_format = params.get('format', 'csv')
+                try:
+                    if export_format not in ('csv', 'ndjson'):
+                        raise ValueError('Unsupported export format')
+                    where, args = export_filters(params)
+                    page_size = parse_count(params.get('page_size'), EXPORT_PAGE_SIZE, 'page_size')
+                    if page_size > MAX_EXPORT_PAGE_SIZE:
+                        raise ValueError(f'page_size must be at most {MAX_EXPORT_PAGE_SIZE}')
+                except ValueError as e:
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': str(e)}),
+                        'isBase64Encoded': False
+                    }
+                
+                out = io.StringIO()
+                exported, last_id = write_export(out, iter_export_rows(conn, where, args, page_size), export_format)
+                
+                headers = {
+                    'Content-Type': 'text/csv; charset=utf-8' if export_format == 'csv' else 'application/x-ndjson',
+                    'Content-Disposition': f'attachment; filename="transactions.{export_format}"',
+                    'Access-Control-Allow-Origin': '*',
+                    'Access-Control-Expose-Headers': 'X-Next-After-Id'
+                }
+                # A full page may have a continuation: the client repeats the request with after_id
+                if exported == page_size:
+                    headers['X-Next-After-Id'] = str(last_id)
+                
+                return {
+                    'statusCode': 200,
+                    'headers': headers,
+                    'body': out.getvalue(),
+                    'isBase64Encoded': False
+                }
             
-            transaction_costs = float(stats[2]) if stats[2] else 0
-            total_costs_with_expenses = transaction_costs + total_expenses
-            revenue = float(stats[1]) if stats[1] else 0
-            total_profit_adjusted = revenue - total_costs_with_expenses
+            cursor = params.get('cursor')
+            try:
+                page_size = min(parse_count(params.get('page_size') or params.get('limit'), DEFAULT_PAGE_SIZE, 'page_size'), MAX_PAGE_SIZE)
+                offset = parse_count(params.get('offset'), 0, 'offset', minimum=0)
+                if cursor:
+                    cursor_date, cursor_id = decode_cursor(cursor)
+            except ValueError as e:
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': str(e)}),
+                    'isBase64Encoded': False
+                }
             
-            total_transaction_count = (stats[0] or 0) + expenses_count
+            if cursor:
+                page_condition = 'WHERE ' + keyset_condition(cursor_date)
+                offset = 0
+            else:
+                cursor_date = cursor_id = None
+                page_condition = ''
+            
+            cur.execute(f'''
+                SELECT t.id, t.transaction_code, t.product_id, p.name, t.client_telegram, 
+                       t.client_name, t.amount, t.cost_price, t.profit, t.status, 
+                       t."transaction_date", t.notes, t.currency
+                FROM transactions t
+                LEFT JOIN products p ON t.product_id = p.id
+                {page_condition}
+                ORDER BY t."transaction_date" DESC, t.id DESC
+                LIMIT %(limit)s OFFSET %(offset)s
+            ''', {'cursor_date': cursor_date, 'cursor_id': cursor_id, 'limit': page_size + 1, 'offset': offset})
+            rows = cur.fetchall()
+            
+            next_cursor = None
+            if len(rows) > page_size:
+                rows = rows[:page_size]
+                next_cursor = encode_cursor(rows[-1][10], rows[-1][0])
+            
+            transactions = [transaction_to_dict(row) for row in rows]
             
             return {
                 'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({
-                    'total_transactions': total_transaction_count,
-                    'total_revenue': revenue,
-                    'total_costs': total_costs_with_expenses,
-                    'total_profit': total_profit_adjusted,
-                    'completed_count': stats[4] or 0,
-                    'pending_count': stats[5] or 0,
-                    'failed_count': stats[6] or 0,
-                    'expenses_count': expenses_count,
-                    'product_analytics': product_analytics,
-                    'daily_analytics': daily_analytics
-                }),
+                'body': dumps({'transactions': transactions, 'next_cursor': next_cursor}),
                 'isBase64Encoded': False
             }
         
-        limit = int(params.get('limit', 1000))
-        offset = int(params.get('offset', 0))
-        
-        cur.execute(f'''
-            SELECT t.id, t.transaction_code, t.product_id, p.name, t.client_telegram, 
-                   t.client_name, t.amount, t.cost_price, t.profit, t.status, 
-                   t."transaction_date", t.notes, t.currency
-            FROM transactions t
-            LEFT JOIN products p ON t.product_id = p.id
-            ORDER BY t."transaction_date" DESC
-            LIMIT {limit} OFFSET {offset}
-        ''')
-        rows = cur.fetchall()
-        
-        transactions = []
-        for row in rows:
-            date_value = row[10]
-            if date_value:
-                if hasattr(date_value, 'date'):
-                    date_str = date_value.date().isoformat()
-                else:
-                    date_str = date_value.isoformat()
-            else:
-                date_str = None
+        if method == 'POST':
+            body_data = json.loads(event.get('body', '{}'))
+            
+            if body_data.get('action') == 'rebuild_rollup':
+                cur.execute("SELECT rebuild_daily_sales_rollup()")
+                rollup_rows = cur.fetchone()[0]
+                
+                conn.commit()
+                
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'success': True, 'rollup_rows': rollup_rows}),
+                    'isBase64Encoded': False
+                }
+            
+            if body_data.get('action') == 'import':
+                try:
+                    rows = parse_import_rows(body_data)
+                    error = None if rows else 'No transactions to import'
+                except (ValueError, csv.Error) as e:
+                    rows, error = [], str(e)
+                if len(rows) > MAX_IMPORT_ROWS:
+                    error = f'Too many rows, the limit is {MAX_IMPORT_ROWS} per request'
+                
+                if error:
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': error}),
+                        'isBase64Encoded': False
+                    }
+                
+                results = import_transactions(cur, rows)
+                imported = sum(1 for result in results if 'error' not in result)
+                
+                conn.commit()
+                
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': dumps({
+                        'success': True,
+                        'imported': imported,
+                        'failed': len(results) - imported,
+                        'results': results
+                    }),
+                    'isBase64Encoded': False
+                }
             
-            transactions.append({
-                'id': row[0],
-                'transaction_code': row[1],
-                'product_id': row[2],
-                'product_name': row[3],
-                'client_telegram': row[4],
-                'client_name': row[5],
-                'amount': float(row[6]),
-                'cost_price': float(row[7]),
-                'profit': float(row[8]),
-                'status': row[9],
-                'transaction_date': date_str,
-                'notes': row[11],
-                'currency': row[12] if len(row) > 12 else 'RUB'
-            })
-        
-        cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'transactions': transactions}),
-            'isBase64Encoded': False
-        }
-    
-    if method == 'POST':
-        body_data = json.loads(event.get('body', '{}'))
-        product_id = body_data.get('product_id')
-        client_telegram = body_data.get('client_telegram', '')
-        client_name = body_data.get('client_name', '')
-        status = body_data.get('status', 'completed')
-        notes = body_data.get('notes', '')
-        custom_amount = body_data.get('custom_amount')
-        custom_cost_price = body_data.get('custom_cost_price')
-        currency = body_data.get('currency', 'RUB')
-        transaction_date = body_data.get('transaction_date', datetime.now().strftime('%Y-%m-%d'))
-        
-        cur.execute(
-            "SELECT cost_price, sale_price, cost_price_usd, sale_price_usd FROM products WHERE id = %s",
-            (product_id,)
-        )
-        product = cur.fetchone()
-        
-        if not product:
-            cur.close()
-            conn.close()
-            return {
-                'statusCode': 404,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Product not found'}),
-                'isBase64Encoded': False
-            }
-        
-        cost_price_rub = float(product[0])
-        sale_price_rub = float(product[1])
-        cost_price_usd = float(product[2]) if product[2] else None
-        sale_price_usd = float(product[3]) if product[3] else None
-        
-        if custom_cost_price is not None:
-            cost_price = float(custom_cost_price)
-        elif currency == 'USD':
-            if sale_price_usd is not None:
-                cost_price = cost_price_usd if cost_price_usd is not None else 0
-            else:
-                cost_price = cost_price_rub
-        else:
-            cost_price = cost_price_rub
-        
-        if currency == 'USD':
-            if sale_price_usd is not None:
-                sale_price = float(custom_amount) if custom_amount else sale_price_usd
-            else:
-                sale_price = float(custom_amount) if custom_amount else sale_price_rub
-        else:
-            sale_price = float(custom_amount) if custom_amount else sale_price_rub
-        
-        profit = sale_price - cost_price
-        
-        import random
-        transaction_code = 'TX-' + datetime.now().strftime('%Y%m%d%H%M%S') + '-' + str(random.randint(1000, 9999))
-        
-        cur.execute(
-            """INSERT INTO transactions (transaction_code, product_id, client_telegram, client_name, amount, cost_price, profit, status, notes, currency, transaction_date) 
-               VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING id""",
-            (transaction_code, product_id, client_telegram, client_name, sale_price, cost_price, profit, status, notes, currency, transaction_date)
-        )
-        transaction_id = cur.fetchone()[0]
-        
-        conn.commit()
-        cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'success': True, 'transaction_id': transaction_id, 'transaction_code': transaction_code}),
-            'isBase64Encoded': False
-        }
-    
-    if method == 'PUT':
-        body_data = json.loads(event.get('body', '{}'))
-        transaction_id = body_data.get('id')
-        
-        if 'product_id' in body_data:
             product_id = body_data.get('product_id')
             client_telegram = body_data.get('client_telegram', '')
             client_name = body_data.get('client_name', '')
@@ -442,15 +771,34 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             currency = body_data.get('currency', 'RUB')
             transaction_date = body_data.get('transaction_date', datetime.now().strftime('%Y-%m-%d'))
             
-            cur.execute(
-                "SELECT cost_price, sale_price, cost_price_usd, sale_price_usd FROM products WHERE id = %s",
-                (product_id,)
-            )
-            product = cur.fetchone()
+            transaction_code = 'TX-' + datetime.now().strftime('%Y%m%d%H%M%S') + '-' + str(random.randint(1000, 9999))
             
-            if not product:
-                cur.close()
-                conn.close()
+            # Priced from the in-memory catalog, with no products query. The INSERT only lands while the
+            # products version is the one the prices were read at; otherwise reload once and insert
+            product_catalog.ensure_loaded(cur)
+            transaction_id = None
+            for guarded in (True, False):
+                version, product = product_catalog.lookup(product_id)
+                if product:
+                    sale_price, cost_price = price_transaction(product, currency, custom_amount, custom_cost_price)
+                    profit = sale_price - cost_price
+                    cur.execute(
+                        f"""INSERT INTO transactions (transaction_code, product_id, client_telegram, client_name, amount, cost_price, profit, status, notes, currency, transaction_date) 
+                           SELECT %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
+                           WHERE NOT %s OR ({CATALOG_VERSION_SQL}) = %s
+                           RETURNING id""",
+                        (transaction_code, product_id, client_telegram, client_name, sale_price, cost_price, profit, status, notes, currency, transaction_date,
+                         guarded, version)
+                    )
+                    row = cur.fetchone()
+                    if row:
+                        transaction_id = row[0]
+                        break
+                elif not guarded:
+                    break
+                product_catalog.load(cur)
+            
+            if transaction_id is None:
                 return {
                     'statusCode': 404,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -458,84 +806,99 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'isBase64Encoded': False
                 }
             
-            cost_price_rub = float(product[0])
-            sale_price_rub = float(product[1])
-            cost_price_usd = float(product[2]) if product[2] else None
-            sale_price_usd = float(product[3]) if product[3] else None
+            conn.commit()
             
-            if custom_cost_price is not None:
-                cost_price = float(custom_cost_price)
-            elif currency == 'USD':
-                if sale_price_usd is not None:
-                    cost_price = cost_price_usd if cost_price_usd is not None else 0
-                else:
-                    cost_price = cost_price_rub
-            else:
-                cost_price = cost_price_rub
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'success': True, 'transaction_id': transaction_id, 'transaction_code': transaction_code}),
+                'isBase64Encoded': False
+            }
+        
+        if method == 'PUT':
+            body_data = json.loads(event.get('body', '{}'))
+            transaction_id = body_data.get('id')
             
-            if currency == 'USD':
-                if sale_price_usd is not None:
-                    sale_price = float(custom_amount) if custom_amount else sale_price_usd
-                else:
-                    sale_price = float(custom_amount) if custom_amount else sale_price_rub
+            if 'product_id' in body_data:
+                product_id = body_data.get('product_id')
+                client_telegram = body_data.get('client_telegram', '')
+                client_name = body_data.get('client_name', '')
+                status = body_data.get('status', 'completed')
+                notes = body_data.get('notes', '')
+                custom_amount = body_data.get('custom_amount')
+                custom_cost_price = body_data.get('custom_cost_price')
+                currency = body_data.get('currency', 'RUB')
+                transaction_date = body_data.get('transaction_date', datetime.now().strftime('%Y-%m-%d'))
+                
+                # Same version guard as POST: a stale catalog is reloaded and the UPDATE repeated once
+                product_catalog.ensure_loaded(cur)
+                product = None
+                for guarded in (True, False):
+                    version, product = product_catalog.lookup(product_id)
+                    if product:
+                        sale_price, cost_price = price_transaction(product, currency, custom_amount, custom_cost_price)
+                        profit = sale_price - cost_price
+                        cur.execute(
+                            f"""UPDATE transactions 
+                               SET product_id = %s, client_telegram = %s, client_name = %s, 
+                                   amount = %s, cost_price = %s, profit = %s, status = %s, 
+                                   notes = %s, currency = %s, transaction_date = %s
+                               WHERE id = %s AND (NOT %s OR ({CATALOG_VERSION_SQL}) = %s)""",
+                            (product_id, client_telegram, client_name, sale_price, cost_price, 
+                             profit, status, notes, currency, transaction_date, transaction_id, guarded, version)
+                        )
+                        if cur.rowcount:
+                            break
+                    elif not guarded:
+                        break
+                    product_catalog.load(cur)
+                
+                if not product:
+                    return {
+                        'statusCode': 404,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': 'Product not found'}),
+                        'isBase64Encoded': False
+                    }
             else:
-                sale_price = float(custom_amount) if custom_amount else sale_price_rub
+                status = body_data.get('status')
+                cur.execute(
+                    "UPDATE transactions SET status = %s WHERE id = %s",
+                    (status, transaction_id)
+                )
             
-            profit = sale_price - cost_price
+            conn.commit()
+            
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'success': True}),
+                'isBase64Encoded': False
+            }
+        
+        if method == 'DELETE':
+            params = event.get('queryStringParameters', {})
+            transaction_id = params.get('id')
             
             cur.execute(
-                """UPDATE transactions 
-                   SET product_id = %s, client_telegram = %s, client_name = %s, 
-                       amount = %s, cost_price = %s, profit = %s, status = %s, 
-                       notes = %s, currency = %s, transaction_date = %s
-                   WHERE id = %s""",
-                (product_id, client_telegram, client_name, sale_price, cost_price, 
-                 profit, status, notes, currency, transaction_date, transaction_id)
-            )
-        else:
-            status = body_data.get('status')
-            cur.execute(
-                "UPDATE transactions SET status = %s WHERE id = %s",
-                (status, transaction_id)
+                "DELETE FROM transactions WHERE id = %s",
+                (transaction_id,)
             )
-        
-        conn.commit()
-        cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'success': True}),
-            'isBase64Encoded': False
-        }
-    
-    if method == 'DELETE':
-        params = event.get('queryStringParameters', {})
-        transaction_id = params.get('id')
-        
-        cur.execute(
-            "DELETE FROM transactions WHERE id = %s",
-            (transaction_id,)
-        )
-        
-        conn.commit()
-        cur.close()
-        conn.close()
+            
+            conn.commit()
+            
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'success': True}),
+                'isBase64Encoded': False
+            }
         
         return {
-            'statusCode': 200,
+            'statusCode': 405,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'success': True}),
+            'body': json.dumps({'error': 'Method not allowed'}),
             'isBase64Encoded': False
         }
-    
-    cur.close()
-    conn.close()
-    
-    return {
-        'statusCode': 405,
-        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps({'error': 'Method not allowed'}),
-        'isBase64Encoded': False
-    }
\ No newline at end of file
+    finally:
+        release_connection(conn)
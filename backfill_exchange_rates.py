@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Bulk backfill of historical exchange rates into exchange_rates from a local file.
+
+Accepted files:
+  CSV with a header row: date,rate[,currency_from,currency_to]  (pair defaults to USD,RUB)
+  JSON: a list of {"date": "YYYY-MM-DD", "rate": 91.5, ...} objects or a {"YYYY-MM-DD": rate} map
+
+Rows fetched live by the exchange-rate function are kept unless --overwrite is given.
+
+Usage: DATABASE_URL=postgresql://... python backfill_exchange_rates.py rates.csv [--overwrite]
+"""
+import csv
+import io
+import json
+import os
+import sys
+from datetime import datetime
+
+import psycopg2
+
+SCHEMA = 't_p6388661_digital_goods_accoun'
+
+
+def read_rates(path):
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+
+    if path.endswith('.json'):
+        data = json.loads(text)
+        if isinstance(data, dict):
+            data = [{'date': day, 'rate': rate} for day, rate in data.items()]
+        rows = data
+    else:
+        rows = list(csv.DictReader(io.StringIO(text)))
+
+    rates = []
+    for number, row in enumerate(rows, start=1):
+        try:
+            day = datetime.strptime(str(row['date']).strip(), '%Y-%m-%d').date()
+            rate = float(row['rate'])
+        except (KeyError, ValueError) as e:
+            raise ValueError(f"row {number}: {e}")
+        if rate <= 0:
+            raise ValueError(f"row {number}: rate must be positive")
+        rates.append((
+            (row.get('currency_from') or 'USD').strip().upper(),
+            (row.get('currency_to') or 'RUB').strip().upper(),
+            rate,
+            day
+        ))
+    return rates
+
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    overwrite = '--overwrite' in sys.argv
+    if len(args) != 1:
+        print(__doc__)
+        sys.exit(1)
+
+    dsn = os.environ.get('DATABASE_URL')
+    if not dsn:
+        print("ERROR: DATABASE_URL environment variable is not set")
+        sys.exit(1)
+
+    try:
+        rates = read_rates(args[0])
+    except (OSError, ValueError) as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+
+    conn = psycopg2.connect(dsn)
+    cur = conn.cursor()
+
+    # COPY into a temporary table, then one upsert: a single statement for any file size
+    cur.execute("""
+        CREATE TEMP TABLE rates_backfill (
+            currency_from VARCHAR(3), currency_to VARCHAR(3), rate NUMERIC(10, 4), date DATE
+        ) ON COMMIT DROP
+    """)
+    buffer = io.StringIO()
+    for currency_from, currency_to, rate, day in rates:
+        buffer.write(f"{currency_from}\t{currency_to}\t{rate}\t{day.isoformat()}\n")
+    buffer.seek(0)
+    cur.copy_from(buffer, 'rates_backfill', columns=('currency_from', 'currency_to', 'rate', 'date'))
+
+    cur.execute(f"""
+        INSERT INTO {SCHEMA}.exchange_rates AS r (currency_from, currency_to, rate, date, source, fetched_at)
+        SELECT DISTINCT ON (currency_from, currency_to, date)
+               currency_from, currency_to, rate, date, 'backfill', CURRENT_TIMESTAMP
+        FROM rates_backfill
+        ORDER BY currency_from, currency_to, date
+        ON CONFLICT (currency_from, currency_to, date) DO UPDATE
+        SET rate = EXCLUDED.rate, source = EXCLUDED.source, fetched_at = EXCLUDED.fetched_at
+        WHERE r.fetched_at IS NULL OR r.source = 'backfill' OR %s
+    """, (overwrite,))
+    written = cur.rowcount
+    conn.commit()
+
+    cur.close()
+    conn.close()
+
+    print(f"Read {len(rates)} rates, upserted {written} rows")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Expense amortization: the former per-day Python loop against the vectorized engine.
+
+Usage: python benchmarks/amortization.py [expenses] [years]
+"""
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+EXPENSES = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+YEARS = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'expenses'))
+
+from amortization import OPEN_ENDED_DAYS, amortize  # noqa: E402
+
+
+def loop_amortize(expenses, chart_start, chart_end, exchange_rate):
+    """The loop action=stats used before the engine, O(expenses x days)."""
+    daily_expenses = {}
+    for exp_start, exp_end, amount, dist_type, currency in expenses:
+        amount = float(amount)
+        if currency == 'USD':
+            amount = amount * exchange_rate
+
+        if dist_type == 'one_time':
+            if chart_start <= exp_start <= chart_end:
+                date_key = exp_start.isoformat()
+                daily_expenses[date_key] = daily_expenses.get(date_key, 0) + amount
+        else:
+            actual_start = max(chart_start, exp_start)
+            actual_end = min(chart_end, exp_end) if exp_end else chart_end
+            total_days = (exp_end - exp_start).days + 1 if exp_end else OPEN_ENDED_DAYS
+            daily_amount = amount / total_days
+            for i in range((actual_end - actual_start).days + 1):
+                date_key = (actual_start + timedelta(days=i)).isoformat()
+                daily_expenses[date_key] = daily_expenses.get(date_key, 0) + daily_amount
+
+    days = (chart_end - chart_start).days + 1
+    return np.array([daily_expenses.get((chart_start + timedelta(days=i)).isoformat(), 0) for i in range(days)])
+
+
+def generate(count, chart_start, chart_end, seed=42):
+    rng = random.Random(seed)
+    span = (chart_end - chart_start).days
+    expenses = []
+    for _ in range(count):
+        start = chart_start + timedelta(days=rng.randint(-365, span))
+        dist_type = rng.choice(['one_time', 'monthly', 'yearly'])
+        if dist_type == 'one_time' or rng.random() < 0.3:
+            end = None
+        else:
+            end = start + timedelta(days=rng.randint(0, 3 * 365))
+        expenses.append((start, end, rng.randint(100, 100000), dist_type, rng.choice(['RUB', 'RUB', 'USD'])))
+    return expenses
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return result, (time.perf_counter() - started) * 1000
+
+
+def main():
+    chart_end = date(2025, 12, 31)
+    chart_start = chart_end - timedelta(days=365 * YEARS - 1)
+    expenses = generate(EXPENSES, chart_start, chart_end)
+
+    print("=" * 80)
+    print(f"AMORTIZATION BENCHMARK - {EXPENSES} expenses over {YEARS} years "
+          f"({(chart_end - chart_start).days + 1} days)")
+    print("=" * 80)
+
+    expected, loop_ms = timed(loop_amortize, expenses, chart_start, chart_end, 90.0)
+    actual, engine_ms = timed(amortize, expenses, chart_start, chart_end, 90.0)
+
+    print(f"python loop      {loop_ms:10.1f} ms")
+    print(f"numpy engine     {engine_ms:10.1f} ms   ({loop_ms / engine_ms:.0f}x faster)")
+    print(f"max abs diff     {np.max(np.abs(expected - actual)):.2e}")
+    assert np.allclose(expected, actual, rtol=1e-9, atol=1e-6)
+
+
+if __name__ == '__main__':
+    main()
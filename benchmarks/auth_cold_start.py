@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Cold start of the auth handler per action: every action runs in a fresh interpreter that
+imports index.py and serves one request. Reports the import time, the first-request
+latency, whether a database connection was opened and which heavy modules got loaded.
+
+An optional directory runs another copy of the handler, e.g. an older checkout:
+    git worktree add /tmp/auth-before HEAD~1
+    python benchmarks/auth_cold_start.py /tmp/auth-before/backend/auth
+
+Usage: DATABASE_URL=postgresql://... python benchmarks/auth_cold_start.py [handler_dir]
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+HANDLER_DIR = os.path.abspath(sys.argv[1]) if len(sys.argv) > 1 and not sys.argv[1].startswith('--') else \
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'auth')
+RUNS = 5
+JWT_SECRET = 'cold-start-benchmark'
+HEAVY_MODULES = ('psycopg2', 'bcrypt', 'jwt')
+
+# psycopg2.connect is wrapped as psycopg2 gets imported, without importing it up front
+CHILD = '''
+import importlib.abc, importlib.util, json, sys, time
+connects = []
+
+class CountConnects(importlib.abc.MetaPathFinder):
+    def find_spec(self, name, path, target=None):
+        if name != 'psycopg2':
+            return None
+        sys.meta_path.remove(self)
+        spec = importlib.util.find_spec(name)
+        exec_module = spec.loader.exec_module
+        def counting_exec_module(module):
+            exec_module(module)
+            connect = module.connect
+            module.connect = lambda *args, **kwargs: connects.append(1) or connect(*args, **kwargs)
+        spec.loader.exec_module = counting_exec_module
+        return spec
+
+sys.meta_path.insert(0, CountConnects())
+started = time.perf_counter()
+sys.path.insert(0, sys.argv[1])
+import index
+imported = time.perf_counter()
+response = index.handler(json.loads(sys.argv[2]), None)
+served = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'request_ms': (served - imported) * 1000,
+    'status': response['statusCode'],
+    'connects': len(connects),
+    'modules': [name for name in sys.argv[3].split(',') if name in sys.modules]
+}))
+'''
+
+
+def make_token(is_admin):
+    import jwt
+    from datetime import datetime, timedelta
+    return jwt.encode({'user_id': 1, 'email': 'bench@example.com', 'is_admin': is_admin,
+                       'exp': datetime.utcnow() + timedelta(hours=1)}, JWT_SECRET, algorithm='HS256')
+
+
+def main():
+    if not os.environ.get('DATABASE_URL'):
+        print("ERROR: DATABASE_URL environment variable is not set")
+        sys.exit(1)
+
+    admin_token = make_token(True)
+    events = [
+        ('OPTIONS', {'httpMethod': 'OPTIONS'}),
+        ('verify, valid token', {'httpMethod': 'POST', 'body': json.dumps({'action': 'verify', 'token': make_token(False)})}),
+        ('verify, invalid token', {'httpMethod': 'POST', 'body': json.dumps({'action': 'verify', 'token': 'invalid'})}),
+        ('login, unknown user', {'httpMethod': 'POST', 'body': json.dumps({'action': 'login', 'email': 'nobody@example.com',
+                                                                           'password': 'x'})}),
+        ('users, admin token', {'httpMethod': 'GET', 'queryStringParameters': {'action': 'users'},
+                                'headers': {'X-Auth-Token': admin_token}}),
+        ('users, not admin', {'httpMethod': 'GET', 'queryStringParameters': {'action': 'users'},
+                              'headers': {'X-Auth-Token': make_token(False)}}),
+    ]
+
+    print("=" * 80)
+    print(f"AUTH COLD START - {HANDLER_DIR}, median of {RUNS} fresh interpreters")
+    print("=" * 80)
+    print(f"{'action':<24} {'status':>6} {'import':>10} {'request':>10} {'connects':>9}  modules loaded")
+
+    env = dict(os.environ, JWT_SECRET=JWT_SECRET)
+    for label, event in events:
+        runs = []
+        for _ in range(RUNS):
+            output = subprocess.run([sys.executable, '-c', CHILD, HANDLER_DIR, json.dumps(event), ','.join(HEAVY_MODULES)],
+                                    capture_output=True, text=True, check=True, env=env).stdout
+            runs.append(json.loads(output))
+        print(f"{label:<24} {runs[0]['status']:>6} {statistics.median(r['import_ms'] for r in runs):8.1f} ms "
+              f"{statistics.median(r['request_ms'] for r in runs):8.1f} ms {runs[0]['connects']:>9}  "
+              f"{', '.join(runs[0]['modules']) or '-'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+bcrypt cost on this host: the cost calibrate_cost() picks for several latency budgets, then
+login p50/p99 through the auth handler for each cost, and the rehash of a hash stored at
+a lower cost than the pinned one on the first successful login.
+
+A user bcrypt-bench@example.com is created for the run and deleted at the end.
+
+Usage: DATABASE_URL=postgresql://... python benchmarks/bcrypt_cost.py [logins per cost] [min cost] [max cost]
+"""
+import json
+import os
+import statistics
+import sys
+import time
+
+LOGINS = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+MIN_COST = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+MAX_COST = int(sys.argv[3]) if len(sys.argv) > 3 else 13
+EMAIL = 'bcrypt-bench@example.com'
+PASSWORD = 'bench-password'
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'auth'))
+
+import bcrypt  # noqa: E402
+import db  # noqa: E402
+import index  # noqa: E402
+import passwords  # noqa: E402
+
+
+def login():
+    response = index.handler({'httpMethod': 'POST', 'body': json.dumps({'action': 'login', 'email': EMAIL,
+                                                                         'password': PASSWORD})}, None)
+    assert response['statusCode'] == 200, response
+
+
+def stored_hash(cur):
+    cur.execute("SELECT password_hash FROM users WHERE email = %s", (EMAIL,))
+    return cur.fetchone()[0]
+
+
+def set_hash(conn, cur, cost):
+    cur.execute("UPDATE users SET password_hash = %s WHERE email = %s",
+                (bcrypt.hashpw(PASSWORD.encode('utf-8'), bcrypt.gensalt(rounds=cost)).decode('utf-8'), EMAIL))
+    conn.commit()
+
+
+def main():
+    if not os.environ.get('DATABASE_URL'):
+        print("ERROR: DATABASE_URL environment variable is not set")
+        sys.exit(1)
+
+    print("=" * 80)
+    print(f"BCRYPT COST - {LOGINS} logins per cost")
+    print("=" * 80)
+    for budget in (50, 100, 250, 500, 1000):
+        print(f"budget {budget:>5} ms -> cost {passwords.calibrate_cost(budget, MIN_COST, MAX_COST)}")
+    print("-" * 80)
+
+    conn = db.get_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("DELETE FROM users WHERE email = %s", (EMAIL,))
+        cur.execute("INSERT INTO users (email, password_hash, full_name) VALUES (%s, '', 'bcrypt bench')", (EMAIL,))
+        conn.commit()
+
+        for cost in range(MIN_COST, MAX_COST + 1):
+            # Pinned cost: every login verifies at this cost and none of them rehashes
+            passwords.FIXED_COST = cost
+            set_hash(conn, cur, cost)
+            login()
+            timings = []
+            for _ in range(LOGINS):
+                started = time.perf_counter()
+                login()
+                timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            print(f"cost {cost:>2}   login p50 {statistics.median(timings):8.1f} ms   "
+                  f"p99 {timings[max(0, int(len(timings) * 0.99) - 1)]:8.1f} ms")
+        print("-" * 80)
+
+        passwords.FIXED_COST = None
+        target = passwords.bcrypt_cost()
+        # Rehashing only goes up, so start below the pinned cost
+        old_cost = target - 1
+        set_hash(conn, cur, old_cost)
+        for attempt in ('first login', 'second login'):
+            started = time.perf_counter()
+            login()
+            elapsed = (time.perf_counter() - started) * 1000
+            print(f"{attempt:<14} {elapsed:8.1f} ms   stored cost now {passwords.hash_cost(stored_hash(cur))} "
+                  f"(pinned {target}, was {old_cost})")
+        assert passwords.hash_cost(stored_hash(cur)) == target
+    finally:
+        conn.rollback()
+        cur.execute("DELETE FROM users WHERE email = %s", (EMAIL,))
+        conn.commit()
+        cur.close()
+        db.release_connection(conn)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Transaction ingestion throughput: one POST per row versus a single action=import batch,
+and the same batch with the transactions triggers disabled. The gap between the last two is
+what keeping daily_sales_rollup, client_stats and client group revenue current costs per batch.
+
+Inserted rows are deleted again at the end of each run. Disabling triggers needs the table owner.
+
+Usage: DATABASE_URL=postgresql://... python benchmarks/bulk_import.py [rows]
+"""
+import json
+import os
+import sys
+import time
+
+import psycopg2
+
+ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'transactions'))
+
+import db  # noqa: E402
+import index  # noqa: E402
+
+
+def make_rows(product_ids):
+    return [
+        {
+            'product_id': product_ids[i % len(product_ids)],
+            'client_name': f'bench-{i}',
+            'currency': 'USD' if i % 3 == 0 else 'RUB',
+            'transaction_date': f'2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}',
+            'notes': 'bulk import benchmark'
+        }
+        for i in range(ROWS)
+    ]
+
+
+def post(body):
+    while True:
+        try:
+            response = index.handler({'httpMethod': 'POST', 'queryStringParameters': {}, 'body': json.dumps(body)}, None)
+            break
+        except psycopg2.errors.UniqueViolation:
+            # single-row POST codes are TX-<seconds>-<4 random digits> and collide at this rate
+            continue
+    assert response['statusCode'] == 200, response
+    return json.loads(response['body'])
+
+
+def cleanup():
+    conn = db.get_connection()
+    cur = conn.cursor()
+    cur.execute("DELETE FROM transactions WHERE notes = 'bulk import benchmark'")
+    conn.commit()
+    cur.close()
+    db.release_connection(conn)
+
+
+def set_user_triggers(enabled):
+    conn = db.get_connection()
+    cur = conn.cursor()
+    cur.execute(f"ALTER TABLE transactions {'ENABLE' if enabled else 'DISABLE'} TRIGGER USER")
+    conn.commit()
+    cur.close()
+    db.release_connection(conn)
+
+
+def report(label, elapsed):
+    print(f"{label:<28} {elapsed:8.2f} s   {ROWS / elapsed:10.0f} rows/s")
+
+
+def main():
+    if not os.environ.get('DATABASE_URL'):
+        print("ERROR: DATABASE_URL environment variable is not set")
+        sys.exit(1)
+
+    conn = db.get_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT id FROM products ORDER BY id")
+    product_ids = [row[0] for row in cur.fetchall()]
+    cur.close()
+    db.release_connection(conn)
+    if not product_ids:
+        print("ERROR: products table is empty")
+        sys.exit(1)
+
+    rows = make_rows(product_ids)
+
+    print("=" * 80)
+    print(f"BULK IMPORT BENCHMARK - {ROWS} transactions")
+    print("=" * 80)
+
+    started = time.perf_counter()
+    for row in rows:
+        post(row)
+    report('POST per row', time.perf_counter() - started)
+    cleanup()
+
+    started = time.perf_counter()
+    result = post({'action': 'import', 'transactions': rows})
+    report('action=import', time.perf_counter() - started)
+    assert result['imported'] == ROWS, result
+    cleanup()
+
+    set_user_triggers(False)
+    try:
+        started = time.perf_counter()
+        result = post({'action': 'import', 'transactions': rows})
+        report('action=import, no triggers', time.perf_counter() - started)
+        assert result['imported'] == ROWS, result
+        cleanup()
+    finally:
+        set_user_triggers(True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Graph endpoints of the clients function on a synthetic referral network: latency and
+response size of k-hop neighborhoods, referral chains and shortest paths, next to the
+full edge table that action=connections ships.
+
+The network (clients @graph-bench-*, ids from 10000000) is committed for the run and
+deleted at the end.
+
+Usage: DATABASE_URL=postgresql://... python benchmarks/client_graph.py [clients] [edges]
+"""
+import os
+import random
+import statistics
+import sys
+import time
+
+CLIENTS = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+EDGES = int(sys.argv[2]) if len(sys.argv) > 2 else 150000
+BASE_ID = 10000000
+REPEATS = 20
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'clients'))
+
+import index  # noqa: E402
+
+
+def call(params):
+    response = index.handler({'httpMethod': 'GET', 'queryStringParameters': params}, None)
+    assert response['statusCode'] == 200, response
+    return response['body']
+
+
+def measure(label, make_params):
+    timings, sizes = [], []
+    for _ in range(REPEATS):
+        params = make_params()
+        started = time.perf_counter()
+        body = call(params)
+        timings.append((time.perf_counter() - started) * 1000)
+        sizes.append(len(body))
+    print(f"{label:<34} {statistics.median(timings):9.2f} ms  p95 {sorted(timings)[int(REPEATS * 0.95) - 1]:9.2f} ms"
+          f"  {statistics.median(sizes) / 1024:9.1f} KB")
+
+
+def main():
+    if not os.environ.get('DATABASE_URL'):
+        print("ERROR: DATABASE_URL environment variable is not set")
+        sys.exit(1)
+
+    print("=" * 80)
+    print(f"CLIENT GRAPH - {CLIENTS} clients, {EDGES} connections, median of {REPEATS}")
+    print("=" * 80)
+
+    random.seed(42)
+    conn = index.get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            INSERT INTO t_p6388661_digital_goods_accoun.clients (id, client_telegram, client_name)
+            SELECT %(base)s + n, '@graph-bench-' || n, 'Graph bench ' || n FROM generate_series(0, %(clients)s - 1) AS n
+        """, {'base': BASE_ID, 'clients': CLIENTS})
+        # Referral trees (each client referred by an earlier one) plus random cross links
+        cur.execute("""
+            INSERT INTO t_p6388661_digital_goods_accoun.client_connections (client_id_from, client_id_to, connection_type)
+            SELECT %(base)s + floor(random() * n)::int, %(base)s + n, 'referral'
+            FROM generate_series(1, %(clients)s - 1) AS n
+            ON CONFLICT DO NOTHING
+        """, {'base': BASE_ID, 'clients': CLIENTS})
+        cur.execute("""
+            INSERT INTO t_p6388661_digital_goods_accoun.client_connections (client_id_from, client_id_to, connection_type)
+            SELECT %(base)s + floor(random() * %(clients)s)::int, %(base)s + floor(random() * %(clients)s)::int, 'friend'
+            FROM generate_series(1, %(extra)s)
+            ON CONFLICT DO NOTHING
+        """, {'base': BASE_ID, 'clients': CLIENTS, 'extra': max(EDGES - CLIENTS, 0)})
+        cur.execute("ANALYZE t_p6388661_digital_goods_accoun.client_connections")
+        conn.commit()
+
+        def some_client():
+            return str(BASE_ID + random.randrange(CLIENTS))
+
+        measure('connections (whole edge table)', lambda: {'action': 'connections'})
+        for depth in (1, 2, 3):
+            measure(f'neighborhood, depth {depth}',
+                    lambda: {'action': 'neighborhood', 'client_id': some_client(), 'depth': str(depth)})
+        measure('referral chain up, depth 6',
+                lambda: {'action': 'chain', 'client_id': some_client(), 'depth': '6', 'connection_type': 'referral'})
+        measure('referral chain down, depth 3',
+                lambda: {'action': 'chain', 'client_id': some_client(), 'depth': '3', 'direction': 'down',
+                         'connection_type': 'referral'})
+        measure('shortest path, depth 4',
+                lambda: {'action': 'path', 'client_id': some_client(), 'target_id': some_client(), 'depth': '4'})
+    finally:
+        conn.rollback()
+        cur.execute("DELETE FROM t_p6388661_digital_goods_accoun.client_connections WHERE client_id_from >= %s OR client_id_to >= %s",
+                    (BASE_ID, BASE_ID))
+        cur.execute("DELETE FROM t_p6388661_digital_goods_accoun.clients WHERE id >= %s", (BASE_ID,))
+        conn.commit()
+        cur.close()
+        index.release_connection(conn)
+
+
+if __name__ == '__main__':
+    main()
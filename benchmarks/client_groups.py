@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Client groups: cost of merging groups edge by edge as add-connection does, against a full
+union-find rebuild over every connection, and latency of the ranked groups endpoint.
+
+The network (clients @groups-bench-*, ids from 10000000) is committed for the run and
+deleted at the end, followed by a rebuild of client_groups.
+
+Usage: DATABASE_URL=postgresql://... python benchmarks/client_groups.py [clients] [edges]
+"""
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+CLIENTS = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+EDGES = int(sys.argv[2]) if len(sys.argv) > 2 else 40000
+BASE_ID = 10000000
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'clients'))
+
+import groups  # noqa: E402
+import index  # noqa: E402
+
+
+def main():
+    if not os.environ.get('DATABASE_URL'):
+        print("ERROR: DATABASE_URL environment variable is not set")
+        sys.exit(1)
+
+    print("=" * 80)
+    print(f"CLIENT GROUPS - {CLIENTS} clients, {EDGES} connections")
+    print("=" * 80)
+
+    random.seed(42)
+    edges = set()
+    while len(edges) < EDGES:
+        a, b = random.sample(range(BASE_ID, BASE_ID + CLIENTS), 2)
+        edges.add((a, b))
+
+    conn = index.get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            INSERT INTO t_p6388661_digital_goods_accoun.clients (id, client_telegram, client_name)
+            SELECT %(base)s + n, '@groups-bench-' || n, 'Groups bench ' || n FROM generate_series(0, %(clients)s - 1) AS n
+        """, {'base': BASE_ID, 'clients': CLIENTS})
+        conn.commit()
+
+        # Edge by edge, one database transaction each, as add-connection links them
+        timings = []
+        for a, b in edges:
+            started = time.perf_counter()
+            cur.execute("""
+                INSERT INTO t_p6388661_digital_goods_accoun.client_connections (client_id_from, client_id_to)
+                VALUES (%s, %s) ON CONFLICT DO NOTHING
+            """, (a, b))
+            groups.link_clients(cur, a, b)
+            conn.commit()
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        print(f"{'incremental link per edge':<34} median {statistics.median(timings):7.2f} ms  "
+              f"p99 {timings[int(len(timings) * 0.99) - 1]:7.2f} ms  max {timings[-1]:7.2f} ms")
+
+        cur.execute("SELECT group_id, client_id FROM t_p6388661_digital_goods_accoun.client_groups ORDER BY client_id")
+        incremental = {row['client_id']: row['group_id'] for row in cur.fetchall()}
+
+        started = time.perf_counter()
+        group_count = groups.rebuild_groups(cur)
+        conn.commit()
+        print(f"{'full union-find rebuild':<34} {(time.perf_counter() - started) * 1000:10.2f} ms  ({group_count} groups)")
+
+        # Same partition, whatever the group ids
+        cur.execute("SELECT group_id, client_id FROM t_p6388661_digital_goods_accoun.client_groups ORDER BY client_id")
+        rebuilt = {row['client_id']: row['group_id'] for row in cur.fetchall()}
+        pairs = {(incremental[client_id], rebuilt[client_id]) for client_id in incremental}
+        assert incremental.keys() == rebuilt.keys()
+        assert len(pairs) == len({group for group, _ in pairs}) == len({group for _, group in pairs})
+
+        timings = []
+        for _ in range(20):
+            started = time.perf_counter()
+            response = index.handler({'httpMethod': 'GET', 'queryStringParameters': {'action': 'groups', 'top': '20'}}, None)
+            timings.append((time.perf_counter() - started) * 1000)
+            assert response['statusCode'] == 200, response
+        print(f"{'GET groups, top 20':<34} median {statistics.median(timings):7.2f} ms  "
+              f"({len(json.loads(response['body'])['groups'])} groups)")
+    finally:
+        conn.rollback()
+        cur.execute("DELETE FROM t_p6388661_digital_goods_accoun.client_connections WHERE client_id_from >= %s OR client_id_to >= %s",
+                    (BASE_ID, BASE_ID))
+        cur.execute("DELETE FROM t_p6388661_digital_goods_accoun.clients WHERE id >= %s", (BASE_ID,))
+        groups.rebuild_groups(cur)
+        conn.commit()
+        cur.close()
+        index.release_connection(conn)
+
+
+if __name__ == '__main__':
+    main()
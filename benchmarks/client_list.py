@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Clients list latency: the old per-request GROUP BY over transactions against the first
+page and the top-N read from client_stats, as the number of clients grows.
+
+Synthetic transactions (codes starting with BENCH-CS-) are inserted through the normal
+triggers, so client_stats is maintained incrementally during the run; they are deleted
+at the end.
+
+Usage: DATABASE_URL=postgresql://... python benchmarks/client_list.py [rows] [clients]
+"""
+import json
+import os
+import statistics
+import sys
+import time
+
+ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+CLIENTS = int(sys.argv[2]) if len(sys.argv) > 2 else 50000
+REPEATS = 5
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'clients'))
+
+import db  # noqa: E402
+import index  # noqa: E402
+
+LEGACY_QUERY = '''
+    WITH client_stats AS (
+        SELECT t.client_telegram, t.client_name,
+               SUM(CASE WHEN t.currency = 'USD' THEN t.amount * COALESCE(t_p6388661_digital_goods_accoun.usd_rub_rate_on(t.transaction_date::date), 82) ELSE t.amount END) as total_revenue,
+               COUNT(*) as purchase_count,
+               MIN(t.transaction_date) as first_purchase,
+               MAX(t.transaction_date) as last_purchase
+        FROM t_p6388661_digital_goods_accoun.transactions t
+        WHERE t.status = 'completed'
+        GROUP BY t.client_telegram, t.client_name
+    )
+    SELECT cs.*, COALESCE(c.importance, 'medium')
+    FROM client_stats cs
+    LEFT JOIN t_p6388661_digital_goods_accoun.clients c ON cs.client_telegram = c.client_telegram
+    ORDER BY cs.total_revenue DESC
+'''
+
+
+def timed(func):
+    timings = []
+    for _ in range(REPEATS):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def legacy():
+    conn = index.get_db_connection()
+    cur = conn.cursor()
+    cur.execute(LEGACY_QUERY)
+    json.dumps({'clients': cur.fetchall()}, default=str)
+    cur.close()
+    db.release_connection(conn)
+
+
+def listing(params):
+    def call():
+        response = index.handler({'httpMethod': 'GET', 'queryStringParameters': dict(params, action='list')}, None)
+        assert response['statusCode'] == 200, response
+        return json.loads(response['body'])
+    return call
+
+
+def main():
+    if not os.environ.get('DATABASE_URL'):
+        print("ERROR: DATABASE_URL environment variable is not set")
+        sys.exit(1)
+
+    print("=" * 80)
+    print(f"CLIENTS LIST - {ROWS} extra transactions across {CLIENTS} clients, median of {REPEATS}")
+    print("=" * 80)
+
+    conn = index.get_db_connection()
+    cur = conn.cursor()
+    try:
+        started = time.perf_counter()
+        cur.execute("""
+            INSERT INTO t_p6388661_digital_goods_accoun.transactions
+                (transaction_code, product_id, client_telegram, client_name, amount, cost_price, profit,
+                 status, currency, transaction_date)
+            SELECT 'BENCH-CS-' || n, NULL, '@bench' || (n %% %(clients)s), 'Bench ' || (n %% %(clients)s),
+                   100 + n %% 5000, 50, 50 + n %% 5000,
+                   CASE WHEN n %% 10 = 0 THEN 'pending' ELSE 'completed' END,
+                   CASE WHEN n %% 5 = 0 THEN 'USD' ELSE 'RUB' END,
+                   CURRENT_TIMESTAMP - (n %% 1000) * INTERVAL '1 day'
+            FROM generate_series(1, %(rows)s) AS n
+        """, {'rows': ROWS, 'clients': CLIENTS})
+        conn.commit()
+        elapsed = time.perf_counter() - started
+        print(f"inserted with incremental client_stats upkeep: {ROWS / elapsed:,.0f} rows/s")
+
+        full = listing({})()
+        first_page = listing({'page_size': '50'})
+        top = listing({'top': '20'})
+        assert first_page()['clients'] == full['clients'][:50]
+
+        print(f"{'legacy GROUP BY over transactions':<40} {timed(legacy):10.2f} ms")
+        print(f"{'client_stats, whole list':<40} {timed(listing({})):10.2f} ms")
+        print(f"{'client_stats, first page of 50':<40} {timed(first_page):10.2f} ms")
+        print(f"{'client_stats, top 20':<40} {timed(top):10.2f} ms")
+    finally:
+        conn.rollback()
+        cur.execute("DELETE FROM t_p6388661_digital_goods_accoun.transactions WHERE transaction_code LIKE 'BENCH-CS-%%'")
+        conn.commit()
+        cur.close()
+        db.release_connection(conn)
+
+
+if __name__ == '__main__':
+    main()
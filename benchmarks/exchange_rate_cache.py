@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Exchange-rate handler against a local stub of the rate providers: caching, hedged fetching,
+the per-source circuit breaker and stale-while-revalidate, with the latency of each step.
+
+Today's and yesterday's USD/RUB rows in exchange_rates are deleted before the run.
+
+Usage: DATABASE_URL=postgresql://... python benchmarks/exchange_rate_cache.py
+"""
+import json
+import os
+import sys
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubProviders(BaseHTTPRequestHandler):
+    hits = {'/cbr': 0, '/fallback': 0}
+    delay = {'/cbr': 0.0, '/fallback': 0.0}
+    down = {'/cbr': False, '/fallback': False}
+
+    def do_GET(self):
+        StubProviders.hits[self.path] += 1
+        time.sleep(StubProviders.delay[self.path])
+        if StubProviders.down[self.path]:
+            self.send_response(503)
+            self.end_headers()
+            return
+        payload = {'Valute': {'USD': {'Value': 91.25}}} if self.path == '/cbr' else {'rates': {'RUB': 92.5}}
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+server = ThreadingHTTPServer(('127.0.0.1', 0), StubProviders)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+os.environ['CBR_RATE_URL'] = f'http://127.0.0.1:{server.server_port}/cbr'
+os.environ['FALLBACK_RATE_URL'] = f'http://127.0.0.1:{server.server_port}/fallback'
+os.environ['RATE_FETCH_DEADLINE'] = '1.5'
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'exchange-rate'))
+
+import db  # noqa: E402
+import index  # noqa: E402
+import rate_sources  # noqa: E402
+
+
+def stub(cbr_delay=0.0, fallback_delay=0.0, cbr_down=False, fallback_down=False):
+    StubProviders.delay.update({'/cbr': cbr_delay, '/fallback': fallback_delay})
+    StubProviders.down.update({'/cbr': cbr_down, '/fallback': fallback_down})
+
+
+def reset_rates():
+    index._memory_rate.clear()
+    for breaker in rate_sources.breakers.values():
+        breaker.record_success()
+    conn = db.get_connection()
+    cur = conn.cursor()
+    cur.execute("""DELETE FROM exchange_rates WHERE currency_from = 'USD' AND currency_to = 'RUB'
+                   AND date >= CURRENT_DATE - 1""")
+    conn.commit()
+    cur.close()
+    db.release_connection(conn)
+
+
+def request(label, params=None, expected_status=200, **expected):
+    before = dict(StubProviders.hits)
+    started = time.perf_counter()
+    response = index.handler({'httpMethod': 'GET', 'queryStringParameters': params or {}}, None)
+    elapsed = (time.perf_counter() - started) * 1000
+    assert response['statusCode'] == expected_status, response
+    body = json.loads(response['body'])
+    calls = {path: StubProviders.hits[path] - before[path] for path in before}
+    print(f"{label:<34} {elapsed:9.2f} ms   {response['statusCode']}  cached={str(body.get('cached')):<9} "
+          f"stale={str(body.get('stale')):<5} source={str(body.get('source')):<17} "
+          f"cbr calls={calls['/cbr']} fallback calls={calls['/fallback']}")
+    for key, value in expected.items():
+        assert body.get(key) == value, (key, body)
+    return body
+
+
+def main():
+    if not os.environ.get('DATABASE_URL'):
+        print("ERROR: DATABASE_URL environment variable is not set")
+        sys.exit(1)
+
+    print("=" * 80)
+    print("EXCHANGE RATE SOURCES - local stub providers, 1.5 s fetch deadline")
+    print("=" * 80)
+
+    reset_rates()
+    stub(cbr_delay=1.0, fallback_delay=0.2)
+    request('slow cbr, hedged', cached=None, source='exchangerate-api')
+    request('same instance', cached='memory')
+    index._memory_rate.clear()
+    request('new instance', cached='database')
+    # let the slow cbr answer land: a late success still closes its breaker
+    time.sleep(1.0)
+
+    reset_rates()
+    stub(cbr_down=True, fallback_delay=0.05)
+    for attempt in range(rate_sources.BREAKER_FAILURES):
+        request(f'cbr down, refresh #{attempt + 1}', {'refresh': '1'}, source='exchangerate-api')
+    time.sleep(0.1)
+    assert rate_sources.breakers['cbr'].state == 'open'
+    body = request('cbr breaker open, refresh', {'refresh': '1'}, source='exchangerate-api')
+
+    stub()
+    index.remember_rate(dict(index._memory_rate, date=date.today() - timedelta(days=1)))
+    conn = db.get_connection()
+    cur = conn.cursor()
+    cur.execute("DELETE FROM exchange_rates WHERE currency_from = 'USD' AND currency_to = 'RUB' AND date = CURRENT_DATE")
+    conn.commit()
+    cur.close()
+    db.release_connection(conn)
+    request('yesterday cached, stale served', stale=True)
+    time.sleep(0.5)
+    request('after background revalidation', stale=False, cached='memory', date=date.today().isoformat())
+
+    stub(cbr_down=True, fallback_down=True)
+    request('all sources down, refresh', {'refresh': '1'}, rate=body['rate'])
+    assert rate_sources.breakers['cbr'].state == 'open'
+
+    reset_rates()
+    stub(cbr_delay=3.0, fallback_delay=3.0)
+    request('both slower than deadline', expected_status=500)
+
+    print(f"provider calls: {StubProviders.hits}")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Plan regression check: runs the handlers against a seeded copy of transactions and
+daily_sales_rollup and EXPLAINs every query they issue. Fails if any of them reads
+either table with a sequential scan, except where the event lists the table as allowed.
+
+The copy lives in a scratch schema (explain_bench) that shadows the real tables through
+search_path; it gets the same indexes and is dropped at the end.
+
+Usage: DATABASE_URL=postgresql://... python benchmarks/explain_plans.py [rows]
+"""
+import json
+import os
+import subprocess
+import sys
+import time
+
+import psycopg2
+import psycopg2.extensions
+
+ROWS = int(sys.argv[1]) if len(sys.argv) > 1 and not sys.argv[1].startswith('--') else 1000000
+SCHEMA = 't_p6388661_digital_goods_accoun'
+SCRATCH = 'explain_bench'
+WATCHED = ('transactions', 'daily_sales_rollup')
+
+# (label, query params, tables a sequential scan is acceptable for)
+EVENTS = {
+    'transactions': [
+        # The whole history aggregates every rollup row: reading the small rollup table in full is the right plan
+        ('stats, all', {'action': 'stats', 'date_filter': 'all'}, {'daily_sales_rollup'}),
+        ('stats, month', {'action': 'stats', 'date_filter': 'month'}, set()),
+        ('stats, custom', {'action': 'stats', 'date_filter': 'custom', 'start_date': '2022-03-01', 'end_date': '2022-03-31'},
+         set()),
+        ('list, first page', {'page_size': '50'}, set()),
+        ('export, date range + status', {'action': 'export', 'date_from': '2022-03-01', 'date_to': '2022-03-07',
+                                         'status': 'completed', 'page_size': '1000'}, set()),
+    ],
+    'daily-cost-breakdown': [
+        ('breakdown, one day', {'date': '2022-03-15'}, set()),
+    ],
+}
+
+
+def scan_nodes(plan):
+    node = (plan['Node Type'], plan.get('Relation Name'), plan.get('Index Name'))
+    nodes = [node] if node[1] else []
+    for child in plan.get('Plans', []):
+        nodes.extend(scan_nodes(child))
+    return nodes
+
+
+def child(handler):
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', handler))
+    import db
+    import index
+
+    plans = []
+
+    class ExplainCursor(psycopg2.extensions.cursor):
+        def execute(self, query, vars=None):
+            if query.lstrip().upper().startswith(('SELECT', 'WITH')):
+                with psycopg2.extensions.cursor(self.connection) as explain:
+                    explain.execute('EXPLAIN (FORMAT JSON) ' + query, vars)
+                    plans.append(explain.fetchone()[0][0]['Plan'])
+            return super().execute(query, vars)
+
+    db._pool = db.ConnectionPool(os.environ['DATABASE_URL'], cursor_factory=ExplainCursor,
+                                 options=f'-c search_path={SCRATCH},{SCHEMA}')
+
+    results = []
+    for label, params, allow_seq in EVENTS[handler]:
+        plans.clear()
+        response = index.handler({'httpMethod': 'GET', 'queryStringParameters': params, 'headers': {}}, None)
+        assert response['statusCode'] == 200, response
+        nodes = [node for plan in plans for node in scan_nodes(plan) if node[1] in WATCHED]
+        results.append({'label': label, 'nodes': nodes, 'allow_seq': sorted(allow_seq)})
+    print(json.dumps(results))
+
+
+def seed(cur):
+    cur.execute(f"DROP SCHEMA IF EXISTS {SCRATCH} CASCADE")
+    cur.execute(f"CREATE SCHEMA {SCRATCH}")
+    cur.execute(f"CREATE TABLE {SCRATCH}.transactions (LIKE {SCHEMA}.transactions INCLUDING DEFAULTS INCLUDING INDEXES)")
+    cur.execute(f"CREATE TABLE {SCRATCH}.daily_sales_rollup (LIKE {SCHEMA}.daily_sales_rollup INCLUDING ALL)")
+    cur.execute(f"""
+        INSERT INTO {SCRATCH}.transactions (id, transaction_code, product_id, client_telegram, client_name, amount,
+                                            cost_price, profit, status, notes, currency, transaction_date)
+        SELECT n, 'EXPLAIN-' || n, 1 + n %% 6, '@c' || (n %% 20000), 'Client ' || (n %% 20000),
+               1000 + n %% 900, 400, 600 + n %% 900,
+               (ARRAY['completed', 'completed', 'completed', 'completed', 'completed',
+                      'completed', 'completed', 'completed', 'pending', 'failed'])[1 + n %% 10],
+               NULL, CASE WHEN n %% 7 = 0 THEN 'USD' ELSE 'RUB' END,
+               TIMESTAMP '2020-01-01' + (n %% 2000) * INTERVAL '1 day' + (n %% 1440) * INTERVAL '1 minute'
+        FROM generate_series(1, %s) AS n
+    """, (ROWS,))
+    cur.execute(f"""
+        INSERT INTO {SCRATCH}.daily_sales_rollup (day, product_id, currency, status, tx_count, revenue, cost, profit)
+        SELECT transaction_date::date, COALESCE(product_id, 0), currency, COALESCE(status, ''),
+               COUNT(*), SUM(amount), SUM(cost_price), SUM(profit)
+        FROM {SCRATCH}.transactions
+        GROUP BY 1, 2, 3, 4
+    """)
+    cur.execute(f"VACUUM ANALYZE {SCRATCH}.transactions")
+    cur.execute(f"VACUUM ANALYZE {SCRATCH}.daily_sales_rollup")
+
+
+def main():
+    dsn = os.environ.get('DATABASE_URL')
+    if not dsn:
+        print("ERROR: DATABASE_URL environment variable is not set")
+        sys.exit(1)
+
+    print("=" * 80)
+    print(f"QUERY PLAN CHECK - {ROWS} transactions")
+    print("=" * 80)
+
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    cur = conn.cursor()
+    started = time.perf_counter()
+    seed(cur)
+    print(f"seeded in {time.perf_counter() - started:.1f} s")
+
+    # The old predicate for comparison: the cast hides transaction_date from its indexes
+    cur.execute(f"SET search_path = {SCRATCH}, {SCHEMA}")
+    for label, predicate in (
+        ('legacy ::date cast', "t.transaction_date::date = '2022-03-15'"),
+        ('half-open range', "t.transaction_date >= '2022-03-15' AND t.transaction_date < '2022-03-16'"),
+    ):
+        cur.execute(f"EXPLAIN (FORMAT JSON) SELECT t.amount, t.cost_price, t.currency FROM transactions t "
+                    f"WHERE t.status = 'completed' AND {predicate}")
+        nodes = scan_nodes(cur.fetchone()[0][0]['Plan'])
+        print(f"{label:<32} {', '.join(' '.join(filter(None, (n[0], n[2]))) for n in nodes)}")
+    print("-" * 80)
+
+    failures = 0
+    try:
+        for handler in EVENTS:
+            output = subprocess.run([sys.executable, __file__, f'--child={handler}'],
+                                    capture_output=True, text=True, check=True).stdout
+            for result in json.loads(output):
+                scans = sorted({f"{node_type} on {relation}" + (f" using {index}" if index else '')
+                                for node_type, relation, index in result['nodes']})
+                seq = any(node_type == 'Seq Scan' and relation not in result['allow_seq']
+                          for node_type, relation, _ in result['nodes'])
+                failures += seq
+                print(f"{'FAIL' if seq else 'ok':<5} {result['label']:<30} {'; '.join(scans) or 'no table access'}")
+    finally:
+        cur.execute(f"DROP SCHEMA IF EXISTS {SCRATCH} CASCADE")
+        cur.close()
+        conn.close()
+
+    if failures:
+        print(f"{failures} queries read transactions or daily_sales_rollup with a sequential scan")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1].startswith('--child='):
+        child(sys.argv[1].split('=', 1)[1])
+    else:
+        main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Peak memory of a full-history transaction export: fetchall() into a JSON list (how the
+list endpoint worked before pagination) versus the server-side cursor used by action=export.
+
+Each mode runs in its own process so that peak RSS is measured independently.
+Benchmark rows are inserted first and deleted at the end; both go through the per-row
+transaction triggers, so seeding a few million rows takes minutes.
+
+Usage: DATABASE_URL=postgresql://... python benchmarks/export_memory.py [rows]
+"""
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+ROWS = int(sys.argv[1]) if len(sys.argv) > 1 and not sys.argv[1].startswith('--') else 2000000
+NOTE = 'export memory benchmark'
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'transactions'))
+
+import db  # noqa: E402
+import index  # noqa: E402
+
+
+class CountingSink:
+    def __init__(self):
+        self.size = 0
+
+    def write(self, text):
+        self.size += len(text)
+
+
+def run_fetchall(conn):
+    cur = conn.cursor()
+    cur.execute('''
+        SELECT t.id, t.transaction_code, t.product_id, p.name, t.client_telegram,
+               t.client_name, t.amount, t.cost_price, t.profit, t.status,
+               t."transaction_date", t.notes, t.currency
+        FROM transactions t
+        LEFT JOIN products p ON t.product_id = p.id
+        ORDER BY t."transaction_date" DESC
+    ''')
+    rows = cur.fetchall()
+    body = json.dumps([index.transaction_to_dict(row) for row in rows])
+    cur.close()
+    return len(rows), len(body)
+
+
+def run_stream(conn):
+    # Page by page with after_id, as a client of action=export does
+    sink = CountingSink()
+    count, after_id = 0, 0
+    while True:
+        rows = index.iter_export_rows(conn, 't.id > %(after_id)s', {'after_id': after_id}, index.MAX_EXPORT_PAGE_SIZE)
+        exported, last_id = index.write_export(sink, rows, 'ndjson')
+        count += exported
+        if exported < index.MAX_EXPORT_PAGE_SIZE:
+            return count, sink.size
+        after_id = last_id
+
+
+def child(mode):
+    conn = db.get_connection()
+    started = time.perf_counter()
+    count, size = {'fetchall': run_fetchall, 'stream': run_stream}[mode](conn)
+    elapsed = time.perf_counter() - started
+    db.release_connection(conn)
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({'rows': count, 'bytes': size, 'seconds': elapsed, 'peak_rss_mb': peak_mb}))
+
+
+def execute(sql, args=None):
+    conn = db.get_connection()
+    cur = conn.cursor()
+    cur.execute(sql, args)
+    conn.commit()
+    cur.close()
+    db.release_connection(conn)
+
+
+def cleanup():
+    conn = db.get_connection()
+    cur = conn.cursor()
+    cur.execute("CREATE TEMP TABLE bench_ids ON COMMIT DROP AS SELECT id FROM transactions WHERE notes = %s", (NOTE,))
+    cur.execute("DELETE FROM transactions WHERE id IN (SELECT id FROM bench_ids)")
+    cur.execute("DELETE FROM transaction_deletions WHERE transaction_id IN (SELECT id FROM bench_ids)")
+    conn.commit()
+    cur.close()
+    db.release_connection(conn)
+
+
+def main():
+    if not os.environ.get('DATABASE_URL'):
+        print("ERROR: DATABASE_URL environment variable is not set")
+        sys.exit(1)
+
+    print("=" * 80)
+    print(f"EXPORT MEMORY BENCHMARK - {ROWS} extra transactions")
+    print("=" * 80)
+
+    started = time.perf_counter()
+    execute('''
+        INSERT INTO transactions (transaction_code, product_id, client_telegram, client_name, amount,
+                                  cost_price, profit, status, notes, currency, transaction_date)
+        SELECT 'BENCH-EXPORT-' || n, (SELECT MIN(id) FROM products), '@bench', 'Client ' || (n %% 5000),
+               1000 + n %% 900, 400, 600 + n %% 900, 'completed', %s, 'RUB',
+               TIMESTAMP '2020-01-01' + (n %% 2000) * INTERVAL '1 day'
+        FROM generate_series(1, %s) AS n
+    ''', (NOTE, ROWS))
+    print(f"seeded in {time.perf_counter() - started:.1f} s")
+
+    try:
+        for mode in ('stream', 'fetchall'):
+            output = subprocess.run([sys.executable, __file__, f'--child={mode}'],
+                                    capture_output=True, text=True, check=True).stdout
+            result = json.loads(output)
+            print(f"{mode:<10} rows {result['rows']:>9}   {result['bytes'] / 1e6:8.1f} MB out   "
+                  f"{result['seconds']:7.2f} s   peak RSS {result['peak_rss_mb']:8.1f} MB")
+    finally:
+        cleanup()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1].startswith('--child='):
+        child(sys.argv[1].split('=', 1)[1])
+    else:
+        main()
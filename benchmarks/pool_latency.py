@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Per-request latency of a backend handler with and without the connection pool.
+
+Usage: DATABASE_URL=postgresql://... python benchmarks/pool_latency.py [requests] [handler]
+"""
+import os
+import statistics
+import sys
+import time
+
+REQUESTS = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+HANDLER = sys.argv[2] if len(sys.argv) > 2 else 'products'
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', HANDLER))
+
+import db  # noqa: E402
+import index  # noqa: E402
+
+EVENTS = {
+    'products': {'httpMethod': 'GET', 'queryStringParameters': {}},
+    'expenses': {'httpMethod': 'GET', 'queryStringParameters': {'action': 'types'}},
+    'transactions': {'httpMethod': 'GET', 'queryStringParameters': {'limit': '20'}},
+    'clients': {'httpMethod': 'GET', 'queryStringParameters': {'action': 'connections'}},
+    'daily-cost-breakdown': {'httpMethod': 'GET', 'queryStringParameters': {'date': '2025-01-01'}},
+}
+
+
+def run(label: str, pool: db.ConnectionPool) -> None:
+    db._pool = pool
+    event = EVENTS[HANDLER]
+    index.handler(event, None)
+
+    timings = []
+    for _ in range(REQUESTS):
+        started = time.perf_counter()
+        response = index.handler(event, None)
+        timings.append((time.perf_counter() - started) * 1000)
+        assert response['statusCode'] == 200, response
+
+    timings.sort()
+    print(f"{label:<12} mean {statistics.mean(timings):8.2f} ms   "
+          f"p50 {timings[len(timings) // 2]:8.2f} ms   "
+          f"p95 {timings[int(len(timings) * 0.95) - 1]:8.2f} ms   "
+          f"connects {pool.stats['connects']}")
+    pool.closeall()
+
+
+def main():
+    dsn = os.environ.get('DATABASE_URL')
+    if not dsn:
+        print("ERROR: DATABASE_URL environment variable is not set")
+        sys.exit(1)
+
+    print("=" * 80)
+    print(f"CONNECTION POOL BENCHMARK - {HANDLER} handler, {REQUESTS} requests")
+    print("=" * 80)
+
+    # idle_timeout=0 evicts every released connection, i.e. connect per request
+    run('no pool', db.ConnectionPool(dsn, idle_timeout=0))
+    run('pooled', db.ConnectionPool(dsn))
+
+
+if __name__ == '__main__':
+    main()
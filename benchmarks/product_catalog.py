@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Product catalog cache: statements and latency per transactions POST and products GET with a
+warm catalog, against the same requests with the catalog dropped before each one.
+
+Transactions created by the run (client @catalog-bench) are deleted at the end.
+
+Usage: DATABASE_URL=postgresql://... python benchmarks/product_catalog.py [requests]
+"""
+import importlib
+import json
+import os
+import statistics
+import sys
+import time
+
+import psycopg2.errors
+import psycopg2.extensions
+
+REQUESTS = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+
+statements = []
+
+
+class CountingCursor(psycopg2.extensions.cursor):
+    def execute(self, query, vars=None):
+        statements.append(query.split(None, 1)[0].upper())
+        return super().execute(query, vars)
+
+
+def load_handler(name):
+    for module in ('index', 'db', 'etag', 'cache', 'daterange', 'catalog'):
+        sys.modules.pop(module, None)
+    sys.path.insert(0, os.path.join(BACKEND, name))
+    index = importlib.import_module('index')
+    sys.path.pop(0)
+    db = sys.modules['db']
+    db._pool = db.ConnectionPool(os.environ['DATABASE_URL'], cursor_factory=CountingCursor)
+    return index, sys.modules['catalog'].product_catalog, db
+
+
+def run(label, index, catalog, event, cold):
+    timings = []
+    statements.clear()
+    for _ in range(REQUESTS):
+        if cold:
+            catalog.invalidate()
+        while True:
+            started = time.perf_counter()
+            try:
+                response = index.handler(event, None)
+                break
+            except psycopg2.errors.UniqueViolation:
+                # single-row POST codes are TX-<seconds>-<4 random digits> and collide at this rate
+                continue
+        timings.append((time.perf_counter() - started) * 1000)
+        assert response['statusCode'] == 200, response
+    timings.sort()
+    print(f"{label:<40} p50 {statistics.median(timings):7.3f} ms  p99 {timings[int(REQUESTS * 0.99) - 1]:7.3f} ms  "
+          f"{len(statements) / REQUESTS:4.1f} statements/request")
+
+
+def main():
+    if not os.environ.get('DATABASE_URL'):
+        print("ERROR: DATABASE_URL environment variable is not set")
+        sys.exit(1)
+
+    print("=" * 80)
+    print(f"PRODUCT CATALOG CACHE - {REQUESTS} requests each")
+    print("=" * 80)
+
+    index, catalog, db = load_handler('transactions')
+    post = {'httpMethod': 'POST', 'body': json.dumps({'product_id': 1, 'client_telegram': '@catalog-bench',
+                                                      'currency': 'USD', 'transaction_date': '2025-01-01'})}
+    try:
+        index.handler(post, None)
+        run('transactions POST, catalog reloaded', index, catalog, post, cold=True)
+        run('transactions POST, warm catalog', index, catalog, post, cold=False)
+    finally:
+        conn = db.get_connection()
+        cur = conn.cursor()
+        cur.execute("DELETE FROM transactions WHERE client_telegram = '@catalog-bench'")
+        conn.commit()
+        cur.close()
+        db.release_connection(conn)
+
+    index, catalog, _ = load_handler('products')
+    get = {'httpMethod': 'GET', 'queryStringParameters': {}, 'headers': {}}
+    run('products GET, catalog rebuilt', index, catalog, get, cold=True)
+    run('products GET, pre-serialized body', index, catalog, get, cold=False)
+
+
+if __name__ == '__main__':
+    main()
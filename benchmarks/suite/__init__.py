@@ -0,0 +1,10 @@
+"""
+Offline benchmark suite: drives every backend/*/index.py handler with synthetic API Gateway
+events against a local Postgres that has db_migrations applied, and records per action
+p50/p95/p99 latency, statements per request and rows scanned.
+
+    python -m benchmarks.suite --setup --output before.json
+    python -m benchmarks.suite --output after.json --compare before.json
+
+Run from the repository root; see __main__.py for the options.
+"""
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark suite entry point. Every handler runs in its own interpreter against
+DATABASE_URL; results go to a JSON file that a later run can be compared with.
+
+    python -m benchmarks.suite [--setup] [--transactions N] [--clients N] [--seed N] [--anchor-date YYYY-MM-DD]
+                               [--iterations N] [--handler NAME ...] [--output results.json]
+                               [--compare baseline.json] [--threshold 0.2] [--metrics-dir DIR]
+
+--setup drops and recreates the application schema in DATABASE_URL, applies db_migrations and
+loads a generated data set (see generate.py): only point it at a scratch database. Without
+--setup the current data is used.
+--compare exits with 1 when an action got slower than the baseline by more than the threshold
+at p50 or p95, issues more statements, or scans more rows.
+--metrics-dir turns metrics on in every handler process, has each flush them there (METRICS_DIR) and writes them,
+added up across processes, to metrics.prom in that directory in Prometheus text format.
+
+Usage: DATABASE_URL=postgresql://... python -m benchmarks.suite --setup --output before.json
+"""
+import argparse
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+from datetime import date, datetime, timezone
+
+from . import database, generate, runner
+
+# Regressions below this many milliseconds are noise on a local database
+MIN_DELTA_MS = 1.0
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=database.ROOT, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True,
+                               text=True, cwd=database.ROOT, check=True).stdout.strip()
+        return commit + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def child_env(metrics_dir=None):
+    env = dict(os.environ)
+    # Offline: the exchange-rate handler serves the seeded rate of the day and never reaches these
+    env.setdefault('CBR_RATE_URL', 'http://127.0.0.1:9/daily_json.js')
+    env.setdefault('FALLBACK_RATE_URL', 'http://127.0.0.1:9/latest/USD')
+    env.setdefault('JWT_SECRET', 'benchmark-suite')
+    # Per-statement fingerprints and log lines would be timed along with the handler
+    env.pop('SQL_TRACE', None)
+    if metrics_dir:
+        env['METRICS_ENABLED'] = '1'
+        env['METRICS_DIR'] = os.path.abspath(metrics_dir)
+    return env
+
+
+def write_metrics(metrics_dir):
+    '''Adds up the snapshots the handler processes flushed, with the handlers' own metrics module'''
+    spec = importlib.util.spec_from_file_location(
+        'suite_metrics', os.path.join(runner.BACKEND, 'transactions', 'metrics.py'))
+    metrics = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(metrics)
+    snapshots = []
+    for name in sorted(os.listdir(metrics_dir)):
+        if name.endswith('.json'):
+            with open(os.path.join(metrics_dir, name), encoding='utf-8') as f:
+                snapshots.append(json.load(f))
+    path = os.path.join(metrics_dir, 'metrics.prom')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(metrics.render(metrics.merge(snapshots)))
+    return path
+
+
+def compare(results, baseline, threshold):
+    base = {(row['handler'], row['action']): row for row in baseline['results']}
+    regressions = []
+    print(f"{'':<5} {'handler':<22} {'action':<26} {'p50 ms':>17} {'p95 ms':>17} {'stmts':>9} {'rows':>15}")
+    for row in results:
+        old = base.get((row['handler'], row['action']))
+        if old is None:
+            continue
+        reasons = [
+            f'{metric} {old[metric]:.1f} -> {row[metric]:.1f} ms' for metric in ('p50_ms', 'p95_ms')
+            if row[metric] - old[metric] > max(old[metric] * threshold, MIN_DELTA_MS)
+        ]
+        if row['statements'] > old['statements']:
+            reasons.append(f"statements {old['statements']} -> {row['statements']}")
+        if row['rows_scanned'] > old['rows_scanned'] * (1 + threshold):
+            reasons.append(f"rows scanned {old['rows_scanned']} -> {row['rows_scanned']}")
+        if row['status'] != old['status']:
+            reasons.append(f"status {old['status']} -> {row['status']}")
+        if reasons:
+            regressions.append((row, reasons))
+        print(f"{'SLOW' if reasons else 'ok':<5} {row['handler']:<22} {row['action']:<26} "
+              f"{old['p50_ms']:>7.1f} -> {row['p50_ms']:<7.1f} {old['p95_ms']:>7.1f} -> {row['p95_ms']:<7.1f} "
+              f"{old['statements']:>3} -> {row['statements']:<3} {old['rows_scanned']:>6} -> {row['rows_scanned']:<6}")
+    for row, reasons in regressions:
+        print(f"{row['handler']} {row['action']}: {'; '.join(reasons)}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.suite')
+    parser.add_argument('--setup', action='store_true', help='recreate the schema, migrate and load generated data (destroys data)')
+    parser.add_argument('--transactions', type=int, default=20000)
+    parser.add_argument('--clients', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--anchor-date', type=date.fromisoformat, help='last day of the --setup data set (default today)')
+    parser.add_argument('--iterations', type=int, default=30)
+    parser.add_argument('--handler', action='append', help='only these handlers (repeatable)')
+    parser.add_argument('--output', default='benchmark-results.json')
+    parser.add_argument('--compare', help='baseline results JSON')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed relative slowdown')
+    parser.add_argument('--metrics-dir', help='collect handler metrics across processes into this directory')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(runner.run_handler(args.child, args.iterations)))
+        return
+
+    dsn = os.environ.get('DATABASE_URL')
+    if not dsn:
+        print("ERROR: DATABASE_URL environment variable is not set")
+        sys.exit(1)
+
+    if args.setup:
+        print(f"setting up schema: {len(database.migration_files())} migrations, "
+              f"{args.transactions} transactions, {args.clients} clients")
+        database.reset_schema(dsn)
+        database.apply_migrations(dsn)
+        generate.load(dsn, generate.Sizes(transactions=args.transactions, clients=args.clients, expenses=200),
+                      args.seed, log=lambda line: None, anchor=args.anchor_date)
+    # The auth scenarios log in as this user, on a fresh schema or on existing data
+    database.create_suite_user(dsn)
+
+    results = []
+    if args.metrics_dir:
+        os.makedirs(args.metrics_dir, exist_ok=True)
+        for name in os.listdir(args.metrics_dir):
+            if name.endswith('.json'):
+                os.remove(os.path.join(args.metrics_dir, name))
+    env = child_env(args.metrics_dir)
+    try:
+        for handler in args.handler or runner.handlers():
+            for row in runner.spawn(handler, args.iterations, env):
+                results.append(row)
+                print(f"{row['handler']:<22} {row['action']:<26} status {row['status']:<4} "
+                      f"p50 {row['p50_ms']:>8.2f}  p95 {row['p95_ms']:>8.2f}  p99 {row['p99_ms']:>8.2f} ms  "
+                      f"{row['statements']:>3} stmts  {row['rows_scanned']:>7} rows scanned")
+    finally:
+        database.cleanup(dsn)
+
+    report = {
+        'commit': git_commit(),
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'server_version': database.server_version(dsn),
+        'python': sys.version.split()[0],
+        'iterations': args.iterations,
+        'anchor_date': (args.anchor_date or date.today()).isoformat() if args.setup else None,
+        'results': results
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"results written to {args.output}")
+    if args.metrics_dir:
+        print(f"metrics written to {write_metrics(args.metrics_dir)}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        print("-" * 80)
+        print(f"compared with {args.compare} ({baseline.get('commit')})")
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Database for the suite: recreates the application schema and applies db_migrations in order;
+generate.py loads the data. Also the login the auth scenarios use and the cleanup of rows
+the write scenarios create.
+"""
+import glob
+import os
+
+import bcrypt
+import psycopg2
+from psycopg2 import sql
+
+SCHEMA = 't_p6388661_digital_goods_accoun'
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+MIGRATIONS = os.path.join(ROOT, 'db_migrations')
+
+SUITE_EMAIL = 'suite@example.com'
+SUITE_PASSWORD = 'suite-password'
+SUITE_TAG = '@suite'
+
+
+def migration_files():
+    # V0002 before V0010: the version number, not the file name, orders migrations
+    files = glob.glob(os.path.join(MIGRATIONS, 'V*__*.sql'))
+    return sorted(files, key=lambda path: int(os.path.basename(path)[1:].split('__', 1)[0]))
+
+
+def reset_schema(dsn):
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute('SELECT current_database()')
+    database = cur.fetchone()[0]
+    cur.execute(sql.SQL('DROP SCHEMA IF EXISTS {} CASCADE').format(sql.Identifier(SCHEMA)))
+    cur.execute(sql.SQL('CREATE SCHEMA {}').format(sql.Identifier(SCHEMA)))
+    # The early migrations use unqualified table names, as on the platform
+    cur.execute(sql.SQL('ALTER DATABASE {} SET search_path TO {}').format(sql.Identifier(database), sql.Identifier(SCHEMA)))
+    cur.close()
+    conn.close()
+
+
+def apply_migrations(dsn):
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    cur = conn.cursor()
+    for path in migration_files():
+        with open(path, encoding='utf-8') as f:
+            cur.execute(f.read())
+    cur.close()
+    conn.close()
+
+
+def create_suite_user(dsn):
+    conn = psycopg2.connect(dsn)
+    cur = conn.cursor()
+    cur.execute('''
+        INSERT INTO users (email, password_hash, full_name, is_admin, is_active)
+        VALUES (%s, %s, 'Benchmark Suite', TRUE, TRUE)
+        ON CONFLICT (email) DO UPDATE SET password_hash = EXCLUDED.password_hash
+    ''', (SUITE_EMAIL, bcrypt.hashpw(SUITE_PASSWORD.encode('utf-8'), bcrypt.gensalt(rounds=10)).decode('utf-8')))
+    conn.commit()
+    cur.close()
+    conn.close()
+
+
+def cleanup(dsn):
+    '''Removes the rows the write scenarios created, tagged with SUITE_TAG'''
+    conn = psycopg2.connect(dsn)
+    cur = conn.cursor()
+    cur.execute('DELETE FROM transactions WHERE client_telegram = %s', (SUITE_TAG,))
+    cur.execute('DELETE FROM products WHERE name LIKE %s', (SUITE_TAG + '%',))
+    cur.execute('DELETE FROM expenses WHERE description = %s', (SUITE_TAG,))
+    conn.commit()
+    cur.close()
+    conn.close()
+
+
+def server_version(dsn):
+    conn = psycopg2.connect(dsn)
+    try:
+        return conn.server_version
+    finally:
+        conn.close()
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+Synthetic data generator for scale testing: loads products, years of USD/RUB rates, clients
+with a client_connections graph, transactions and expenses into DATABASE_URL through COPY.
+
+The same --seed, sizes and --anchor-date always give the same rows; only columns the database
+fills on insert (created_at, updated_at, change_xid) differ between loads. Dates count back
+from the anchor date, today by default, so the today/week/month stats filters have data
+whenever the load runs; pass a fixed --anchor-date to reproduce a data set on another day.
+Volume grows towards the present, a few clients make most purchases, and most product sales
+come from a few products.
+
+The rollup and client_stats triggers are switched off for the transactions COPY and
+their tables are rebuilt once at the end; client groups are rebuilt with the clients function's
+own code. The suite's --setup loads its data set through load().
+
+    python -m benchmarks.suite.generate --reset --transactions 1000000 --clients 20000
+
+Usage: DATABASE_URL=postgresql://... python -m benchmarks.suite.generate [--reset] [--transactions N]
+       [--years N] [--clients N] [--expenses N] [--products N] [--seed N] [--anchor-date YYYY-MM-DD]
+"""
+import argparse
+import bisect
+import itertools
+import math
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+import psycopg2
+import psycopg2.extras
+
+from . import database
+
+STATUSES = (('completed', 0.86), ('pending', 0.09), ('failed', 0.05))
+USD_SHARE = 0.25
+ANONYMOUS_SHARE = 0.04
+DISCOUNT_SHARE = 0.1
+CONNECTED_SHARE = 0.35
+CONNECTION_TYPES = (('referral', 0.6), ('reseller', 0.25), ('colleague', 0.15))
+IMPORTANCE = (('low', 0.2), ('medium', 0.55), ('high', 0.2), ('critical', 0.05))
+EXPENSE_TYPES = ('Аренда', 'Реклама', 'Зарплаты', 'Серверы', 'Лицензии', 'Бухгалтерия', 'Связь', 'Прочее')
+DISTRIBUTIONS = (('one_time', 0.55), ('monthly', 0.35), ('yearly', 0.1))
+PRODUCT_KINDS = ('Лицензия', 'Подписка', 'Модуль', 'Консультация', 'Ключ активации', 'Пакет')
+PRODUCT_TIERS = ('Basic', 'Standard', 'Premium', 'Enterprise', 'Team', 'Pro', 'Lite')
+
+# Purchases by hour of day: quiet at night, peak in the afternoon
+HOUR_WEIGHTS = (1, 1, 1, 1, 1, 1, 2, 3, 5, 7, 8, 9, 9, 9, 9, 9, 8, 8, 7, 6, 5, 4, 3, 2)
+RUB_PER_USD = 90
+
+# Rows that the per-row triggers would otherwise maintain one INSERT at a time; the batch
+# triggers do not fire during COPY but would still keep every copied row in their transition table
+BULK_TRIGGERS = (
+    ('transactions', 'trg_transactions_daily_sales_rollup_insert'),
+    ('transactions', 'trg_transactions_client_stats_insert'),
+    ('transactions', 'trg_transactions_daily_sales_rollup_batch'),
+    ('transactions', 'trg_transactions_client_stats_batch'),
+    ('exchange_rates', 'trg_exchange_rates_client_stats_insert'),
+)
+
+
+class Sizes:
+    def __init__(self, transactions=1000000, years=3, clients=20000, expenses=2000, products=40):
+        self.transactions = transactions
+        self.years = years
+        self.clients = clients
+        self.expenses = expenses
+        self.products = products
+
+    @property
+    def days(self):
+        return self.years * 365
+
+
+def picker(rng, weighted):
+    '''Draws from (value, weight) pairs with one random() and a bisect'''
+    values = [value for value, _ in weighted]
+    cum_weights = list(itertools.accumulate(weight for _, weight in weighted))
+    total = cum_weights[-1]
+    return lambda: values[bisect.bisect(cum_weights, rng.random() * total)]
+
+
+class CopySource:
+    '''File-like object over generated rows for copy_expert, so no row set is held in memory'''
+
+    def __init__(self, rows):
+        self.lines = ('\t'.join(r'\N' if value is None else str(value) for value in row) + '\n' for row in rows)
+        self.buffer = ''
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            line = next(self.lines, None)
+            if line is None:
+                break
+            self.buffer += line
+        if size < 0:
+            size = len(self.buffer)
+        chunk, self.buffer = self.buffer[:size], self.buffer[size:]
+        return chunk
+
+
+def copy(cur, table, columns, rows):
+    cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", CopySource(rows), size=1 << 16)
+    return cur.rowcount
+
+
+def next_id(cur, table):
+    cur.execute(f'SELECT COALESCE(MAX(id), 0) FROM {table}')
+    return cur.fetchone()[0] + 1
+
+
+def sync_sequence(cur, table):
+    cur.execute(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT MAX(id) FROM {table}))")
+
+
+def product_rows(rng, first_id, count):
+    for n in range(count):
+        cost = rng.randrange(500, 30000, 100)
+        sale = round(cost * rng.uniform(1.3, 3.0), -2)
+        name = f'{PRODUCT_KINDS[n % len(PRODUCT_KINDS)]} {PRODUCT_TIERS[n // len(PRODUCT_KINDS) % len(PRODUCT_TIERS)]} {n + 1}'
+        yield (first_id + n, name, cost, sale, None, 'RUB',
+               round(cost / RUB_PER_USD, 2), round(sale / RUB_PER_USD, 2))
+
+
+def rate_rows(rng, first_day, today):
+    # A random walk of the daily rate, drifting upwards like the ruble over the years
+    rate = 60.0
+    for offset in range((today - first_day).days + 1):
+        day = first_day + timedelta(days=offset)
+        rate = min(max(rate * math.exp(rng.gauss(0.0003, 0.008)), 50.0), 130.0)
+        yield ('USD', 'RUB', round(rate, 4), day, 'generator', datetime.combine(day, datetime.min.time()) + timedelta(hours=12))
+
+
+def client_rows(rng, first_id, count):
+    importance = picker(rng, IMPORTANCE)
+    for k in range(count):
+        yield (first_id + k, f'@client{first_id + k}', f'Client {first_id + k}', importance())
+
+
+def connection_rows(rng, first_id, count):
+    connection_type = picker(rng, CONNECTION_TYPES)
+    for k in range(1, count):
+        if rng.random() >= CONNECTED_SHARE:
+            continue
+        # Early clients collect most referrals, like real hubs
+        target = int(k * rng.random() ** 2)
+        yield (first_id + k, first_id + target, connection_type(), None)
+
+
+def transaction_rows(rng, sizes, seed, products, first_client, today):
+    status = picker(rng, STATUSES)
+    hour = picker(rng, list(enumerate(HOUR_WEIGHTS)))
+    # Zipf-like popularity: the first products sell most
+    product = picker(rng, [(row, 1 / (rank + 1)) for rank, row in enumerate(products)])
+    for n in range(sizes.transactions):
+        product_id, cost_rub, sale_rub, cost_usd, sale_usd = product()
+        currency = 'USD' if rng.random() < USD_SHARE else 'RUB'
+        amount, cost = (sale_usd, cost_usd) if currency == 'USD' else (sale_rub, cost_rub)
+        if rng.random() < DISCOUNT_SHARE:
+            amount = round(float(amount) * rng.uniform(0.7, 0.95), 2)
+        if rng.random() < ANONYMOUS_SHARE:
+            telegram = name = None
+        else:
+            client = first_client + int(sizes.clients * rng.random() ** 2)
+            telegram, name = f'@client{client}', f'Client {client}'
+        # Density falls linearly with age: the business grows towards today
+        age = int(sizes.days * (1 - math.sqrt(rng.random())))
+        moment = datetime.combine(today - timedelta(days=age), datetime.min.time()) + timedelta(
+            hours=hour(), minutes=rng.randrange(60), seconds=rng.randrange(60))
+        yield (f'GEN-{seed}-{n + 1}', product_id, telegram, name, amount, cost, round(float(amount) - float(cost), 2),
+               status(), currency, moment, None)
+
+
+def expense_rows(rng, sizes, type_ids, today):
+    distribution = picker(rng, DISTRIBUTIONS)
+    for n in range(sizes.expenses):
+        kind = distribution()
+        start = today - timedelta(days=rng.randrange(sizes.days))
+        if kind == 'one_time':
+            amount, end = rng.randrange(1000, 200000, 100), None
+        else:
+            amount = rng.randrange(5000, 150000, 100) if kind == 'monthly' else rng.randrange(20000, 1000000, 1000)
+            end = None if rng.random() < 0.5 else start + timedelta(days=rng.randrange(30, 720))
+        currency = 'USD' if rng.random() < 0.2 else 'RUB'
+        if currency == 'USD':
+            amount = round(amount / RUB_PER_USD, 2)
+        type_index = rng.randrange(len(type_ids))
+        yield (type_ids[type_index], amount, f'{EXPENSE_TYPES[type_index]} #{n + 1}', start, end, kind, 'active', currency)
+
+
+def load(dsn, sizes, seed=1, log=print, anchor=None):
+    '''Loads one generated data set ending at anchor (default today); returns the number of rows written per table'''
+    rng = random.Random(seed)
+    today = anchor or date.today()
+    counts = {}
+    conn = psycopg2.connect(dsn)
+    cur = conn.cursor()
+
+    def step(table, func):
+        started = time.perf_counter()
+        counts[table] = func()
+        log(f"{table:<26} {counts[table]:>10} rows  {time.perf_counter() - started:6.1f} s")
+
+    for table, trigger in BULK_TRIGGERS:
+        cur.execute(f'ALTER TABLE {table} DISABLE TRIGGER {trigger}')
+
+    first_product = next_id(cur, 'products')
+    step('products', lambda: copy(cur, 'products', (
+        'id', 'name', 'cost_price', 'sale_price', 'description', 'currency', 'cost_price_usd', 'sale_price_usd'
+    ), product_rows(rng, first_product, sizes.products)))
+    sync_sequence(cur, 'products')
+    cur.execute('''
+        SELECT id, cost_price, sale_price,
+               COALESCE(cost_price_usd, round(cost_price / %s, 2)), COALESCE(sale_price_usd, round(sale_price / %s, 2))
+        FROM products WHERE is_active ORDER BY id
+    ''', (RUB_PER_USD, RUB_PER_USD))
+    products = cur.fetchall()
+
+    # Rates go through a staging table: the day's placeholder rate from V0004 is already there
+    cur.execute('CREATE TEMP TABLE generated_rates (LIKE exchange_rates INCLUDING DEFAULTS) ON COMMIT DROP')
+    copy(cur, 'generated_rates', ('currency_from', 'currency_to', 'rate', 'date', 'source', 'fetched_at'),
+         rate_rows(rng, today - timedelta(days=sizes.days), today))
+
+    def upsert_rates():
+        cur.execute('''
+            INSERT INTO exchange_rates (currency_from, currency_to, rate, date, source, fetched_at)
+            SELECT currency_from, currency_to, rate, date, source, fetched_at FROM generated_rates
+            ON CONFLICT (currency_from, currency_to, date) DO UPDATE
+            SET rate = EXCLUDED.rate, source = EXCLUDED.source, fetched_at = EXCLUDED.fetched_at
+        ''')
+        return cur.rowcount
+    step('exchange_rates', upsert_rates)
+
+    first_client = next_id(cur, 'clients')
+    step('clients', lambda: copy(cur, 'clients', ('id', 'client_telegram', 'client_name', 'importance'),
+                                 client_rows(rng, first_client, sizes.clients)))
+    sync_sequence(cur, 'clients')
+    step('client_connections', lambda: copy(cur, 'client_connections', (
+        'client_id_from', 'client_id_to', 'connection_type', 'description'
+    ), connection_rows(rng, first_client, sizes.clients)))
+
+    step('transactions', lambda: copy(cur, 'transactions', (
+        'transaction_code', 'product_id', 'client_telegram', 'client_name', 'amount', 'cost_price', 'profit',
+        'status', 'currency', 'transaction_date', 'notes'
+    ), transaction_rows(rng, sizes, seed, products, first_client, today)))
+
+    cur.execute('SELECT name, id FROM expense_types WHERE name = ANY(%s)', (list(EXPENSE_TYPES),))
+    type_ids = dict(cur.fetchall())
+    missing = [(name,) for name in EXPENSE_TYPES if name not in type_ids]
+    if missing:
+        type_ids.update(psycopg2.extras.execute_values(
+            cur, 'INSERT INTO expense_types (name) VALUES %s RETURNING name, id', missing, fetch=True))
+    step('expenses', lambda: copy(cur, 'expenses', (
+        'expense_type_id', 'amount', 'description', 'start_date', 'end_date', 'distribution_type', 'status', 'currency'
+    ), expense_rows(rng, sizes, [type_ids[name] for name in EXPENSE_TYPES], today)))
+
+    for table, trigger in BULK_TRIGGERS:
+        cur.execute(f'ALTER TABLE {table} ENABLE TRIGGER {trigger}')
+
+    def scalar(query, args=None):
+        cur.execute(query, args)
+        return cur.fetchone()[0]
+    step('expense_daily_allocation', lambda: scalar('SELECT extend_expense_allocations(%s)', (today + timedelta(days=365),)))
+    step('daily_sales_rollup', lambda: scalar('SELECT rebuild_daily_sales_rollup()'))
+    step('client_stats', lambda: scalar('SELECT rebuild_client_stats()'))
+    conn.commit()
+
+    # Groups are kept by the clients function itself, so the load reuses its rebuild
+    sys.path.insert(0, os.path.join(database.ROOT, 'backend', 'clients'))
+    try:
+        from groups import rebuild_groups
+        step('client_groups', lambda: rebuild_groups(conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)))
+        conn.commit()
+    finally:
+        sys.path.pop(0)
+        sys.modules.pop('groups', None)
+
+    conn.autocommit = True
+    step('analyze', lambda: cur.execute('VACUUM ANALYZE') or 0)
+    cur.close()
+    conn.close()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.suite.generate')
+    parser.add_argument('--reset', action='store_true', help='recreate the schema and apply db_migrations first (destroys data)')
+    parser.add_argument('--transactions', type=int, default=1000000)
+    parser.add_argument('--years', type=int, default=3)
+    parser.add_argument('--clients', type=int, default=20000)
+    parser.add_argument('--expenses', type=int, default=2000)
+    parser.add_argument('--products', type=int, default=40)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--anchor-date', type=date.fromisoformat, help='last day of the data set (default today)')
+    args = parser.parse_args()
+
+    dsn = os.environ.get('DATABASE_URL')
+    if not dsn:
+        print("ERROR: DATABASE_URL environment variable is not set")
+        sys.exit(1)
+
+    started = time.perf_counter()
+    if args.reset:
+        database.reset_schema(dsn)
+        database.apply_migrations(dsn)
+        print(f"schema recreated, {len(database.migration_files())} migrations applied")
+    load(dsn, Sizes(args.transactions, args.years, args.clients, args.expenses, args.products), args.seed,
+         anchor=args.anchor_date)
+    print(f"done in {time.perf_counter() - started:.1f} s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Runs the scenarios of one handler in a fresh interpreter, the way a cold function instance
+would load it: its directory first on sys.path, its own db.py, etag.py and the rest.
+
+Per scenario the first request is timed alone (for a handler's first scenario that is the cold
+start: imports done, no pooled connection yet), then one untimed request is traced with EXPLAIN ANALYZE for rows scanned, then the timed
+iterations record latency and statements per request.
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from . import tracing
+from .database import ROOT
+from .scenarios import scenarios
+
+BACKEND = os.path.join(ROOT, 'backend')
+
+
+def handlers():
+    return [name for name in scenarios() if os.path.isfile(os.path.join(BACKEND, name, 'index.py'))]
+
+
+def percentile(timings, pct):
+    if len(timings) == 1:
+        return timings[0]
+    return statistics.quantiles(timings, n=100, method='inclusive')[pct - 1]
+
+
+def request(index, state, base_event, before, explain=False):
+    # before() may call the handler itself, so the trace starts after it
+    overrides = before(index, state) if before else None
+    tracing.trace.reset(explain)
+    started = time.perf_counter()
+    response = index.handler(dict(base_event, **(overrides or {})), None)
+    return response.get('statusCode'), (time.perf_counter() - started) * 1000
+
+
+def run_handler(handler, iterations):
+    sys.path.insert(0, os.path.join(BACKEND, handler))
+    if os.path.isfile(os.path.join(BACKEND, handler, 'db.py')):
+        import db
+        tracing.install(db)
+    import index
+
+    state = {}
+    results = []
+    for label, base_event, before in scenarios()[handler]:
+        status, first_ms = request(index, state, base_event, before)
+
+        request(index, state, base_event, before, explain=True)
+        rows_scanned = tracing.trace.rows_scanned()
+
+        timings = []
+        statements = []
+        for _ in range(iterations):
+            status, elapsed_ms = request(index, state, base_event, before)
+            timings.append(elapsed_ms)
+            statements.append(len(tracing.trace.statements))
+
+        results.append({
+            'handler': handler,
+            'action': label,
+            'status': status,
+            'iterations': iterations,
+            'first_ms': round(first_ms, 3),
+            'p50_ms': round(percentile(timings, 50), 3),
+            'p95_ms': round(percentile(timings, 95), 3),
+            'p99_ms': round(percentile(timings, 99), 3),
+            'mean_ms': round(statistics.fmean(timings), 3),
+            'statements': max(statements),
+            'rows_scanned': rows_scanned
+        })
+    return results
+
+
+def spawn(handler, iterations, env):
+    output = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.suite', f'--child={handler}', f'--iterations={iterations}'],
+        capture_output=True, text=True, cwd=ROOT, env=env
+    )
+    if output.returncode != 0:
+        raise RuntimeError(f'{handler} failed:\n{output.stderr}')
+    # Handlers may print; the results are the last line
+    return json.loads(output.stdout.strip().splitlines()[-1])
@@ -0,0 +1,105 @@
+"""
+Synthetic API Gateway events per handler. A scenario is (label, event, before): before, if
+set, runs untimed ahead of every request with the handler module and a per-handler state
+dict, and may return fields that replace those of the event.
+
+Reads come first, writes last; every row a write creates is tagged with SUITE_TAG so
+database.cleanup() can remove it.
+"""
+import json
+from datetime import date, timedelta
+
+from .database import SUITE_EMAIL, SUITE_PASSWORD, SUITE_TAG
+
+
+def event(method='GET', params=None, body=None):
+    return {
+        'httpMethod': method,
+        'queryStringParameters': params or {},
+        'headers': {},
+        'body': json.dumps(body) if body is not None else '',
+        'isBase64Encoded': False
+    }
+
+
+def uncached(index, state):
+    # The warm-instance stats cache would turn every request after the first into a hit
+    index.STATS_CACHE.invalidate()
+
+
+def second_page(index, state):
+    if 'cursor' not in state:
+        response = index.handler(event(params={'page_size': '50'}), None)
+        state['cursor'] = json.loads(response['body'])['next_cursor']
+    return {'queryStringParameters': {'page_size': '50', 'cursor': state['cursor']}}
+
+
+def login_token(index, state):
+    if 'token' not in state:
+        response = index.handler(event('POST', body={'action': 'login', 'email': SUITE_EMAIL, 'password': SUITE_PASSWORD}), None)
+        state['token'] = json.loads(response['body'])['token']
+    return {'body': json.dumps({'action': 'verify', 'token': state['token']})}
+
+
+def scenarios():
+    today = date.today()
+    month_ago = (today - timedelta(days=30)).isoformat()
+    quarter_ago = (today - timedelta(days=90)).isoformat()
+
+    return {
+        'transactions': [
+            ('stats, today', event(params={'action': 'stats', 'date_filter': 'today'}), uncached),
+            ('stats, week', event(params={'action': 'stats', 'date_filter': 'week'}), uncached),
+            ('stats, month', event(params={'action': 'stats', 'date_filter': 'month'}), uncached),
+            ('stats, custom 90 days', event(params={'action': 'stats', 'date_filter': 'custom',
+                                                    'start_date': quarter_ago, 'end_date': today.isoformat()}), uncached),
+            ('stats, all', event(params={'action': 'stats', 'date_filter': 'all'}), uncached),
+            ('stats, month, cached', event(params={'action': 'stats', 'date_filter': 'month'}), None),
+            ('list, default page', event(), None),
+            ('list, page_size=50', event(params={'page_size': '50'}), None),
+            ('list, second page', event(), second_page),
+            ('export, csv 1000 rows', event(params={'action': 'export', 'format': 'csv', 'page_size': '1000'}), None),
+            ('create', event('POST', body={'product_id': 1, 'client_telegram': SUITE_TAG, 'client_name': SUITE_TAG,
+                                           'currency': 'RUB'}), None),
+            ('import, 20 rows', event('POST', body={'action': 'import', 'transactions': [
+                {'product_id': 1 + n % 6, 'client_telegram': SUITE_TAG, 'client_name': SUITE_TAG,
+                 'currency': 'USD' if n % 3 == 0 else 'RUB'} for n in range(20)
+            ]}), None),
+        ],
+        'products': [
+            ('list', event(), None),
+            ('create', event('POST', body={'name': SUITE_TAG + ' product', 'cost_price': 1000, 'sale_price': 2000,
+                                           'description': SUITE_TAG}), None),
+        ],
+        'clients': [
+            ('list, all', event(params={'action': 'list'}), None),
+            ('list, top=20', event(params={'action': 'list', 'top': '20'}), None),
+            ('list, page_size=50', event(params={'action': 'list', 'page_size': '50'}), None),
+            ('neighborhood, depth=2', event(params={'action': 'neighborhood', 'client_id': '1', 'depth': '2'}), None),
+            ('chain, up', event(params={'action': 'chain', 'client_id': '300', 'depth': '6'}), None),
+            ('path', event(params={'action': 'path', 'client_id': '300', 'target_id': '1', 'depth': '6'}), None),
+            ('groups, top=20', event(params={'action': 'groups', 'top': '20'}), None),
+            ('connections', event(params={'action': 'connections'}), None),
+        ],
+        'daily-cost-breakdown': [
+            ('breakdown, one day', event(params={'date': (today - timedelta(days=7)).isoformat(), 'exchange_rate': '82'}), None),
+        ],
+        'expenses': [
+            ('list', event(), None),
+            ('types', event(params={'action': 'types'}), None),
+            ('daily, 30 days', event(params={'action': 'daily', 'start_date': month_ago, 'end_date': today.isoformat()}), None),
+            ('create', event('POST', body={'action': 'create_expense', 'expense_type_id': 1, 'amount': 1500,
+                                           'description': SUITE_TAG, 'start_date': month_ago,
+                                           'distribution_type': 'monthly'}), None),
+        ],
+        'exchange-rate': [
+            ('current rate', event(), None),
+        ],
+        'auth': [
+            ('login', event('POST', body={'action': 'login', 'email': SUITE_EMAIL, 'password': SUITE_PASSWORD}), None),
+            ('verify', event('POST'), login_token),
+        ],
+        'hash-password': [
+            ('hash', event(), None),
+        ],
+    }
@@ -0,0 +1,127 @@
+"""
+Statement tracing for a handler under test. The handler's db pool is swapped for one whose
+connections hand out traced cursors, whatever cursor_factory the handler asks for, so every
+statement a request issues is counted.
+
+With explain on, each statement is first run as EXPLAIN (ANALYZE, FORMAT JSON) inside a
+savepoint that is rolled back, and the rows its table scans read are added up: rows returned
+plus rows removed by filters, times loops. Statements run inside plpgsql functions and
+triggers are not visible to EXPLAIN, so for those only the outer statement is counted; reads
+through server-side (named) cursors are counted as statements but not explained.
+"""
+import time
+
+import psycopg2
+import psycopg2.extensions
+
+EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'VALUES')
+
+
+class Trace:
+    def __init__(self):
+        self.explain = False
+        self.statements = []
+
+    def reset(self, explain=False):
+        self.explain = explain
+        self.statements = []
+
+    def rows_scanned(self):
+        return sum(statement['rows_scanned'] or 0 for statement in self.statements)
+
+
+trace = Trace()
+
+
+def scanned_rows(plan):
+    rows = 0
+    # Bitmap Index Scans feed a Bitmap Heap Scan on the same relation: only the heap scan has a relation name
+    if plan.get('Relation Name'):
+        rows = (plan.get('Actual Rows', 0) + plan.get('Rows Removed by Filter', 0)
+                + plan.get('Rows Removed by Index Recheck', 0)) * plan.get('Actual Loops', 1)
+    return rows + sum(scanned_rows(child) for child in plan.get('Plans', []))
+
+
+def query_text(cursor, query):
+    if isinstance(query, bytes):
+        return query.decode('utf-8')
+    if not isinstance(query, str):
+        return query.as_string(cursor.connection)
+    return query
+
+
+def explain(cursor, query, vars):
+    conn = cursor.connection
+    if cursor.name is not None or conn.autocommit or not query.lstrip().upper().startswith(EXPLAINABLE):
+        return None
+    explain_cur = psycopg2.extensions.cursor(conn)
+    explain_cur.execute('SAVEPOINT suite_explain')
+    try:
+        psycopg2.extensions.cursor.execute(explain_cur, 'EXPLAIN (ANALYZE, FORMAT JSON) ' + query, vars)
+        plan = explain_cur.fetchone()[0][0]['Plan']
+        return scanned_rows(plan)
+    except psycopg2.Error:
+        # The handler runs the statement next and gets the same error itself
+        return None
+    finally:
+        explain_cur.execute('ROLLBACK TO SAVEPOINT suite_explain')
+        explain_cur.execute('RELEASE SAVEPOINT suite_explain')
+        explain_cur.close()
+
+
+_cursor_classes = {}
+
+
+def traced_cursor_class(base):
+    if base not in _cursor_classes:
+        class TracedCursor(base):
+            def execute(self, query, vars=None):
+                text = query_text(self, query)
+                rows = explain(self, text, vars) if trace.explain else None
+                started = time.perf_counter()
+                try:
+                    return super().execute(query, vars)
+                finally:
+                    trace.statements.append({
+                        'query': ' '.join(text.split())[:200],
+                        'ms': (time.perf_counter() - started) * 1000,
+                        'rows_scanned': rows
+                    })
+
+            def executemany(self, query, vars_list):
+                for vars in vars_list:
+                    self.execute(query, vars)
+
+        TracedCursor.__name__ = 'Traced' + base.__name__
+        _cursor_classes[base] = TracedCursor
+    return _cursor_classes[base]
+
+
+_connection_classes = {}
+
+
+def traced_connection_class(base):
+    # Built on the handler's own connection_factory (sqltrace's, when metrics are on), so both count
+    if base not in _connection_classes:
+        class TracedConnection(base):
+            def cursor(self, *args, **kwargs):
+                cursor_base = kwargs.get('cursor_factory') or self.cursor_factory or psycopg2.extensions.cursor
+                kwargs['cursor_factory'] = traced_cursor_class(cursor_base)
+                return super().cursor(*args, **kwargs)
+
+        _connection_classes[base] = TracedConnection
+    return _connection_classes[base]
+
+
+def install(db_module):
+    '''Makes the pool of this handler's db module open traced connections'''
+    pool_class = db_module.ConnectionPool
+
+    class TracedPool(pool_class):
+        def __init__(self, dsn, **kwargs):
+            base = kwargs.get('connection_factory') or psycopg2.extensions.connection
+            kwargs['connection_factory'] = traced_connection_class(base)
+            super().__init__(dsn, **kwargs)
+
+    db_module.ConnectionPool = TracedPool
+    db_module._pool = None
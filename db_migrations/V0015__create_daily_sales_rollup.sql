@@ -0,0 +1,83 @@
+-- Дневные агрегаты продаж: статистика читает их вместо всей таблицы transactions
+CREATE TABLE IF NOT EXISTS t_p6388661_digital_goods_accoun.daily_sales_rollup (
+  day DATE NOT NULL,
+  product_id INTEGER NOT NULL,
+  currency VARCHAR(3) NOT NULL,
+  status VARCHAR(50) NOT NULL,
+  tx_count INTEGER NOT NULL DEFAULT 0,
+  revenue NUMERIC(14, 2) NOT NULL DEFAULT 0,
+  cost NUMERIC(14, 2) NOT NULL DEFAULT 0,
+  profit NUMERIC(14, 2) NOT NULL DEFAULT 0,
+  PRIMARY KEY (day, product_id, currency, status)
+);
+
+CREATE INDEX IF NOT EXISTS idx_daily_sales_rollup_status_day
+  ON t_p6388661_digital_goods_accoun.daily_sales_rollup(status, day);
+
+-- Применяет изменение одной транзакции к агрегатам в той же транзакции БД
+CREATE OR REPLACE FUNCTION t_p6388661_digital_goods_accoun.apply_daily_sales_rollup()
+RETURNS TRIGGER AS $$
+BEGIN
+  -- Транзакции без даты не попадают ни в один день графика и в агрегаты не входят
+  IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.transaction_date IS NOT NULL THEN
+    UPDATE t_p6388661_digital_goods_accoun.daily_sales_rollup
+    SET tx_count = tx_count - 1,
+        revenue = revenue - OLD.amount,
+        cost = cost - OLD.cost_price,
+        profit = profit - OLD.profit
+    WHERE day = OLD.transaction_date::date
+      AND product_id = COALESCE(OLD.product_id, 0)
+      AND currency = OLD.currency
+      AND status = COALESCE(OLD.status, '');
+
+    DELETE FROM t_p6388661_digital_goods_accoun.daily_sales_rollup
+    WHERE day = OLD.transaction_date::date
+      AND product_id = COALESCE(OLD.product_id, 0)
+      AND currency = OLD.currency
+      AND status = COALESCE(OLD.status, '')
+      AND tx_count <= 0;
+  END IF;
+
+  IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.transaction_date IS NOT NULL THEN
+    INSERT INTO t_p6388661_digital_goods_accoun.daily_sales_rollup AS r
+      (day, product_id, currency, status, tx_count, revenue, cost, profit)
+    VALUES (NEW.transaction_date::date, COALESCE(NEW.product_id, 0), NEW.currency,
+            COALESCE(NEW.status, ''), 1, NEW.amount, NEW.cost_price, NEW.profit)
+    ON CONFLICT (day, product_id, currency, status) DO UPDATE
+    SET tx_count = r.tx_count + 1,
+        revenue = r.revenue + EXCLUDED.revenue,
+        cost = r.cost + EXCLUDED.cost,
+        profit = r.profit + EXCLUDED.profit;
+  END IF;
+
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_transactions_daily_sales_rollup
+AFTER INSERT OR UPDATE OR DELETE ON t_p6388661_digital_goods_accoun.transactions
+FOR EACH ROW EXECUTE FUNCTION t_p6388661_digital_goods_accoun.apply_daily_sales_rollup();
+
+-- Полный пересчёт агрегатов из transactions (backfill и восстановление после ручных правок)
+CREATE OR REPLACE FUNCTION t_p6388661_digital_goods_accoun.rebuild_daily_sales_rollup()
+RETURNS INTEGER AS $$
+DECLARE
+  rows_written INTEGER;
+BEGIN
+  LOCK TABLE t_p6388661_digital_goods_accoun.transactions IN SHARE MODE;
+  DELETE FROM t_p6388661_digital_goods_accoun.daily_sales_rollup;
+
+  INSERT INTO t_p6388661_digital_goods_accoun.daily_sales_rollup
+    (day, product_id, currency, status, tx_count, revenue, cost, profit)
+  SELECT transaction_date::date, COALESCE(product_id, 0), currency, COALESCE(status, ''),
+         COUNT(*), SUM(amount), SUM(cost_price), SUM(profit)
+  FROM t_p6388661_digital_goods_accoun.transactions
+  WHERE transaction_date IS NOT NULL
+  GROUP BY transaction_date::date, COALESCE(product_id, 0), currency, COALESCE(status, '');
+
+  GET DIAGNOSTICS rows_written = ROW_COUNT;
+  RETURN rows_written;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT t_p6388661_digital_goods_accoun.rebuild_daily_sales_rollup();
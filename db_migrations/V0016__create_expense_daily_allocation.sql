@@ -0,0 +1,80 @@
+-- Распределение каждого расхода по дням: статистика и разбивка затрат читают готовые суммы
+CREATE TABLE IF NOT EXISTS t_p6388661_digital_goods_accoun.expense_daily_allocation (
+  expense_id INTEGER NOT NULL REFERENCES t_p6388661_digital_goods_accoun.expenses(id) ON DELETE CASCADE,
+  day DATE NOT NULL,
+  amount NUMERIC NOT NULL,
+  currency VARCHAR(3) NOT NULL,
+  PRIMARY KEY (day, expense_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_expense_daily_allocation_expense
+  ON t_p6388661_digital_goods_accoun.expense_daily_allocation(expense_id);
+
+-- До какого дня разложен бессрочный расход (для разовых и ограниченных - последний день)
+ALTER TABLE t_p6388661_digital_goods_accoun.expenses
+ADD COLUMN IF NOT EXISTS allocated_through DATE;
+
+-- Раскладывает дни расхода после allocated_through и до through (для бессрочных) или end_date.
+-- Разовый расход целиком приходится на start_date, периодический делится на длину периода,
+-- бессрочный - на 365 дней.
+CREATE OR REPLACE FUNCTION t_p6388661_digital_goods_accoun.allocate_expense(p_expense_id INTEGER, through DATE)
+RETURNS INTEGER AS $$
+DECLARE
+  rows_written INTEGER;
+BEGIN
+  WITH target AS (
+    SELECT id, start_date, amount, currency, allocated_through,
+      CASE
+        WHEN distribution_type = 'one_time' THEN start_date
+        ELSE COALESCE(end_date, GREATEST(through, start_date))
+      END AS last_day,
+      CASE
+        WHEN distribution_type = 'one_time' THEN amount
+        ELSE amount / COALESCE(end_date - start_date + 1, 365)
+      END AS daily_amount
+    FROM t_p6388661_digital_goods_accoun.expenses
+    WHERE id = p_expense_id
+  ),
+  written AS (
+    INSERT INTO t_p6388661_digital_goods_accoun.expense_daily_allocation (expense_id, day, amount, currency)
+    SELECT t.id, g.day::date, t.daily_amount, COALESCE(t.currency, 'RUB')
+    FROM target t
+    CROSS JOIN LATERAL generate_series(
+      GREATEST(t.start_date, t.allocated_through + 1), t.last_day, interval '1 day'
+    ) AS g(day)
+    ON CONFLICT (day, expense_id) DO NOTHING
+    RETURNING 1
+  )
+  SELECT COUNT(*) INTO rows_written FROM written;
+
+  UPDATE t_p6388661_digital_goods_accoun.expenses e
+  SET allocated_through = GREATEST(COALESCE(e.allocated_through, e.start_date),
+    CASE
+      WHEN e.distribution_type = 'one_time' THEN e.start_date
+      ELSE COALESCE(e.end_date, GREATEST(through, e.start_date))
+    END)
+  WHERE e.id = p_expense_id;
+
+  RETURN rows_written;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Плановое продление бессрочных расходов (и первичное заполнение всех остальных)
+CREATE OR REPLACE FUNCTION t_p6388661_digital_goods_accoun.extend_expense_allocations(through DATE)
+RETURNS INTEGER AS $$
+DECLARE
+  expense_row RECORD;
+  rows_written INTEGER := 0;
+BEGIN
+  FOR expense_row IN
+    SELECT id FROM t_p6388661_digital_goods_accoun.expenses
+    WHERE allocated_through IS NULL
+       OR (distribution_type <> 'one_time' AND end_date IS NULL AND allocated_through < through)
+  LOOP
+    rows_written := rows_written + t_p6388661_digital_goods_accoun.allocate_expense(expense_row.id, through);
+  END LOOP;
+  RETURN rows_written;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT t_p6388661_digital_goods_accoun.extend_expense_allocations(CURRENT_DATE + 365);
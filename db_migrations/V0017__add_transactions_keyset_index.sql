@@ -0,0 +1,3 @@
+-- Ключ для постраничной выдачи транзакций по курсору (transaction_date, id)
+CREATE INDEX IF NOT EXISTS idx_transactions_date_id
+  ON t_p6388661_digital_goods_accoun.transactions(transaction_date DESC, id DESC);
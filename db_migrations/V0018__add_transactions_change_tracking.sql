@@ -0,0 +1,46 @@
+-- Отслеживание изменений транзакций для дельта-синхронизации (GET ?since=<cursor>)
+ALTER TABLE t_p6388661_digital_goods_accoun.transactions
+ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+
+-- Номер транзакции БД, последней изменившей строку: курсор синхронизации - это xmin снимка,
+-- поэтому строки из ещё не зафиксированных транзакций не теряются
+ALTER TABLE t_p6388661_digital_goods_accoun.transactions
+ADD COLUMN IF NOT EXISTS change_xid xid8 NOT NULL DEFAULT pg_current_xact_id();
+
+CREATE INDEX IF NOT EXISTS idx_transactions_change_xid
+  ON t_p6388661_digital_goods_accoun.transactions(change_xid);
+
+CREATE TABLE IF NOT EXISTS t_p6388661_digital_goods_accoun.transaction_deletions (
+  transaction_id INTEGER NOT NULL,
+  change_xid xid8 NOT NULL DEFAULT pg_current_xact_id(),
+  deleted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_transaction_deletions_change_xid
+  ON t_p6388661_digital_goods_accoun.transaction_deletions(change_xid);
+
+CREATE OR REPLACE FUNCTION t_p6388661_digital_goods_accoun.touch_transaction()
+RETURNS TRIGGER AS $$
+BEGIN
+  NEW.updated_at := CURRENT_TIMESTAMP;
+  NEW.change_xid := pg_current_xact_id();
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_transactions_touch
+BEFORE INSERT OR UPDATE ON t_p6388661_digital_goods_accoun.transactions
+FOR EACH ROW EXECUTE FUNCTION t_p6388661_digital_goods_accoun.touch_transaction();
+
+CREATE OR REPLACE FUNCTION t_p6388661_digital_goods_accoun.log_transaction_deletion()
+RETURNS TRIGGER AS $$
+BEGIN
+  INSERT INTO t_p6388661_digital_goods_accoun.transaction_deletions (transaction_id)
+  VALUES (OLD.id);
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_transactions_log_deletion
+AFTER DELETE ON t_p6388661_digital_goods_accoun.transactions
+FOR EACH ROW EXECUTE FUNCTION t_p6388661_digital_goods_accoun.log_transaction_deletion();
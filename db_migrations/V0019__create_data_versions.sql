@@ -0,0 +1,39 @@
+-- Счётчики версий таблиц: из них строится ETag для GET-ответов, запись увеличивает счётчик
+CREATE TABLE IF NOT EXISTS t_p6388661_digital_goods_accoun.data_versions (
+  table_name VARCHAR(63) PRIMARY KEY,
+  version BIGINT NOT NULL DEFAULT 0
+);
+
+INSERT INTO t_p6388661_digital_goods_accoun.data_versions (table_name) VALUES
+  ('transactions'), ('products'), ('expenses'), ('expense_types'), ('expense_daily_allocation')
+ON CONFLICT (table_name) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION t_p6388661_digital_goods_accoun.bump_data_version()
+RETURNS TRIGGER AS $$
+BEGIN
+  UPDATE t_p6388661_digital_goods_accoun.data_versions
+  SET version = version + 1
+  WHERE table_name = TG_TABLE_NAME;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_transactions_data_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON t_p6388661_digital_goods_accoun.transactions
+FOR EACH STATEMENT EXECUTE FUNCTION t_p6388661_digital_goods_accoun.bump_data_version();
+
+CREATE TRIGGER trg_products_data_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON t_p6388661_digital_goods_accoun.products
+FOR EACH STATEMENT EXECUTE FUNCTION t_p6388661_digital_goods_accoun.bump_data_version();
+
+CREATE TRIGGER trg_expenses_data_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON t_p6388661_digital_goods_accoun.expenses
+FOR EACH STATEMENT EXECUTE FUNCTION t_p6388661_digital_goods_accoun.bump_data_version();
+
+CREATE TRIGGER trg_expense_types_data_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON t_p6388661_digital_goods_accoun.expense_types
+FOR EACH STATEMENT EXECUTE FUNCTION t_p6388661_digital_goods_accoun.bump_data_version();
+
+CREATE TRIGGER trg_expense_daily_allocation_data_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON t_p6388661_digital_goods_accoun.expense_daily_allocation
+FOR EACH STATEMENT EXECUTE FUNCTION t_p6388661_digital_goods_accoun.bump_data_version();
@@ -0,0 +1,6 @@
+-- Источник и время загрузки курса: обработчик exchange-rate кэширует курс дня в этой таблице
+ALTER TABLE t_p6388661_digital_goods_accoun.exchange_rates
+ADD COLUMN IF NOT EXISTS source VARCHAR(50);
+
+ALTER TABLE t_p6388661_digital_goods_accoun.exchange_rates
+ADD COLUMN IF NOT EXISTS fetched_at TIMESTAMP;
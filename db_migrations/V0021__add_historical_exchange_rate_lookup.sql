@@ -0,0 +1,32 @@
+-- Курс USD/RUB на дату: ближайший загруженный курс не позже этой даты.
+-- Строки без fetched_at - заглушки из V0004, в расчётах не участвуют
+CREATE INDEX IF NOT EXISTS idx_exchange_rates_pair_date
+  ON t_p6388661_digital_goods_accoun.exchange_rates(currency_from, currency_to, date DESC)
+  INCLUDE (rate)
+  WHERE fetched_at IS NOT NULL;
+
+CREATE OR REPLACE FUNCTION t_p6388661_digital_goods_accoun.usd_rub_rate_on(on_day DATE)
+RETURNS NUMERIC AS $$
+  SELECT rate
+  FROM t_p6388661_digital_goods_accoun.exchange_rates
+  WHERE currency_from = 'USD' AND currency_to = 'RUB'
+    AND fetched_at IS NOT NULL
+    AND date <= on_day
+  ORDER BY date DESC
+  LIMIT 1
+$$ LANGUAGE sql STABLE;
+
+-- Курс на каждый день диапазона; NULL для дней раньше первого известного курса
+CREATE OR REPLACE FUNCTION t_p6388661_digital_goods_accoun.usd_rub_rate_series(from_day DATE, to_day DATE)
+RETURNS TABLE (day DATE, rate NUMERIC) AS $$
+  SELECT g.day::date, t_p6388661_digital_goods_accoun.usd_rub_rate_on(g.day::date)
+  FROM generate_series(from_day, to_day, INTERVAL '1 day') AS g(day)
+$$ LANGUAGE sql STABLE;
+
+-- Статистика зависит от курсов: их изменение должно менять ETag
+INSERT INTO t_p6388661_digital_goods_accoun.data_versions (table_name) VALUES ('exchange_rates')
+ON CONFLICT (table_name) DO NOTHING;
+
+CREATE TRIGGER trg_exchange_rates_data_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON t_p6388661_digital_goods_accoun.exchange_rates
+FOR EACH STATEMENT EXECUTE FUNCTION t_p6388661_digital_goods_accoun.bump_data_version();
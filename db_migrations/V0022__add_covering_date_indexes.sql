@@ -0,0 +1,12 @@
+-- Отбор завершённых транзакций по диапазону дат (разбивка затрат, выгрузка, пересчёт агрегатов):
+-- суммы и валюта читаются прямо из индекса
+CREATE INDEX IF NOT EXISTS idx_transactions_status_date_covering
+  ON t_p6388661_digital_goods_accoun.transactions(status, transaction_date)
+  INCLUDE (amount, cost_price, profit, currency, product_id);
+
+-- Статистика читает дневные агрегаты по (status, day): покрывающий индекс даёт index-only scan
+CREATE INDEX IF NOT EXISTS idx_daily_sales_rollup_status_day_covering
+  ON t_p6388661_digital_goods_accoun.daily_sales_rollup(status, day)
+  INCLUDE (product_id, currency, tx_count, revenue, cost, profit);
+
+DROP INDEX IF EXISTS t_p6388661_digital_goods_accoun.idx_daily_sales_rollup_status_day;
@@ -0,0 +1,180 @@
+-- Агрегаты по клиентам для списка клиентов: завершённые покупки, выручка в рублях по курсу дня покупки.
+-- Клиент - пара (client_telegram, client_name); пустые значения хранятся как ''
+CREATE TABLE IF NOT EXISTS t_p6388661_digital_goods_accoun.client_stats (
+  id SERIAL PRIMARY KEY,
+  client_telegram VARCHAR(255) NOT NULL,
+  client_name VARCHAR(255) NOT NULL,
+  total_revenue NUMERIC NOT NULL DEFAULT 0,
+  purchase_count INTEGER NOT NULL DEFAULT 0,
+  first_purchase TIMESTAMP,
+  last_purchase TIMESTAMP,
+  UNIQUE (client_telegram, client_name)
+);
+
+-- Порядок списка и ключ постраничной выдачи
+CREATE INDEX IF NOT EXISTS idx_client_stats_revenue
+  ON t_p6388661_digital_goods_accoun.client_stats(total_revenue DESC, id DESC);
+
+-- Пересчёт одного клиента читает только его завершённые транзакции
+CREATE INDEX IF NOT EXISTS idx_transactions_client_completed
+  ON t_p6388661_digital_goods_accoun.transactions((COALESCE(client_telegram, '')), (COALESCE(client_name, '')))
+  WHERE status = 'completed';
+
+CREATE OR REPLACE FUNCTION t_p6388661_digital_goods_accoun.transaction_revenue_rub(
+  amount NUMERIC, currency VARCHAR, transaction_date TIMESTAMP
+)
+RETURNS NUMERIC AS $$
+  SELECT CASE
+    WHEN currency = 'USD'
+      THEN amount * COALESCE(t_p6388661_digital_goods_accoun.usd_rub_rate_on(transaction_date::date), 82)
+    ELSE amount
+  END
+$$ LANGUAGE sql STABLE;
+
+-- Пересчитывает одного клиента из transactions; клиент без завершённых покупок удаляется
+CREATE OR REPLACE FUNCTION t_p6388661_digital_goods_accoun.refresh_client_stats(p_telegram VARCHAR, p_name VARCHAR)
+RETURNS VOID AS $$
+BEGIN
+  INSERT INTO t_p6388661_digital_goods_accoun.client_stats AS s
+    (client_telegram, client_name, total_revenue, purchase_count, first_purchase, last_purchase)
+  SELECT p_telegram, p_name,
+         SUM(t_p6388661_digital_goods_accoun.transaction_revenue_rub(t.amount, t.currency, t.transaction_date)),
+         COUNT(*), MIN(t.transaction_date), MAX(t.transaction_date)
+  FROM t_p6388661_digital_goods_accoun.transactions t
+  WHERE t.status = 'completed'
+    AND COALESCE(t.client_telegram, '') = p_telegram
+    AND COALESCE(t.client_name, '') = p_name
+  HAVING COUNT(*) > 0
+  ON CONFLICT (client_telegram, client_name) DO UPDATE
+  SET total_revenue = EXCLUDED.total_revenue,
+      purchase_count = EXCLUDED.purchase_count,
+      first_purchase = EXCLUDED.first_purchase,
+      last_purchase = EXCLUDED.last_purchase;
+
+  IF NOT FOUND THEN
+    DELETE FROM t_p6388661_digital_goods_accoun.client_stats
+    WHERE client_telegram = p_telegram AND client_name = p_name;
+  END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Новая покупка прибавляется к агрегатам; изменение или удаление пересчитывает затронутых клиентов,
+-- потому что первую и последнюю покупку нельзя откатить без чтения остальных
+CREATE OR REPLACE FUNCTION t_p6388661_digital_goods_accoun.apply_client_stats()
+RETURNS TRIGGER AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    IF NEW.status = 'completed' THEN
+      INSERT INTO t_p6388661_digital_goods_accoun.client_stats AS s
+        (client_telegram, client_name, total_revenue, purchase_count, first_purchase, last_purchase)
+      VALUES (COALESCE(NEW.client_telegram, ''), COALESCE(NEW.client_name, ''),
+              t_p6388661_digital_goods_accoun.transaction_revenue_rub(NEW.amount, NEW.currency, NEW.transaction_date),
+              1, NEW.transaction_date, NEW.transaction_date)
+      ON CONFLICT (client_telegram, client_name) DO UPDATE
+      SET total_revenue = s.total_revenue + EXCLUDED.total_revenue,
+          purchase_count = s.purchase_count + 1,
+          first_purchase = LEAST(s.first_purchase, EXCLUDED.first_purchase),
+          last_purchase = GREATEST(s.last_purchase, EXCLUDED.last_purchase);
+    END IF;
+    RETURN NULL;
+  END IF;
+
+  IF TG_OP = 'UPDATE'
+     AND (OLD.status, OLD.amount, OLD.currency, OLD.transaction_date, OLD.client_telegram, OLD.client_name)
+         IS NOT DISTINCT FROM
+         (NEW.status, NEW.amount, NEW.currency, NEW.transaction_date, NEW.client_telegram, NEW.client_name) THEN
+    RETURN NULL;
+  END IF;
+
+  IF OLD.status = 'completed' THEN
+    PERFORM t_p6388661_digital_goods_accoun.refresh_client_stats(
+      COALESCE(OLD.client_telegram, ''), COALESCE(OLD.client_name, ''));
+  END IF;
+
+  IF TG_OP = 'UPDATE' AND NEW.status = 'completed'
+     AND (OLD.status IS DISTINCT FROM 'completed'
+          OR (COALESCE(OLD.client_telegram, ''), COALESCE(OLD.client_name, ''))
+             <> (COALESCE(NEW.client_telegram, ''), COALESCE(NEW.client_name, ''))) THEN
+    PERFORM t_p6388661_digital_goods_accoun.refresh_client_stats(
+      COALESCE(NEW.client_telegram, ''), COALESCE(NEW.client_name, ''));
+  END IF;
+
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_transactions_client_stats
+AFTER INSERT OR UPDATE OR DELETE ON t_p6388661_digital_goods_accoun.transactions
+FOR EACH ROW EXECUTE FUNCTION t_p6388661_digital_goods_accoun.apply_client_stats();
+
+-- Долларовая выручка зависит от курса дня: новый или исправленный курс пересчитывает клиентов
+-- с долларовыми покупками начиная с самой ранней затронутой даты
+CREATE OR REPLACE FUNCTION t_p6388661_digital_goods_accoun.apply_client_stats_rates()
+RETURNS TRIGGER AS $$
+DECLARE
+  from_day DATE;
+  client_row RECORD;
+BEGIN
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    SELECT MIN(date) INTO from_day FROM new_rates WHERE currency_from = 'USD' AND currency_to = 'RUB';
+  END IF;
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    SELECT LEAST(from_day, MIN(date)) INTO from_day
+    FROM old_rates WHERE currency_from = 'USD' AND currency_to = 'RUB';
+  END IF;
+
+  IF from_day IS NULL THEN
+    RETURN NULL;
+  END IF;
+
+  FOR client_row IN
+    SELECT DISTINCT COALESCE(client_telegram, '') AS client_telegram, COALESCE(client_name, '') AS client_name
+    FROM t_p6388661_digital_goods_accoun.transactions
+    WHERE status = 'completed' AND currency = 'USD' AND transaction_date >= from_day
+  LOOP
+    PERFORM t_p6388661_digital_goods_accoun.refresh_client_stats(client_row.client_telegram, client_row.client_name);
+  END LOOP;
+
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_exchange_rates_client_stats_insert
+AFTER INSERT ON t_p6388661_digital_goods_accoun.exchange_rates
+REFERENCING NEW TABLE AS new_rates
+FOR EACH STATEMENT EXECUTE FUNCTION t_p6388661_digital_goods_accoun.apply_client_stats_rates();
+
+CREATE TRIGGER trg_exchange_rates_client_stats_update
+AFTER UPDATE ON t_p6388661_digital_goods_accoun.exchange_rates
+REFERENCING OLD TABLE AS old_rates NEW TABLE AS new_rates
+FOR EACH STATEMENT EXECUTE FUNCTION t_p6388661_digital_goods_accoun.apply_client_stats_rates();
+
+CREATE TRIGGER trg_exchange_rates_client_stats_delete
+AFTER DELETE ON t_p6388661_digital_goods_accoun.exchange_rates
+REFERENCING OLD TABLE AS old_rates
+FOR EACH STATEMENT EXECUTE FUNCTION t_p6388661_digital_goods_accoun.apply_client_stats_rates();
+
+-- Полный пересчёт агрегатов из transactions (backfill и восстановление после ручных правок)
+CREATE OR REPLACE FUNCTION t_p6388661_digital_goods_accoun.rebuild_client_stats()
+RETURNS INTEGER AS $$
+DECLARE
+  rows_written INTEGER;
+BEGIN
+  LOCK TABLE t_p6388661_digital_goods_accoun.transactions IN SHARE MODE;
+  DELETE FROM t_p6388661_digital_goods_accoun.client_stats;
+
+  INSERT INTO t_p6388661_digital_goods_accoun.client_stats
+    (client_telegram, client_name, total_revenue, purchase_count, first_purchase, last_purchase)
+  SELECT COALESCE(client_telegram, ''), COALESCE(client_name, ''),
+         SUM(t_p6388661_digital_goods_accoun.transaction_revenue_rub(amount, currency, transaction_date)),
+         COUNT(*), MIN(transaction_date), MAX(transaction_date)
+  FROM t_p6388661_digital_goods_accoun.transactions
+  WHERE status = 'completed'
+  GROUP BY COALESCE(client_telegram, ''), COALESCE(client_name, '');
+
+  GET DIAGNOSTICS rows_written = ROW_COUNT;
+  RETURN rows_written;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT t_p6388661_digital_goods_accoun.rebuild_client_stats();
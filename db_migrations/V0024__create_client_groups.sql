@@ -0,0 +1,105 @@
+-- Группы клиентов, связанных через client_connections (одна компания, реселлеры).
+-- Строка на каждого клиента с хотя бы одной связью; group_id - id корневого клиента группы.
+-- Размер и общая выручка группы хранятся только в строке корня (client_id = group_id)
+CREATE TABLE IF NOT EXISTS t_p6388661_digital_goods_accoun.client_groups (
+  client_id INTEGER PRIMARY KEY,
+  group_id INTEGER NOT NULL,
+  group_size INTEGER,
+  group_revenue NUMERIC
+);
+
+CREATE INDEX IF NOT EXISTS idx_client_groups_group
+  ON t_p6388661_digital_goods_accoun.client_groups(group_id);
+
+-- Рейтинг групп читает только корни
+CREATE INDEX IF NOT EXISTS idx_client_groups_revenue
+  ON t_p6388661_digital_goods_accoun.client_groups(group_revenue DESC, group_id)
+  WHERE client_id = group_id;
+
+-- Выручка клиента меняется вместе с client_stats: разница добавляется к выручке его группы
+CREATE OR REPLACE FUNCTION t_p6388661_digital_goods_accoun.apply_client_group_revenue()
+RETURNS TRIGGER AS $$
+DECLARE
+  telegram VARCHAR;
+  delta NUMERIC;
+BEGIN
+  IF TG_OP = 'DELETE' THEN
+    telegram := OLD.client_telegram;
+    delta := -OLD.total_revenue;
+  ELSIF TG_OP = 'INSERT' THEN
+    telegram := NEW.client_telegram;
+    delta := NEW.total_revenue;
+  ELSE
+    telegram := NEW.client_telegram;
+    delta := NEW.total_revenue - OLD.total_revenue;
+  END IF;
+
+  IF delta = 0 THEN
+    RETURN NULL;
+  END IF;
+
+  -- Общая блокировка: объединение групп (эксклюзивная блокировка) не потеряет эту разницу
+  PERFORM pg_advisory_xact_lock_shared(hashtext('client_groups'));
+
+  UPDATE t_p6388661_digital_goods_accoun.client_groups root
+  SET group_revenue = root.group_revenue + delta
+  FROM t_p6388661_digital_goods_accoun.clients c
+  JOIN t_p6388661_digital_goods_accoun.client_groups member ON member.client_id = c.id
+  WHERE c.client_telegram = telegram
+    AND root.client_id = member.group_id;
+
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_client_stats_group_revenue
+AFTER INSERT OR UPDATE OF total_revenue OR DELETE ON t_p6388661_digital_goods_accoun.client_stats
+FOR EACH ROW EXECUTE FUNCTION t_p6388661_digital_goods_accoun.apply_client_group_revenue();
+
+-- Первичное заполнение: каждый связанный клиент получает наименьший id своей компоненты.
+-- Дальше группы ведёт функция clients (объединение при add-connection, полный пересчёт - rebuild-groups)
+INSERT INTO t_p6388661_digital_goods_accoun.client_groups (client_id, group_id)
+SELECT client_id_from, client_id_from FROM t_p6388661_digital_goods_accoun.client_connections
+UNION
+SELECT client_id_to, client_id_to FROM t_p6388661_digital_goods_accoun.client_connections
+ON CONFLICT (client_id) DO NOTHING;
+
+DO $$
+DECLARE
+  changed INTEGER;
+BEGIN
+  LOOP
+    UPDATE t_p6388661_digital_goods_accoun.client_groups g
+    SET group_id = n.group_id
+    FROM (
+      SELECT e.client_id, MIN(other.group_id) AS group_id
+      FROM (
+        SELECT client_id_from AS client_id, client_id_to AS other_id FROM t_p6388661_digital_goods_accoun.client_connections
+        UNION ALL
+        SELECT client_id_to, client_id_from FROM t_p6388661_digital_goods_accoun.client_connections
+      ) e
+      JOIN t_p6388661_digital_goods_accoun.client_groups other ON other.client_id = e.other_id
+      GROUP BY e.client_id
+    ) n
+    WHERE g.client_id = n.client_id AND n.group_id < g.group_id;
+
+    GET DIAGNOSTICS changed = ROW_COUNT;
+    EXIT WHEN changed = 0;
+  END LOOP;
+END;
+$$;
+
+UPDATE t_p6388661_digital_goods_accoun.client_groups root
+SET group_size = totals.group_size, group_revenue = totals.group_revenue
+FROM (
+  SELECT g.group_id, COUNT(*) AS group_size, COALESCE(SUM(r.revenue), 0) AS group_revenue
+  FROM t_p6388661_digital_goods_accoun.client_groups g
+  LEFT JOIN t_p6388661_digital_goods_accoun.clients c ON c.id = g.client_id
+  LEFT JOIN LATERAL (
+    SELECT SUM(s.total_revenue) AS revenue
+    FROM t_p6388661_digital_goods_accoun.client_stats s
+    WHERE s.client_telegram = c.client_telegram
+  ) r ON true
+  GROUP BY g.group_id
+) totals
+WHERE root.client_id = totals.group_id;
@@ -0,0 +1,8 @@
+-- Общие настройки всех экземпляров функций: ключ - значение.
+-- bcrypt_cost записывает первая калибровка в auth, остальные экземпляры читают её;
+-- чтобы перекалибровать, строку удаляют
+CREATE TABLE IF NOT EXISTS t_p6388661_digital_goods_accoun.app_settings (
+  key VARCHAR(63) PRIMARY KEY,
+  value TEXT NOT NULL,
+  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,153 @@
+-- Выручка клиентов больше не использует курс 82 по умолчанию: для покупок раньше первого известного
+-- курса берётся первый известный курс, а пока курсов нет совсем, долларовая покупка не учитывается.
+-- Новый самый ранний курс пересчитывает всех клиентов с долларовыми покупками
+CREATE OR REPLACE FUNCTION t_p6388661_digital_goods_accoun.transaction_revenue_rub(
+  amount NUMERIC, currency VARCHAR, transaction_date TIMESTAMP
+)
+RETURNS NUMERIC AS $$
+  SELECT CASE
+    WHEN currency = 'USD'
+      THEN amount * COALESCE(
+        t_p6388661_digital_goods_accoun.usd_rub_rate_on(transaction_date::date),
+        (SELECT rate
+         FROM t_p6388661_digital_goods_accoun.exchange_rates
+         WHERE currency_from = 'USD' AND currency_to = 'RUB' AND fetched_at IS NOT NULL
+         ORDER BY date
+         LIMIT 1)
+      )
+    ELSE amount
+  END
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION t_p6388661_digital_goods_accoun.refresh_client_stats(p_telegram VARCHAR, p_name VARCHAR)
+RETURNS VOID AS $$
+BEGIN
+  INSERT INTO t_p6388661_digital_goods_accoun.client_stats AS s
+    (client_telegram, client_name, total_revenue, purchase_count, first_purchase, last_purchase)
+  SELECT p_telegram, p_name,
+         COALESCE(SUM(t_p6388661_digital_goods_accoun.transaction_revenue_rub(t.amount, t.currency, t.transaction_date)), 0),
+         COUNT(*), MIN(t.transaction_date), MAX(t.transaction_date)
+  FROM t_p6388661_digital_goods_accoun.transactions t
+  WHERE t.status = 'completed'
+    AND COALESCE(t.client_telegram, '') = p_telegram
+    AND COALESCE(t.client_name, '') = p_name
+  HAVING COUNT(*) > 0
+  ON CONFLICT (client_telegram, client_name) DO UPDATE
+  SET total_revenue = EXCLUDED.total_revenue,
+      purchase_count = EXCLUDED.purchase_count,
+      first_purchase = EXCLUDED.first_purchase,
+      last_purchase = EXCLUDED.last_purchase;
+
+  IF NOT FOUND THEN
+    DELETE FROM t_p6388661_digital_goods_accoun.client_stats
+    WHERE client_telegram = p_telegram AND client_name = p_name;
+  END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION t_p6388661_digital_goods_accoun.apply_client_stats()
+RETURNS TRIGGER AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    IF NEW.status = 'completed' THEN
+      INSERT INTO t_p6388661_digital_goods_accoun.client_stats AS s
+        (client_telegram, client_name, total_revenue, purchase_count, first_purchase, last_purchase)
+      VALUES (COALESCE(NEW.client_telegram, ''), COALESCE(NEW.client_name, ''),
+              COALESCE(t_p6388661_digital_goods_accoun.transaction_revenue_rub(NEW.amount, NEW.currency, NEW.transaction_date), 0),
+              1, NEW.transaction_date, NEW.transaction_date)
+      ON CONFLICT (client_telegram, client_name) DO UPDATE
+      SET total_revenue = s.total_revenue + EXCLUDED.total_revenue,
+          purchase_count = s.purchase_count + 1,
+          first_purchase = LEAST(s.first_purchase, EXCLUDED.first_purchase),
+          last_purchase = GREATEST(s.last_purchase, EXCLUDED.last_purchase);
+    END IF;
+    RETURN NULL;
+  END IF;
+
+  IF TG_OP = 'UPDATE'
+     AND (OLD.status, OLD.amount, OLD.currency, OLD.transaction_date, OLD.client_telegram, OLD.client_name)
+         IS NOT DISTINCT FROM
+         (NEW.status, NEW.amount, NEW.currency, NEW.transaction_date, NEW.client_telegram, NEW.client_name) THEN
+    RETURN NULL;
+  END IF;
+
+  IF OLD.status = 'completed' THEN
+    PERFORM t_p6388661_digital_goods_accoun.refresh_client_stats(
+      COALESCE(OLD.client_telegram, ''), COALESCE(OLD.client_name, ''));
+  END IF;
+
+  IF TG_OP = 'UPDATE' AND NEW.status = 'completed'
+     AND (OLD.status IS DISTINCT FROM 'completed'
+          OR (COALESCE(OLD.client_telegram, ''), COALESCE(OLD.client_name, ''))
+             <> (COALESCE(NEW.client_telegram, ''), COALESCE(NEW.client_name, ''))) THEN
+    PERFORM t_p6388661_digital_goods_accoun.refresh_client_stats(
+      COALESCE(NEW.client_telegram, ''), COALESCE(NEW.client_name, ''));
+  END IF;
+
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Курс дня действует и на все покупки раньше первого курса: если раньше изменённой даты
+-- курсов нет, пересчитываются все клиенты с долларовыми покупками, включая покупки без даты
+CREATE OR REPLACE FUNCTION t_p6388661_digital_goods_accoun.apply_client_stats_rates()
+RETURNS TRIGGER AS $$
+DECLARE
+  from_day DATE;
+  all_days BOOLEAN;
+  client_row RECORD;
+BEGIN
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    SELECT MIN(date) INTO from_day FROM new_rates WHERE currency_from = 'USD' AND currency_to = 'RUB';
+  END IF;
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    SELECT LEAST(from_day, MIN(date)) INTO from_day
+    FROM old_rates WHERE currency_from = 'USD' AND currency_to = 'RUB';
+  END IF;
+
+  IF from_day IS NULL THEN
+    RETURN NULL;
+  END IF;
+
+  all_days := NOT EXISTS (
+    SELECT 1 FROM t_p6388661_digital_goods_accoun.exchange_rates
+    WHERE currency_from = 'USD' AND currency_to = 'RUB' AND fetched_at IS NOT NULL AND date < from_day
+  );
+
+  FOR client_row IN
+    SELECT DISTINCT COALESCE(client_telegram, '') AS client_telegram, COALESCE(client_name, '') AS client_name
+    FROM t_p6388661_digital_goods_accoun.transactions
+    WHERE status = 'completed' AND currency = 'USD'
+      AND (all_days OR transaction_date >= from_day)
+  LOOP
+    PERFORM t_p6388661_digital_goods_accoun.refresh_client_stats(client_row.client_telegram, client_row.client_name);
+  END LOOP;
+
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION t_p6388661_digital_goods_accoun.rebuild_client_stats()
+RETURNS INTEGER AS $$
+DECLARE
+  rows_written INTEGER;
+BEGIN
+  LOCK TABLE t_p6388661_digital_goods_accoun.transactions IN SHARE MODE;
+  DELETE FROM t_p6388661_digital_goods_accoun.client_stats;
+
+  INSERT INTO t_p6388661_digital_goods_accoun.client_stats
+    (client_telegram, client_name, total_revenue, purchase_count, first_purchase, last_purchase)
+  SELECT COALESCE(client_telegram, ''), COALESCE(client_name, ''),
+         COALESCE(SUM(t_p6388661_digital_goods_accoun.transaction_revenue_rub(amount, currency, transaction_date)), 0),
+         COUNT(*), MIN(transaction_date), MAX(transaction_date)
+  FROM t_p6388661_digital_goods_accoun.transactions
+  WHERE status = 'completed'
+  GROUP BY COALESCE(client_telegram, ''), COALESCE(client_name, '');
+
+  GET DIAGNOSTICS rows_written = ROW_COUNT;
+  RETURN rows_written;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Исправляет уже сохранённую выручку, посчитанную по курсу 82
+SELECT t_p6388661_digital_goods_accoun.rebuild_client_stats();
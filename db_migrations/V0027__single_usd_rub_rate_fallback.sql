@@ -0,0 +1,47 @@
+-- Одно правило курса USD/RUB для статистики, расходов и выручки клиентов:
+-- последний загруженный курс не позже даты; для дней раньше первого курса - первый курс;
+-- пока курсов нет совсем - 82, курс дашборда по умолчанию. Долларовая сумма никогда не считается за 0
+CREATE OR REPLACE FUNCTION t_p6388661_digital_goods_accoun.usd_rub_rate_on(on_day DATE)
+RETURNS NUMERIC AS $$
+  SELECT COALESCE(
+    (SELECT rate
+     FROM t_p6388661_digital_goods_accoun.exchange_rates
+     WHERE currency_from = 'USD' AND currency_to = 'RUB'
+       AND fetched_at IS NOT NULL
+       AND date <= on_day
+     ORDER BY date DESC
+     LIMIT 1),
+    (SELECT rate
+     FROM t_p6388661_digital_goods_accoun.exchange_rates
+     WHERE currency_from = 'USD' AND currency_to = 'RUB'
+       AND fetched_at IS NOT NULL
+     ORDER BY date
+     LIMIT 1),
+    82
+  )
+$$ LANGUAGE sql STABLE;
+
+-- Курс на каждый день диапазона по тому же правилу, без NULL
+CREATE OR REPLACE FUNCTION t_p6388661_digital_goods_accoun.usd_rub_rate_series(from_day DATE, to_day DATE)
+RETURNS TABLE (day DATE, rate NUMERIC) AS $$
+  SELECT g.day::date, t_p6388661_digital_goods_accoun.usd_rub_rate_on(g.day::date)
+  FROM generate_series(from_day, to_day, INTERVAL '1 day') AS g(day)
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION t_p6388661_digital_goods_accoun.transaction_revenue_rub(
+  amount NUMERIC, currency VARCHAR, transaction_date TIMESTAMP
+)
+RETURNS NUMERIC AS $$
+  SELECT CASE
+    WHEN currency = 'USD'
+      THEN amount * t_p6388661_digital_goods_accoun.usd_rub_rate_on(transaction_date::date)
+    ELSE amount
+  END
+$$ LANGUAGE sql STABLE;
+
+-- Выручка меняется только там, где курсов ещё нет: раньше долларовые покупки шли в неё как 0
+SELECT t_p6388661_digital_goods_accoun.rebuild_client_stats()
+WHERE NOT EXISTS (
+  SELECT 1 FROM t_p6388661_digital_goods_accoun.exchange_rates
+  WHERE currency_from = 'USD' AND currency_to = 'RUB' AND fetched_at IS NOT NULL
+);
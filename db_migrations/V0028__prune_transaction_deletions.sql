@@ -0,0 +1,45 @@
+-- Журнал удалений для дельта-синхронизации хранится 30 дней. Номер последней удалённой из журнала
+-- записи лежит в app_settings: курсор не новее него мог пропустить удаления, и такой клиент
+-- получает 410 и загружается заново
+CREATE INDEX IF NOT EXISTS idx_transaction_deletions_deleted_at
+  ON t_p6388661_digital_goods_accoun.transaction_deletions(deleted_at);
+
+CREATE OR REPLACE FUNCTION t_p6388661_digital_goods_accoun.prune_transaction_deletions(keep INTERVAL)
+RETURNS INTEGER AS $$
+DECLARE
+  rows_pruned INTEGER;
+  pruned_through NUMERIC;
+BEGIN
+  WITH pruned AS (
+    DELETE FROM t_p6388661_digital_goods_accoun.transaction_deletions
+    WHERE deleted_at < CURRENT_TIMESTAMP - keep
+    RETURNING change_xid
+  )
+  SELECT COUNT(*), MAX(change_xid::text::numeric) INTO rows_pruned, pruned_through FROM pruned;
+
+  IF pruned_through IS NOT NULL THEN
+    INSERT INTO t_p6388661_digital_goods_accoun.app_settings AS s (key, value)
+    VALUES ('transaction_sync_horizon', pruned_through::text)
+    ON CONFLICT (key) DO UPDATE
+    SET value = GREATEST(s.value::numeric, EXCLUDED.value::numeric)::text,
+        updated_at = CURRENT_TIMESTAMP;
+  END IF;
+
+  RETURN rows_pruned;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Журнал растёт только от удалений, поэтому и чистится после каждого DELETE
+CREATE OR REPLACE FUNCTION t_p6388661_digital_goods_accoun.prune_transaction_deletions_after_delete()
+RETURNS TRIGGER AS $$
+BEGIN
+  PERFORM t_p6388661_digital_goods_accoun.prune_transaction_deletions(INTERVAL '30 days');
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_transactions_prune_deletions
+AFTER DELETE ON t_p6388661_digital_goods_accoun.transactions
+FOR EACH STATEMENT EXECUTE FUNCTION t_p6388661_digital_goods_accoun.prune_transaction_deletions_after_delete();
+
+SELECT t_p6388661_digital_goods_accoun.prune_transaction_deletions(INTERVAL '30 days');
@@ -0,0 +1,162 @@
+-- Пакетный импорт (action=import) обновляет агрегаты один раз на оператор, а не на каждую строку.
+-- Импорт включает SET LOCAL digital_goods.batch_insert = on: строчные триггеры вставки и выручки групп
+-- при этом молчат, а работают триггеры уровня оператора по таблице переходов. Одиночные вставки,
+-- UPDATE и DELETE идут через строчные триггеры: для одной строки они дешевле
+
+-- updated_at и change_xid новой строки и так заполняют значения по умолчанию
+DROP TRIGGER IF EXISTS trg_transactions_touch ON t_p6388661_digital_goods_accoun.transactions;
+CREATE TRIGGER trg_transactions_touch
+BEFORE UPDATE ON t_p6388661_digital_goods_accoun.transactions
+FOR EACH ROW EXECUTE FUNCTION t_p6388661_digital_goods_accoun.touch_transaction();
+
+DROP TRIGGER IF EXISTS trg_transactions_daily_sales_rollup ON t_p6388661_digital_goods_accoun.transactions;
+CREATE TRIGGER trg_transactions_daily_sales_rollup
+AFTER UPDATE OR DELETE ON t_p6388661_digital_goods_accoun.transactions
+FOR EACH ROW EXECUTE FUNCTION t_p6388661_digital_goods_accoun.apply_daily_sales_rollup();
+
+CREATE TRIGGER trg_transactions_daily_sales_rollup_insert
+AFTER INSERT ON t_p6388661_digital_goods_accoun.transactions
+FOR EACH ROW
+WHEN (current_setting('digital_goods.batch_insert', true) IS DISTINCT FROM 'on')
+EXECUTE FUNCTION t_p6388661_digital_goods_accoun.apply_daily_sales_rollup();
+
+DROP TRIGGER IF EXISTS trg_transactions_client_stats ON t_p6388661_digital_goods_accoun.transactions;
+CREATE TRIGGER trg_transactions_client_stats
+AFTER UPDATE OR DELETE ON t_p6388661_digital_goods_accoun.transactions
+FOR EACH ROW EXECUTE FUNCTION t_p6388661_digital_goods_accoun.apply_client_stats();
+
+CREATE TRIGGER trg_transactions_client_stats_insert
+AFTER INSERT ON t_p6388661_digital_goods_accoun.transactions
+FOR EACH ROW
+WHEN (current_setting('digital_goods.batch_insert', true) IS DISTINCT FROM 'on')
+EXECUTE FUNCTION t_p6388661_digital_goods_accoun.apply_client_stats();
+
+-- Ключи обновляются в порядке первичного ключа, чтобы параллельные импорты не ловили взаимоблокировку
+CREATE OR REPLACE FUNCTION t_p6388661_digital_goods_accoun.apply_daily_sales_rollup_inserts()
+RETURNS TRIGGER AS $$
+BEGIN
+  INSERT INTO t_p6388661_digital_goods_accoun.daily_sales_rollup AS r
+    (day, product_id, currency, status, tx_count, revenue, cost, profit)
+  SELECT transaction_date::date, COALESCE(product_id, 0), currency, COALESCE(status, ''),
+         COUNT(*), SUM(amount), SUM(cost_price), SUM(profit)
+  FROM new_rows
+  WHERE transaction_date IS NOT NULL
+  GROUP BY transaction_date::date, COALESCE(product_id, 0), currency, COALESCE(status, '')
+  ORDER BY 1, 2, 3, 4
+  ON CONFLICT (day, product_id, currency, status) DO UPDATE
+  SET tx_count = r.tx_count + EXCLUDED.tx_count,
+      revenue = r.revenue + EXCLUDED.revenue,
+      cost = r.cost + EXCLUDED.cost,
+      profit = r.profit + EXCLUDED.profit;
+
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_transactions_daily_sales_rollup_batch
+AFTER INSERT ON t_p6388661_digital_goods_accoun.transactions
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT
+WHEN (current_setting('digital_goods.batch_insert', true) = 'on')
+EXECUTE FUNCTION t_p6388661_digital_goods_accoun.apply_daily_sales_rollup_inserts();
+
+-- Одна строка client_stats на клиента пакета: группа клиента получает одну разницу выручки
+CREATE OR REPLACE FUNCTION t_p6388661_digital_goods_accoun.apply_client_stats_inserts()
+RETURNS TRIGGER AS $$
+BEGIN
+  INSERT INTO t_p6388661_digital_goods_accoun.client_stats AS s
+    (client_telegram, client_name, total_revenue, purchase_count, first_purchase, last_purchase)
+  SELECT COALESCE(client_telegram, ''), COALESCE(client_name, ''),
+         COALESCE(SUM(t_p6388661_digital_goods_accoun.transaction_revenue_rub(amount, currency, transaction_date)), 0),
+         COUNT(*), MIN(transaction_date), MAX(transaction_date)
+  FROM new_rows
+  WHERE status = 'completed'
+  GROUP BY COALESCE(client_telegram, ''), COALESCE(client_name, '')
+  ORDER BY 1, 2
+  ON CONFLICT (client_telegram, client_name) DO UPDATE
+  SET total_revenue = s.total_revenue + EXCLUDED.total_revenue,
+      purchase_count = s.purchase_count + EXCLUDED.purchase_count,
+      first_purchase = LEAST(s.first_purchase, EXCLUDED.first_purchase),
+      last_purchase = GREATEST(s.last_purchase, EXCLUDED.last_purchase);
+
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_transactions_client_stats_batch
+AFTER INSERT ON t_p6388661_digital_goods_accoun.transactions
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT
+WHEN (current_setting('digital_goods.batch_insert', true) = 'on')
+EXECUTE FUNCTION t_p6388661_digital_goods_accoun.apply_client_stats_inserts();
+
+-- Выручка групп в пакете тоже обновляется раз на оператор над client_stats: разницы выручки
+-- клиентов суммируются по группам, общая блокировка client_groups берётся один раз
+CREATE OR REPLACE FUNCTION t_p6388661_digital_goods_accoun.apply_client_group_revenues()
+RETURNS TRIGGER AS $$
+DECLARE
+  telegrams VARCHAR[];
+  deltas NUMERIC[];
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    SELECT array_agg(client_telegram), array_agg(total_revenue) INTO telegrams, deltas FROM new_stats;
+  ELSIF TG_OP = 'UPDATE' THEN
+    SELECT array_agg(telegram), array_agg(delta) INTO telegrams, deltas
+    FROM (
+      SELECT client_telegram AS telegram, total_revenue AS delta FROM new_stats
+      UNION ALL
+      SELECT client_telegram, -total_revenue FROM old_stats
+    ) changes;
+  ELSE
+    SELECT array_agg(client_telegram), array_agg(-total_revenue) INTO telegrams, deltas FROM old_stats;
+  END IF;
+
+  IF telegrams IS NULL THEN
+    RETURN NULL;
+  END IF;
+
+  -- Общая блокировка: объединение групп (эксклюзивная блокировка) не потеряет эти разницы
+  PERFORM pg_advisory_xact_lock_shared(hashtext('client_groups'));
+
+  UPDATE t_p6388661_digital_goods_accoun.client_groups root
+  SET group_revenue = root.group_revenue + totals.delta
+  FROM (
+    SELECT member.group_id, SUM(changes.delta) AS delta
+    FROM unnest(telegrams, deltas) AS changes(telegram, delta)
+    JOIN t_p6388661_digital_goods_accoun.clients c ON c.client_telegram = changes.telegram
+    JOIN t_p6388661_digital_goods_accoun.client_groups member ON member.client_id = c.id
+    GROUP BY member.group_id
+  ) totals
+  WHERE root.client_id = totals.group_id AND totals.delta <> 0;
+
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_client_stats_group_revenue ON t_p6388661_digital_goods_accoun.client_stats;
+CREATE TRIGGER trg_client_stats_group_revenue
+AFTER INSERT OR UPDATE OF total_revenue OR DELETE ON t_p6388661_digital_goods_accoun.client_stats
+FOR EACH ROW
+WHEN (current_setting('digital_goods.batch_insert', true) IS DISTINCT FROM 'on')
+EXECUTE FUNCTION t_p6388661_digital_goods_accoun.apply_client_group_revenue();
+
+CREATE TRIGGER trg_client_stats_group_revenue_batch_insert
+AFTER INSERT ON t_p6388661_digital_goods_accoun.client_stats
+REFERENCING NEW TABLE AS new_stats
+FOR EACH STATEMENT
+WHEN (current_setting('digital_goods.batch_insert', true) = 'on')
+EXECUTE FUNCTION t_p6388661_digital_goods_accoun.apply_client_group_revenues();
+
+CREATE TRIGGER trg_client_stats_group_revenue_batch_update
+AFTER UPDATE ON t_p6388661_digital_goods_accoun.client_stats
+REFERENCING OLD TABLE AS old_stats NEW TABLE AS new_stats
+FOR EACH STATEMENT
+WHEN (current_setting('digital_goods.batch_insert', true) = 'on')
+EXECUTE FUNCTION t_p6388661_digital_goods_accoun.apply_client_group_revenues();
+
+CREATE TRIGGER trg_client_stats_group_revenue_batch_delete
+AFTER DELETE ON t_p6388661_digital_goods_accoun.client_stats
+REFERENCING OLD TABLE AS old_stats
+FOR EACH STATEMENT
+WHEN (current_setting('digital_goods.batch_insert', true) = 'on')
+EXECUTE FUNCTION t_p6388661_digital_goods_accoun.apply_client_group_revenues();
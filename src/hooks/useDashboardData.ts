@@ -1,5 +1,5 @@
-import { useState, useEffect, useCallback, useMemo } from 'react';
-import { getStats, getTransactions } from '@/lib/api';
+import { useState, useEffect, useCallback, useMemo, useRef } from 'react';
+import { getStats, getTransactionChanges, getTransactions } from '@/lib/api';
 import { toast } from 'sonner';
 
 interface Transaction {
@@ -18,6 +18,22 @@ interface Transaction {
   currency: string;
 }
 
+const byDateDesc = (a: Transaction, b: Transaction) =>
+  (b.transaction_date || '').localeCompare(a.transaction_date || '') || b.id - a.id;
+
+const applyTransactionChanges = (
+  current: Transaction[],
+  changed: Transaction[],
+  deleted: number[]
+): Transaction[] => {
+  if (changed.length === 0 && deleted.length === 0) {
+    return current;
+  }
+  const removed = new Set<number>(deleted);
+  changed.forEach(t => removed.add(t.id));
+  return current.filter(t => !removed.has(t.id)).concat(changed).sort(byDateDesc);
+};
+
 export const useDashboardData = (
   dateFilter: 'today' | 'week' | 'month' | 'quarter' | 'year' | 'all' | 'custom',
   customDateRange: { start: string; end: string },
@@ -25,6 +41,9 @@ export const useDashboardData = (
   isAuthenticated: boolean
 ) => {
   const [transactions, setTransactions] = useState<Transaction[]>([]);
+  const syncCursor = useRef<string | null>(null);
+  // Keyset cursor of the rows older than the loaded ones; null once the whole history is loaded
+  const [olderCursor, setOlderCursor] = useState<string | null>(null);
   const [stats, setStats] = useState({
     total_revenue: 0,
     total_costs: 0,
@@ -42,9 +61,10 @@ export const useDashboardData = (
       const startDate = dateFilter === 'custom' ? customDateRange.start : undefined;
       const endDate = dateFilter === 'custom' ? customDateRange.end : undefined;
       
-      const [statsResult, transactionsResult] = await Promise.all([
+      const since = syncCursor.current;
+      const [statsResult, changesResult] = await Promise.all([
         getStats(dateFilter, startDate, endDate, exchangeRate),
-        getTransactions(),
+        getTransactionChanges(since ?? ''),
       ]);
       
       setStats(prevStats => {
@@ -54,18 +74,33 @@ export const useDashboardData = (
         return statsResult;
       });
       
-      setTransactions(prevTrans => {
-        const newTrans = transactionsResult.transactions || [];
-        if (JSON.stringify(prevTrans) === JSON.stringify(newTrans)) {
-          return prevTrans;
-        }
-        return newTrans;
-      });
+      const fullSync = since === null || changesResult.resync;
+      setTransactions(prevTrans => applyTransactionChanges(
+        fullSync ? [] : prevTrans,
+        changesResult.transactions || [],
+        changesResult.deleted || []
+      ));
+      if (fullSync) {
+        setOlderCursor(changesResult.older_cursor);
+      }
+      syncCursor.current = changesResult.next_cursor ?? null;
     } catch (error) {
       toast.error('Ошибка загрузки данных');
     }
   }, [dateFilter, customDateRange, exchangeRate]);
 
+  // Older history is fetched only on request; later deltas keep updating these rows too
+  const loadOlderTransactions = useCallback(async () => {
+    if (!olderCursor) return;
+    try {
+      const page = await getTransactions(olderCursor);
+      setTransactions(prevTrans => applyTransactionChanges(prevTrans, page.transactions || [], []));
+      setOlderCursor(page.next_cursor ?? null);
+    } catch (error) {
+      toast.error('Ошибка загрузки данных');
+    }
+  }, [olderCursor]);
+
   useEffect(() => {
     if (!isAuthenticated) return;
     
@@ -83,5 +118,5 @@ export const useDashboardData = (
     };
   }, [isAuthenticated, loadData]);
 
-  return { transactions, stats, loadData };
+  return { transactions, stats, loadData, loadOlderTransactions, hasOlderTransactions: olderCursor !== null };
 };
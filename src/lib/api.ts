@@ -58,11 +58,62 @@ export const deleteProduct = async (id: number) => {
   return response.json();
 };
 
-export const getTransactions = async () => {
-  const response = await fetch(API_URLS.transactions);
+export const getTransactions = async (cursor?: string, pageSize: number = 1000) => {
+  let url = `${API_URLS.transactions}?page_size=${pageSize}`;
+  if (cursor) url += `&cursor=${encodeURIComponent(cursor)}`;
+  
+  const response = await fetch(url);
   return response.json();
 };
 
+export const getTransactionChanges = async (since: string = ''): Promise<{
+  transactions: any[];
+  deleted: number[];
+  next_cursor: string;
+  older_cursor: string | null;
+  resync: boolean;
+}> => {
+  const transactions: any[] = [];
+  let deleted: number[] = [];
+  let cursor = since;
+  let page;
+  // An empty since is the first sync: the latest page, with older_cursor for getTransactions.
+  // A large delta comes in pages: follow next_cursor while has_more
+  do {
+    const response = await fetch(`${API_URLS.transactions}?since=${encodeURIComponent(cursor)}`);
+    if (response.status === 410 && since) {
+      // The cursor is older than the server keeps deletions for: start over from the latest page
+      return { ...(await getTransactionChanges('')), resync: true };
+    }
+    page = await response.json();
+    transactions.push(...(page.transactions || []));
+    deleted = deleted.concat(page.deleted || []);
+    cursor = page.next_cursor;
+  } while (page.has_more && cursor);
+  return { transactions, deleted, next_cursor: page.next_cursor, older_cursor: page.older_cursor ?? null, resync: false };
+};
+
+export const exportTransactions = async (
+  format: 'csv' | 'ndjson' = 'csv',
+  filters: { date_from?: string; date_to?: string; status?: string; product_id?: number; currency?: string } = {}
+) => {
+  const parts: string[] = [];
+  let afterId: string | null = null;
+  do {
+    const params = new URLSearchParams({ action: 'export', format });
+    Object.entries(filters).forEach(([key, value]) => {
+      if (value !== undefined && value !== '') params.set(key, String(value));
+    });
+    if (afterId) params.set('after_id', afterId);
+    const response = await fetch(`${API_URLS.transactions}?${params}`);
+    const text = await response.text();
+    // every page repeats the CSV header line
+    parts.push(format === 'csv' && parts.length > 0 ? text.slice(text.indexOf('\n') + 1) : text);
+    afterId = response.headers.get('X-Next-After-Id');
+  } while (afterId);
+  return new Blob(parts, { type: format === 'csv' ? 'text/csv' : 'application/x-ndjson' });
+};
+
 export const getStats = async (dateFilter?: string, startDate?: string, endDate?: string, exchangeRate?: number) => {
   let url = `${API_URLS.transactions}?action=stats`;
   if (dateFilter) url += `&date_filter=${dateFilter}`;
@@ -93,6 +144,15 @@ export const createTransaction = async (data: {
   return response.json();
 };
 
+export const importTransactions = async (payload: { transactions: Array<Record<string, unknown>> } | { csv: string }) => {
+  const response = await fetch(API_URLS.transactions, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ action: 'import', ...payload }),
+  });
+  return response.json();
+};
+
 export const updateTransaction = async (data: {
   id: number;
   product_id: number;